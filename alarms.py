@@ -0,0 +1,286 @@
+# Alarm rules from config (a json list in LOCAL_DATA_PATH/alarm_rules.json, see
+# recorder.rules_options; DEFAULT_RULES without it), evaluated on every sample, for the operators:
+#   {"name": "high_wind", "when": "speed > 15", "for": 30, "clear": "speed < 13", "severity": "warning"}
+#   {"name": "humid", "when": "humidity > 95 and temperature > 0"}
+#   {"name": "no_data", "when": "no data", "for": 10, "severity": "critical"}
+#   {"name": "gps_moved", "when": "gps_height changed", "by": 5, "hold": 600}
+# when:   comparisons "<channel> <op> <number>" joined by "and", op: > >= < <= == !=
+#         "no data": no valid frame for `for` seconds (checked every second, not per sample)
+#         "<channel> changed": the value moved by more than `by` from the previous sample
+# for:    s, the condition must hold that long before the alarm is raised (default 0)
+# clear:  condition that clears the alarm (default: when no longer true); changed: after `hold` s
+# Rules are compiled once: every distinct comparison becomes a column, a batch of samples
+# is compared against all columns with one numpy call per operator, a rule is the "all"
+# of its columns, gathered by an index table (rules x terms). No Python loop over rules.
+# State changes go to the log, status() (GUI, dashboard) and the metrics endpoint.
+
+import json
+import re
+import threading
+import time
+
+import numpy as np
+
+# customized files
+import logs
+
+SEVERITIES = ("info", "warning", "critical")
+STALE_CHECK = 1.0  # s, how often "no data" rules are checked
+RULES_FILE = "alarm_rules.json"  # in the local data path, replaces DEFAULT_RULES
+OPS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal, "==": np.equal,
+       "!=": np.not_equal}
+TERM = re.compile(r"^\s*([A-Za-z_][\w%/]*)\s*(>=|<=|==|!=|>|<)\s*([-+0-9.eE]+)\s*$")
+
+DEFAULT_RULES = [
+    {"name": "high_wind", "when": "speed > 15", "for": 30, "clear": "speed < 13", "severity": "warning"},
+    {"name": "no_data", "when": "no data", "for": 10, "severity": "critical"},
+    {"name": "gps_height_changed", "when": "gps_height changed", "by": 5, "hold": 600, "severity": "info"},
+    {"name": "humidity_high", "when": "humidity > 95", "for": 60, "clear": "humidity < 93", "severity": "info"},
+]
+
+log = logs.get_logger(__name__)
+
+
+def load_rules(path):
+    """Rules from a json file: a list of rule dicts."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_terms(text, names):
+    """[(channel index, op, value)] of "speed > 15 and humidity < 90"."""
+    terms = []
+    for part in re.split(r"\s+and\s+", text.strip()):
+        m = TERM.match(part)
+        if m is None:
+            raise ValueError("cannot parse condition %r" % part)
+        channel, op, value = m.groups()
+        if channel not in names:
+            raise KeyError(channel)
+        terms.append((names.index(channel), op, float(value)))
+    return terms
+
+
+class AlarmEngine(object):
+    """
+    update(epoch, values): a batch, epoch (n,) and values (n, len(names)), rows in time order.
+    check(): time based rules, called by the watchdog thread started by start().
+    Rules on channels this recorder does not have are left out (one config for all models).
+    """
+    def __init__(self, rules, names):
+        self.names = list(names)
+        self.lock = threading.Lock()
+        self.rules = []  # configs of the compiled rules, same order as the state arrays
+        terms = {}  # (channel, op, value) -> column
+        when, changed, stale = [], [], []
+        for config in rules:
+            config = dict(config)
+            config.setdefault("severity", "warning")
+            if config["severity"] not in SEVERITIES:
+                raise ValueError("alarm %s: severity is one of %s" % (config["name"], ", ".join(SEVERITIES)))
+            text = config["when"].strip()
+            try:
+                if text == "no data":
+                    stale.append((len(self.rules), float(config.get("for", 10))))
+                elif text.endswith(" changed"):
+                    channel = text[:-len(" changed")].strip()
+                    if channel not in self.names:
+                        raise KeyError(channel)
+                    changed.append((len(self.rules), self.names.index(channel), float(config.get("by", 0)),
+                                    float(config.get("hold", 60))))
+                else:
+                    w = [terms.setdefault(t, len(terms)) for t in parse_terms(text, self.names)]
+                    c = [terms.setdefault(t, len(terms)) for t in parse_terms(config["clear"], self.names)] \
+                        if config.get("clear") else None
+                    when.append((len(self.rules), w, c, float(config.get("for", 0))))
+            except KeyError as e:
+                log.info("alarm %s: no channel %s here, ignored", config["name"], e)
+                continue
+            self.rules.append(config)
+
+        # comparison columns, grouped by operator
+        self.terms = sorted(terms, key=terms.get)
+        self.by_op = []
+        for op, func in OPS.items():
+            cols = [k for k, t in enumerate(self.terms) if t[1] == op]
+            if cols:
+                self.by_op.append((func, np.array(cols),
+                                   np.array([self.terms[k][0] for k in cols]),
+                                   np.array([self.terms[k][2] for k in cols])))
+
+        # condition rules: all of their columns; the column after the last term is always true (padding)
+        true = len(self.terms)
+        self.w_rule = np.array([x[0] for x in when], dtype=int)
+        self.w_for = np.array([x[3] for x in when], dtype=float)
+        self.w_index = self.index_table([x[1] for x in when], true)
+        self.c_explicit = np.array([x[2] is not None for x in when], dtype=bool)
+        self.c_index = self.index_table([x[2] or [] for x in when], true)
+        self.w_channel = np.array([self.terms[w[0]][0] for i, w, c, f in when], dtype=int)
+        self.since = np.full(len(when), np.nan)  # start of the current run of the condition
+
+        self.ch_rule = np.array([x[0] for x in changed], dtype=int)
+        self.ch_channel = np.array([x[1] for x in changed], dtype=int)
+        self.ch_by = np.array([x[2] for x in changed], dtype=float)
+        self.ch_hold = np.array([x[3] for x in changed], dtype=float)
+        self.ch_last = np.full(len(changed), np.nan)  # previous value
+        self.ch_time = np.full(len(changed), np.nan)  # last change
+
+        self.stale = stale
+        self.last_update = None  # time.monotonic() of the last batch
+
+        r = len(self.rules)
+        self.active = np.zeros(r, dtype=bool)
+        self.active_since = np.full(r, np.nan)
+        self.value = np.full(r, np.nan)
+        self.raised = np.zeros(r, dtype=np.int64)
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @staticmethod
+    def index_table(columns, pad):
+        """(rules, most terms) table of term columns, short rows padded with pad."""
+        k = max([len(c) for c in columns] + [1])
+        table = np.full((len(columns), k), pad, dtype=np.intp)
+        for j, c in enumerate(columns):
+            table[j, :len(c)] = c
+        return table
+
+    def conditions(self, values):
+        """(n, terms + 1) of every comparison column, and the always true column."""
+        cond = np.ones((len(values), len(self.terms) + 1), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            for func, cols, channels, thresholds in self.by_op:
+                cond[:, cols] = func(values[:, channels], thresholds)  # nan: False
+        return cond
+
+    def update(self, epoch, values):
+        """
+        State changes are found sample by sample, in time order: a batch gives the same
+        alarms (raised, cleared, raised again) as the same samples one at a time.
+        """
+        epoch = np.asarray(epoch, dtype=float)
+        values = np.asarray(values, dtype=float).reshape(len(epoch), len(self.names))
+        if not len(epoch):
+            return
+        n = len(epoch)
+        rows = np.arange(n)
+        events = []  # (sample, rule, raised, value)
+        value = self.value.copy()
+
+        if len(self.w_rule):
+            cond = self.conditions(values)
+            hit = cond[:, self.w_index].all(axis=2)  # (n, rules)
+            if self.c_explicit.any():
+                clear = np.where(self.c_explicit, cond[:, self.c_index].all(axis=2), ~hit)
+            else:
+                clear = ~hit
+            # start of the run of the condition at every sample, the run before the batch carries on
+            last_miss = np.maximum.accumulate(np.where(hit, -1, rows[:, None]), axis=0)
+            carry = np.where(np.isnan(self.since), epoch[0], self.since)
+            since = np.where(last_miss < 0, carry, epoch[np.minimum(last_miss + 1, n - 1)])
+            since = np.where(hit, since, np.nan)
+            with np.errstate(invalid="ignore"):
+                ready = epoch[:, None] - since >= self.w_for  # nan: False
+            self.since = since[-1]
+            # walk the transitions: first ready sample of an idle rule, first clear sample after it, ...
+            active = self.active[self.w_rule].copy()
+            pos = np.zeros(len(self.w_rule), dtype=int)
+            todo = np.arange(len(self.w_rule))
+            while len(todo):
+                mask = np.where(active[todo], clear[:, todo], ready[:, todo]) & (rows[:, None] >= pos[todo])
+                found = mask.any(axis=0)
+                todo = todo[found]
+                k = np.argmax(mask[:, found], axis=0)
+                for j, i in zip(todo.tolist(), k.tolist()):
+                    events.append((i, self.w_rule[j], not active[j], values[i, self.w_channel[j]]))
+                active[todo] = ~active[todo]
+                pos[todo] = k + 1
+            value[self.w_rule] = values[-1, self.w_channel]
+
+        if len(self.ch_rule):
+            x = values[:, self.ch_channel]
+            # compared with the last finite value: a row that failed to parse does not hide a change
+            ok = ~np.isnan(x)
+            last_ok = np.maximum.accumulate(np.where(ok, rows[:, None], -1), axis=0)
+            filled = np.where(last_ok < 0, self.ch_last, x[np.maximum(last_ok, 0), np.arange(x.shape[1])])
+            prev = np.vstack([self.ch_last[None, :], filled[:-1]])
+            with np.errstate(invalid="ignore"):
+                moved = np.abs(x - prev) > self.ch_by  # nan: False
+            # time of the last change at every sample
+            last_moved = np.maximum.accumulate(np.where(moved, rows[:, None], -1), axis=0)
+            ch_time = np.where(last_moved < 0, self.ch_time, epoch[np.maximum(last_moved, 0)])
+            with np.errstate(invalid="ignore"):
+                on = epoch[:, None] - ch_time < self.ch_hold  # nan: False
+            flip = on != np.vstack([self.active[self.ch_rule][None, :], on[:-1]])
+            for i, j in zip(*np.nonzero(flip)):
+                events.append((i, self.ch_rule[j], bool(on[i, j]), x[i, j]))
+            self.ch_time = ch_time[-1]
+            self.ch_last = filled[-1]
+            value[self.ch_rule] = self.ch_last
+
+        events.sort(key=lambda e: (e[0], e[1]))
+        with self.lock:
+            self.last_update = time.monotonic()
+            for k, i, raised, v in events:
+                self.change(i, raised, v, epoch[k])
+            for i, t in self.stale:
+                if self.active[i]:
+                    self.change(i, False, value[i], epoch[-1])
+            self.value = value
+
+    def check(self):
+        """no data rules"""
+        if not self.stale:
+            return
+        with self.lock:
+            idle = time.monotonic() - self.last_update if self.last_update is not None else 0.0
+            now = time.time()
+            for i, seconds in self.stale:
+                self.value[i] = idle
+                if self.active[i] != (idle >= seconds):
+                    self.change(i, idle >= seconds, idle, now)
+
+    def change(self, i, raised, value, now):
+        """State change of rule i: log it, count the raised alarms."""
+        config = self.rules[i]
+        self.active[i] = raised
+        if raised:
+            self.raised[i] += 1
+            self.active_since[i] = now
+            level = log.warning if config["severity"] != "info" else log.info
+            level("ALARM %s (%s): %s, value %.4g", config["name"], config["severity"], config["when"], value)
+        else:
+            log.info("alarm cleared: %s, value %.4g", config["name"], value)
+            self.active_since[i] = np.nan
+
+    def start(self):
+        """Watchdog thread of the no data rules."""
+        self.last_update = time.monotonic()
+        if self.stale and self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name="alarms", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(STALE_CHECK):
+            self.check()
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(2)
+            self.thread = None
+
+    def states(self):
+        """[(name, severity, active, raised count)] of all rules, for the metrics endpoint."""
+        with self.lock:
+            return [(c["name"], c["severity"], bool(self.active[i]), int(self.raised[i]))
+                    for i, c in enumerate(self.rules)]
+
+    def status(self):
+        """Active alarms, json-able, for status() and the GUI."""
+        with self.lock:
+            active = [{"name": self.rules[i]["name"], "severity": self.rules[i]["severity"],
+                       "when": self.rules[i]["when"], "since": float(self.active_since[i]),
+                       "value": float(self.value[i])} for i in np.nonzero(self.active)[0]]
+            return {"rules": len(self.rules), "active": active, "raised_total": int(self.raised.sum())}
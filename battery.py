@@ -0,0 +1,153 @@
+# Battery alert: a state machine instead of a warning line on every low sample.
+# "ok" -> "low" when the voltage stays below voltage_min for DEBOUNCE seconds,
+# "low" -> "ok" when it stays above voltage_min + HYSTERESIS for DEBOUNCE seconds.
+# One notification per state change, a reminder every REMINDER_INTERVAL while low.
+# Notifications are written by a background thread, a slow R drive never blocks recording.
+
+import queue
+import threading
+import time
+
+# customized files
+import logs
+
+HYSTERESIS = 0.2  # V
+DEBOUNCE = 60  # s
+REMINDER_INTERVAL = 3600  # s
+NOTIFY_QUEUE = 100  # notifications waiting to be written, more are dropped
+
+log = logs.get_logger(__name__)
+
+
+class Notifier(object):
+    """Append notification lines to a file (battery_warning.txt on R drive) in a background thread."""
+    def __init__(self, path=None):
+        self.path = path  # None: log only
+        self.q = queue.Queue(NOTIFY_QUEUE)
+        self.dropped = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self.run, name="notifier", daemon=True)
+        self.thread.start()
+
+    def send(self, x):
+        log.warning(x)
+        try:
+            self.q.put_nowait(x)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            x = self.q.get()
+            if x is None:
+                break
+            if self.path is None:
+                continue
+            try:
+                with open(self.path, "a") as f:
+                    f.write(x + "\n")
+            except OSError:
+                self.failed += 1
+
+    def close(self, timeout=2):
+        try:
+            self.q.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+
+
+class BatteryAlert(object):
+    """
+    update(epoch, v) for every sample, O(1) and no I/O: returns the notification
+    text on a state change or reminder, else None.
+    hour_summary() for the QA sidecar of the hour file.
+    """
+    def __init__(self, voltage_min, hysteresis=HYSTERESIS, debounce=DEBOUNCE,
+                 reminder_interval=REMINDER_INTERVAL):
+        self.voltage_min = voltage_min
+        self.voltage_ok = voltage_min + hysteresis
+        self.debounce = debounce
+        self.reminder_interval = reminder_interval
+
+        self.state = "ok"
+        self.since = None  # epoch of the last state change
+        self.pending = None  # epoch the voltage first crossed the threshold of the other state
+        self.last_notice = None
+        self.last_v = float("nan")
+        self.lock = threading.Lock()  # hour stats: update and hour_summary run in different threads
+        self.reset_hour()
+
+    def reset_hour(self):
+        self.n = 0
+        self.v_min = float("inf")
+        self.v_max = float("-inf")
+        self.v_sum = 0.0
+        self.nan = 0  # I2C errors
+        self.low_seconds = 0.0
+        self.changes = []  # [epoch, new state]
+        self.notices = 0
+        self.t_prev = None
+
+    def update(self, epoch, v):
+        with self.lock:
+            return self._update(epoch, v)
+
+    def _update(self, epoch, v):
+        if self.t_prev is not None and self.state == "low":
+            self.low_seconds += max(epoch - self.t_prev, 0)
+        self.t_prev = epoch
+        if v != v:  # nan: I2C error, no decision
+            self.nan += 1
+            return None
+        self.last_v = v
+        self.n += 1
+        self.v_sum += v
+        self.v_min = min(self.v_min, v)
+        self.v_max = max(self.v_max, v)
+
+        crossed = v < self.voltage_min if self.state == "ok" else v > self.voltage_ok
+        if not crossed:
+            self.pending = None
+        elif self.pending is None:
+            self.pending = epoch
+        if self.pending is not None and epoch - self.pending >= self.debounce:
+            self.state = "low" if self.state == "ok" else "ok"
+            self.since = epoch
+            self.pending = None
+            self.changes.append([epoch, self.state])
+            return self.notice(epoch, v)
+
+        if (self.state == "low" and self.last_notice is not None and
+                epoch - self.last_notice >= self.reminder_interval):
+            return self.notice(epoch, v, reminder=True)
+        return None
+
+    def notice(self, epoch, v, reminder=False):
+        self.last_notice = epoch
+        self.notices += 1
+        if self.state == "low":
+            return "! Warning, battery is dead: %s V, %s%s" % (
+                v, time.ctime(epoch), " (still low since %s)" % time.ctime(self.since) if reminder else "")
+        return "* Battery recovered: %s V, %s" % (v, time.ctime(epoch))
+
+    def status(self):
+        return {"state": self.state, "since": self.since, "voltage": self.last_v}
+
+    def hour_summary(self, reset=True):
+        with self.lock:
+            x = {
+                "state": self.state,
+                "voltage_min_setting": self.voltage_min,
+                "samples": self.n,
+                "v_min": self.v_min if self.n else None,
+                "v_max": self.v_max if self.n else None,
+                "v_mean": self.v_sum / self.n if self.n else None,
+                "read_errors": self.nan,
+                "low_seconds": self.low_seconds,
+                "changes": self.changes,
+                "notifications": self.notices,
+            }
+            if reset:
+                self.reset_hour()
+        return x
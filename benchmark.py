@@ -0,0 +1,331 @@
+# Benchmarks of the acquisition and display hot paths, to know the CPU headroom of the Pi
+# and to catch regressions between versions.
+# $ python benchmark.py                          all, results saved in bench_results/
+# $ python benchmark.py --quick --only parse,plot
+# $ python benchmark.py --compare bench_results/20241031_140000_raspi.json
+
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib import pyplot as plt
+
+# customized files
+import frames
+import plots
+import simulator
+import staging
+import derive
+from derive import wind_uv_to_dir
+import qa
+from recorder import GMX500Recorder, WindSonicRecorder, PARSE_BATCH
+from shm_ring import SharedRing, read_latest
+from storage import HourlyStorage
+
+RESULTS_FOLDER = "bench_results"  # in the current folder, ignored by git
+# plot windows: (minutes, data rate Hz)
+WINDOWS = [(10, 4), (10, 32), (60, 4), (60, 32)]
+
+
+def measure(fn, repeat, samples=1, warmup=3):
+    """
+    Run fn() repeat times, return latency percentiles (ms) and samples/s,
+    samples: number of samples handled by one call.
+    """
+    for i in range(min(warmup, repeat)):
+        fn()
+    t = np.empty(repeat)
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        t[i] = time.perf_counter() - t0
+    return {
+        "repeat": repeat,
+        "samples": samples,
+        "p50_ms": 1000 * float(np.percentile(t, 50)),
+        "p90_ms": 1000 * float(np.percentile(t, 90)),
+        "p99_ms": 1000 * float(np.percentile(t, 99)),
+        "max_ms": 1000 * float(t.max()),
+        "samples_per_s": samples * repeat / float(t.sum()),
+    }
+
+
+def make_frames(model, n):
+    wind = simulator.Wind()
+    make = simulator.FRAMES[model]
+    t = time.time()
+    return [make(wind, t + i) for i in range(n)]
+
+
+def window_data(n):
+    # corrected direction, corrected speed like the GMX500 plot buffer
+    wind = simulator.Wind()
+    x = np.array([wind.step() for i in range(n)])
+    return x[:, 3], x[:, 2], x[:, 0], x[:, 1]  # direction, speed, u, v
+
+
+def bench_parse(quick):
+    n = 2000 if quick else 20000
+    results = {}
+    lines = iter(make_frames("gmx500", n + 10) * 2)
+    results["parse_gmx500"] = measure(lambda: frames.parse_gmx500(next(lines)), n)
+    lines = iter(make_frames("windsonic", n + 10) * 2)
+    results["parse_windsonic"] = measure(lambda: frames.parse_windsonic(next(lines)), n)
+
+    # the parse stage itself: Recorder.parse_batch(), parse + derive of a batch, as in the pipeline
+    folder = tempfile.mkdtemp()
+    shm_name = "windpi_bench_%s" % os.getpid()
+    recorders = [("gmx500", GMX500Recorder(None, folder, local_data_path=folder, shm_name=shm_name,
+                                           ina219=simulator.FakeINA219())),
+                 ("windsonic", WindSonicRecorder(None, folder, local_data_path=folder, shm_name=shm_name + "_ws"))]
+    try:
+        for model, rec in recorders:
+            rec.qa = qa.GapDetector(rec.rate)
+            t = time.time()
+            x = [(t + i, line.encode(), 12.5) if model == "gmx500" else (t + i, line.encode())
+                 for i, line in enumerate(make_frames(model, n))]
+            for size in (1, PARSE_BATCH):
+                batches = iter([x[k:k + size] for k in range(0, n - size + 1, size)] * 2)
+                results["parse_batch_%s_%s" % (model, size)] = measure(
+                    lambda: rec.parse_batch(next(batches)), n // size, size)
+    finally:
+        for model, rec in recorders:
+            rec.close()
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def bench_write(quick, folder):
+    n = 2000 if quick else 20000
+    results = {}
+    fields = frames.parse_gmx500(make_frames("gmx500", 1)[0])
+    epoch = time.time()
+    results["format_gmx500"] = measure(
+        lambda: frames.format_gmx500(epoch, frames.clock_gmx500(epoch), fields, 12.5), n)
+
+    row = frames.format_gmx500(epoch, frames.clock_gmx500(epoch), fields, 12.5)
+    f = staging.StagedFile(os.path.join(folder, "direct.csv"), frames.HEADER_GMX500)
+    results["write_direct"] = measure(lambda: f.write(row), n)
+    f.close()
+    f = staging.StagedFile(os.path.join(folder, "staged.csv"), frames.HEADER_GMX500,
+                           os.path.join(folder, "tmpfs"), flush_interval=1e9)
+    results["write_staged"] = measure(lambda: f.write(row), n)
+    f.close()
+    return results
+
+
+def bench_rotation(quick, folder):
+    results = {}
+    for minutes, rate in WINDOWS[-1:] if quick else [(60, 1), (60, 4), (60, 32)]:
+        rows = minutes * 60 * rate
+        data_folder = os.path.join(folder, "data_%s" % rate)
+        os.mkdir(data_folder)
+        os.mkdir(os.path.join(folder, "r_%s" % rate))
+        storage = HourlyStorage(data_folder, os.path.join(folder, "r_%s" % rate),
+                                frames.HEADER_GMX500, os.path.join(folder, "tmpfs"))
+        fields = frames.parse_gmx500(make_frames("gmx500", 1)[0])
+        row = frames.format_gmx500(0, "", fields, 12.5)
+        hour = [0]
+
+        def rotate():
+            for i in range(rows):
+                storage.local_file.write(row)
+            hour[0] += 1
+            t0 = time.perf_counter()
+            storage.rotate("20240101_%02d" % (hour[0] % 24))
+            return time.perf_counter() - t0
+
+        t = np.array([rotate() for i in range(3 if quick else 10)])
+        storage.close()
+        results["rotation_%sh_%shz" % (minutes // 60, rate)] = {
+            "repeat": len(t),
+            "samples": rows,
+            "p50_ms": 1000 * float(np.percentile(t, 50)),
+            "p90_ms": 1000 * float(np.percentile(t, 90)),
+            "p99_ms": 1000 * float(np.percentile(t, 99)),
+            "max_ms": 1000 * float(t.max()),
+            "samples_per_s": rows * len(t) / float(t.sum()),
+        }
+    return results
+
+
+def bench_handoff(quick, folder):
+    results = {}
+    temp_file = os.path.join(folder, "tempwind.csv")
+    for minutes, rate in WINDOWS:
+        n = minutes * 60 * rate
+        wind_dir, wind_speed, u, v = window_data(n)
+        rows = np.column_stack([wind_dir, wind_speed]).tolist()
+        name = "%smin_%shz" % (minutes, rate)
+
+        # old: csv.writer on every sample + np.genfromtxt on every GUI refresh
+        def temp_write():
+            with open(temp_file, 'w', newline='') as f:
+                write = csv.writer(f)
+                write.writerows(rows)
+
+        def temp_read():
+            np.genfromtxt(temp_file, delimiter=',')
+
+        repeat = 3 if quick else 10
+        results["tempfile_write_" + name] = measure(temp_write, repeat, n)
+        results["tempfile_read_" + name] = measure(temp_read, repeat, n)
+
+        # new: shared memory ring
+        ring = SharedRing.create("windpi_bench", 2, n)
+        for row in rows:
+            ring.append(row)
+        row = rows[-1]
+        results["shm_append_" + name] = measure(lambda: ring.append(row), 1000)
+        results["shm_read_" + name] = measure(lambda: read_latest("windpi_bench", n), repeat, n)
+        ring.unlink()
+    return results
+
+
+def bench_direction(quick):
+    results = {}
+    n = 2000 if quick else 20000
+    wind_dir, wind_speed, u, v = window_data(n)
+    uu = iter(list(u) * 2)
+    vv = iter(list(v) * 2)
+    results["wind_uv_to_dir_scalar"] = measure(lambda: wind_uv_to_dir(float(next(uu)), float(next(vv))), n)
+    uu = iter(u.tolist() * 2)
+    vv = iter(v.tolist() * 2)
+    results["wind_uv_to_dir_math"] = measure(lambda: derive.wind_uv_to_dir_scalar(next(uu), next(vv)), n)
+    # parse stage batch: speed and direction of PARSE_BATCH frames at once
+    batch = np.array([u[:64], v[:64]])
+    results["derive_batch_64"] = measure(
+        lambda: (derive.wind_speed(batch[0], batch[1]).tolist(), wind_uv_to_dir(batch[0], batch[1]).tolist()),
+        n // 64, 64)
+    for minutes, rate in WINDOWS:
+        m = minutes * 60 * rate
+        wind_dir, wind_speed, u, v = window_data(m)
+        results["wind_uv_to_dir_array_%smin_%shz" % (minutes, rate)] = measure(
+            lambda: wind_uv_to_dir(u, v), 3 if quick else 20, m)
+    return results
+
+
+def bench_plot(quick):
+    results = {}
+    figure = plt.figure()
+    repeat = 2 if quick else 5
+    for minutes, rate in WINDOWS[:2] if quick else WINDOWS:
+        n = minutes * 60 * rate
+        wind_dir, wind_speed, u, v = window_data(n)
+        epoch_time = time.time() + np.arange(n) / rate
+        name = "%smin_%shz" % (minutes, rate)
+
+        def windrose():
+            plots.draw_windrose(figure, wind_dir, wind_speed)
+            figure.canvas.draw()
+
+        def series():
+            plots.draw_wind_series(figure, epoch_time, u, v, wind_speed, rate)
+            figure.canvas.draw()
+
+        results["plot_wind_" + name] = measure(windrose, repeat, n, warmup=1)
+        results["plot_series_" + name] = measure(series, repeat, n, warmup=1)
+
+    # battery plot: 24 h, one point every 15 min
+    epoch_time = time.time() + np.arange(96) * 900
+    v = 12.5 + np.random.normal(0, 0.05, 96)
+
+    def voltage():
+        plots.draw_voltage(figure, epoch_time, v)
+        figure.canvas.draw()
+
+    results["plot_v_24h"] = measure(voltage, repeat * 2, 96, warmup=1)
+    plt.close(figure)
+    return results
+
+
+BENCHMARKS = {
+    "parse": bench_parse,
+    "write": bench_write,
+    "rotation": bench_rotation,
+    "handoff": bench_handoff,
+    "direction": bench_direction,
+    "plot": bench_plot,
+}
+
+
+def version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def print_results(results, previous=None):
+    print("%-36s %10s %10s %10s %10s %14s" % ("benchmark", "p50 ms", "p90 ms", "p99 ms", "max ms", "samples/s"))
+    for name, r in results.items():
+        x = "%-36s %10.4f %10.4f %10.4f %10.4f %14.0f" % (
+            name, r["p50_ms"], r["p90_ms"], r["p99_ms"], r["max_ms"], r["samples_per_s"])
+        if previous and name in previous:
+            ratio = r["p50_ms"] / max(previous[name]["p50_ms"], 1e-9)
+            x += "  %5.2fx%s" % (ratio, "  <- slower" if ratio > 1.2 else "")
+        print(x)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WindPi hot path benchmarks")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma separated: %s" % ",".join(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="fewer repeats and window sizes")
+    parser.add_argument("--compare", default=None, help="results json to compare with, default: latest saved")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="windpi_bench_")
+    results = {}
+    try:
+        for name in args.only.split(","):
+            print("running: %s" % name)
+            fn = BENCHMARKS[name]
+            if name in ("write", "rotation", "handoff"):
+                results.update(fn(args.quick, folder))
+            else:
+                results.update(fn(args.quick))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    previous = None
+    compare = args.compare
+    if compare is None:
+        saved = sorted(glob.glob(os.path.join(RESULTS_FOLDER, "*.json")))
+        compare = saved[-1] if saved else None
+    if compare:
+        with open(compare) as f:
+            previous = json.load(f)["results"]
+        print("compared with: %s" % compare)
+    print_results(results, previous)
+
+    if not args.no_save:
+        if not os.path.isdir(RESULTS_FOLDER):
+            os.mkdir(RESULTS_FOLDER)
+        path = os.path.join(RESULTS_FOLDER, "%s_%s.json" % (time.strftime("%Y%m%d_%H%M%S"), platform.node()))
+        with open(path, "w") as f:
+            json.dump({
+                "version": version(),
+                "host": platform.node(),
+                "machine": platform.machine(),
+                "python": platform.python_version(),
+                "time": time.time(),
+                "quick": args.quick,
+                "results": results,
+            }, f, indent=1)
+        print("saved: %s" % path)
+
+
+if __name__ == "__main__":
+    main()
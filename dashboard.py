@@ -0,0 +1,259 @@
+# Full screen terminal dashboard of the GMX500 recorder, for SSH sessions.
+# Reads the shared memory ring written by the recorder (nothing is parsed twice),
+# redraws at most once a second: current and averaged wind, P/T/RH, GPS fix,
+# battery trend, sample rate, frame counters, upload backlog and a text wind rose.
+# In GMX500.py: DASHBOARD = 1.   Next to the recorder service:
+# $ python dashboard.py
+
+import curses
+import time
+
+import numpy as np
+
+# customized files
+from recorder import SHM_GMX500, SHM_GMX500_V
+from shm_ring import SharedRing, GMX500_COLUMNS
+import windstats
+
+REFRESH = 1.0  # s, redraw at most this often
+KEY_POLL = 0.1  # s, keyboard wait between redraws
+AVERAGE_WINDOWS = [60, 600]  # s
+ROSE_WINDOW = 600  # s, wind rose of the last 10 min
+SECTORS = 16
+CALM = 0.5  # m/s, not counted in the wind rose
+BATTERY_POINTS = 48  # battery sparkline, one point every interval_v (15 min: 12 h)
+EVENTS = 6  # recent log lines at the bottom
+
+# windstats keys shown per averaging window
+ROWS = [("u", "u m/s"), ("v", "v m/s"), ("speed", "speed m/s"), ("vector_speed", "vector speed m/s"),
+        ("direction", "vector direction deg"), ("steadiness", "steadiness"), ("sigma_theta", "sigma theta deg"),
+        ("gust", "gust m/s"), ("gust_factor", "gust factor"), ("turbulence_intensity", "turbulence int.")]
+
+SECTOR_NAMES = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
+                "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
+SPARK = " .:-=+*#"
+
+COL = {name: i for i, name in enumerate(GMX500_COLUMNS)}
+
+
+def windrose_lines(direction, speed, width=40):
+    """One text line per sector: bar, frequency and mean speed."""
+    ok = np.isfinite(direction) & np.isfinite(speed)
+    calm = int(np.count_nonzero(ok & (speed < CALM)))
+    ok &= speed >= CALM
+    sector = ((direction[ok] + 180.0 / SECTORS) % 360 // (360.0 / SECTORS)).astype(int)
+    counts = np.bincount(sector, minlength=SECTORS)
+    sums = np.bincount(sector, weights=speed[ok], minlength=SECTORS)
+    total = max(int(counts.sum()) + calm, 1)
+    top = max(int(counts.max()), 1)
+    lines = []
+    for i in range(SECTORS):
+        bar = "#" * int(round(width * counts[i] / top))
+        mean = sums[i] / counts[i] if counts[i] else 0.0
+        lines.append("%-4s%-*s %5.1f%% %5.1f m/s" % (SECTOR_NAMES[i], width, bar, 100.0 * counts[i] / total, mean))
+    lines.append("calm (< %s m/s) %.1f%%" % (CALM, 100.0 * calm / total))
+    return lines
+
+
+def sparkline(x):
+    x = np.asarray(x, dtype=float)
+    x = x[np.isfinite(x)]
+    if not len(x):
+        return ""
+    lo, hi = x.min(), x.max()
+    if hi - lo < 1e-9:
+        return SPARK[len(SPARK) // 2] * len(x)
+    return "".join(SPARK[int((v - lo) / (hi - lo) * (len(SPARK) - 1))] for v in x)
+
+
+def fmt(x, spec="%7.2f"):
+    return spec % x if x == x else " " * (len(spec % 0.0) - 1) + "-"
+
+
+class Dashboard(object):
+    """
+    status(): recorder status dict (Recorder.status() or the service "status" reply).
+    events(n): recent log lines.
+    keys: {"q": function}, a function returning True closes the dashboard.
+    tick(): called every KEY_POLL, e.g. periodic stats logging.
+    """
+    def __init__(self, status, events=None, keys=None, tick=None, rate=1.0,
+                 name=SHM_GMX500, name_v=SHM_GMX500_V, refresh=REFRESH):
+        self.status = status
+        self.events = events
+        self.keys = keys or {}
+        self.tick = tick
+        self.rate = rate
+        self.names = (name, name_v)
+        self.refresh = refresh
+        self.rows_needed = int(max(AVERAGE_WINDOWS + [ROSE_WINDOW]) * rate * 1.2) + 1
+        self.ring = None
+        self.ring_v = None
+        self.last_count = None  # ring count and time of the previous redraw, for samples/s
+        self.last_time = None
+
+    def attach(self):
+        # the recorder may start after the dashboard
+        if self.ring is None:
+            try:
+                self.ring = SharedRing.attach(self.names[0])
+                self.ring_v = SharedRing.attach(self.names[1])
+            except FileNotFoundError:
+                self.ring = None
+        return self.ring is not None
+
+    def close(self):
+        for r in (self.ring, self.ring_v):
+            if r is not None:
+                r.close()
+        self.ring = self.ring_v = None
+
+    def sample_rate(self, count, now):
+        rate = float("nan")
+        if self.last_count is not None and now > self.last_time and count >= self.last_count:
+            rate = (count - self.last_count) / (now - self.last_time)
+        self.last_count, self.last_time = count, now
+        return rate
+
+    def lines(self):
+        now = time.time()
+        try:
+            st = self.status() or {}
+        except Exception as e:
+            st = {"error": str(e)}
+        keys = "  ".join("%s: %s" % (k, getattr(f, "__name__", "")) for k, f in self.keys.items())
+        head = "GMX500  %s  %s  %s" % (time.strftime("%Y-%m-%d %H:%M:%S"),
+                                       "recording" if st.get("running") else "stopped", keys)
+        info = "status: %s" % st["error"] if "error" in st else "file: %s" % (st.get("filename") or "-")
+        out = [head, info, ""]
+
+        if not self.attach():
+            return out + ["no live data: recorder not running (%s)" % self.names[0]]
+        rows, count = self.ring.latest(self.rows_needed)
+        v_rows, _ = self.ring_v.latest(BATTERY_POINTS)
+        rate = self.sample_rate(count, now)
+        if not len(rows):
+            return out + ["waiting for data..."]
+
+        last = rows[-1]
+        epoch = rows[:, COL["epoch_time"]]
+        u, v = rows[:, COL["velocity_u"]], rows[:, COL["velocity_v"]]
+        speed, direction = rows[:, COL["corrected_speed"]], rows[:, COL["corrected_direction"]]
+
+        out.append("%-20s %9s" % ("", "now") + "".join("%9s" % ("%s min" % (w // 60)) for w in AVERAGE_WINDOWS))
+        avg = []
+        for w in AVERAGE_WINDOWS:
+            sel = epoch >= epoch[-1] - w
+            x = windstats.batch_dir(direction[sel], speed[sel], rate=self.rate)
+            x["u"], x["v"] = np.nanmean(u[sel]), np.nanmean(v[sel])  # instrument u/v, as recorded
+            avg.append(x)
+        now_values = {"u": last[COL["velocity_u"]], "v": last[COL["velocity_v"]],
+                      "speed": last[COL["corrected_speed"]], "direction": last[COL["corrected_direction"]]}
+        for key, label in ROWS:
+            out.append("%-20s %s" % (label, fmt(now_values.get(key, float("nan")), "%9.2f")) +
+                       "".join(fmt(a[key], "%9.2f") for a in avg))
+        out.append("")
+
+        out.append("P %s hPa   T %s degC   RH %s %%   dew point %s degC   age %.0f s" % (
+            fmt(last[COL["pressure"]], "%.1f"), fmt(last[COL["temperature"]], "%.1f"),
+            fmt(last[COL["humidity"]], "%.0f"), fmt(last[COL["dew_point"]], "%.1f"), now - epoch[-1]))
+        lat, lon, height = last[COL["gps_latitude"]], last[COL["gps_longitude"]], last[COL["gps_height"]]
+        if np.isfinite(lat) and np.isfinite(lon) and (lat != 0 or lon != 0):
+            out.append("GPS fix  %.5f %.5f  %s m" % (lat, lon, fmt(height, "%.0f")))
+        else:
+            out.append("GPS no fix")
+
+        batt = st.get("battery") or {}
+        trend = float("nan")
+        if len(v_rows) > 1:
+            hours = (v_rows[-1, 0] - v_rows[0, 0]) / 3600.0
+            if hours > 0:
+                trend = (v_rows[-1, 1] - v_rows[0, 1]) / hours
+        out.append("Battery %s V  %s  trend %s V/h  [%s]" % (
+            fmt(last[COL["battery_v"]], "%.2f"), batt.get("state", "-"), fmt(trend, "%+.3f"),
+            sparkline(v_rows[:, 1]) if len(v_rows) else ""))
+
+        counters = (st.get("metrics") or {}).get("counters", {})
+        out.append("Samples/s %s   valid %s  invalid %s  dropped %s" % (
+            fmt(rate, "%.2f"), counters.get("valid", "-"), counters.get("invalid", "-"),
+            counters.get("dropped", "-")))
+        out.append("Upload backlog %s files, oldest %.0f s" % (
+            st.get("upload_backlog", "-"), st.get("upload_backlog_age") or 0))
+        clock = st.get("timing")
+        if clock is not None:
+            out.append("Clock - GPS %s s  drift %s ppm  %s  late %s  no GPS time %s" % (
+                fmt(np.nan if clock["offset"] is None else clock["offset"], "%+.3f"),
+                fmt(np.nan if clock["drift_ppm"] is None else clock["drift_ppm"], "%+.1f"),
+                "locked" if clock["locked"] else "unlocked", counters.get("late_frames", 0),
+                counters.get("no_gps_time", 0)))
+        alarms = (st.get("alarms") or {}).get("active", [])
+        out.append("Alarms: %s" % (", ".join("%s (%s) %s" % (a["name"], a["severity"], fmt(a["value"], "%.4g"))
+                                            for a in alarms) or "none"))
+        out.append("")
+
+        sel = epoch >= epoch[-1] - ROSE_WINDOW
+        out.append("Wind rose, last %s min (%s samples)" % (ROSE_WINDOW // 60, int(sel.sum())))
+        out += windrose_lines(direction[sel], speed[sel])
+
+        if self.events is not None:
+            try:
+                events = self.events(EVENTS)
+            except Exception:
+                events = []
+            out += ["", "Recent events"] + events
+        return out
+
+    def draw(self, scr):
+        h, w = scr.getmaxyx()
+        scr.erase()
+        for i, line in enumerate(self.lines()[:h - 1]):
+            scr.addnstr(i, 0, line, w - 1)
+        scr.refresh()  # only the changed characters are sent
+
+    def loop(self, scr):
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+        scr.timeout(int(KEY_POLL * 1000))
+        drawn = 0
+        while True:
+            ch = scr.getch()
+            if ch == curses.KEY_RESIZE:
+                drawn = 0
+            elif 0 <= ch < 256:
+                f = self.keys.get(chr(ch))
+                if f is not None and f():
+                    return
+            if self.tick is not None:
+                self.tick()
+            if time.time() - drawn >= self.refresh:
+                self.draw(scr)
+                drawn = time.time()
+
+    def run(self):
+        try:
+            curses.wrapper(self.loop)
+        finally:
+            self.close()
+
+
+def main():
+    import logs
+    from recorder_service import RecorderClient
+
+    client = RecorderClient("gmx500")
+
+    def quit():
+        return True
+
+    logs.setup("dashboard", folder=None, console=False)
+    Dashboard(lambda: client.request("status"), lambda n: client.request("log", n=n)["events"],
+              keys={"q": quit}).run()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,77 @@
+# Derived channels, computed once per frame in the parse stage and shared by
+# the hour file writer, the plot buffers and the live statistics.
+# Every function has an array version (a batch of frames at once) and a _scalar
+# version on plain floats: numpy calls on single values cost more than the math.
+# The two agree to the last bit or two (numpy and libm atan2 round differently).
+
+import math
+
+import numpy as np
+
+VECTOR_MIN = 8  # frames, smaller batches use the scalar functions
+DEW_TOLERANCE = 1.0  # degC, reported dew point vs dew point from T and RH
+# Magnus formula coefficients (Sonntag 1990), -45..60 degC over water
+MAGNUS_B = 17.62
+MAGNUS_C = 243.12
+RAD2DEG = 180.0 / math.pi
+
+
+def wind_uv_to_dir(U, V):
+    """
+    Calculates the wind direction from the u and v component of wind.
+    Takes into account the wind direction coordinates is different than the
+    trig unit circle coordinate. If the wind directin is 360 then returns zero
+    (by %360)
+    Inputs:
+      U = west/east direction (wind from the west is positive, from the east is negative)
+      V = south/noth direction (wind from the south is positive, from the north is negative)
+    """
+    WDIR = (270 - np.rad2deg(np.arctan2(U, V))) % 360
+    return WDIR
+
+
+def wind_uv_to_dir_scalar(u, v):
+    return (270.0 - math.atan2(u, v) * RAD2DEG) % 360.0
+
+
+def wind_speed(u, v):
+    return np.sqrt(u * u + v * v)
+
+
+def wind_speed_scalar(u, v):
+    return math.sqrt(u * u + v * v)
+
+
+def dir_to_uv(direction, speed):
+    """Inverse of wind_uv_to_dir(): u, v of a direction (deg) and speed."""
+    d = np.deg2rad(direction)
+    return -speed * np.cos(d), -speed * np.sin(d)
+
+
+def dir_to_uv_scalar(direction, speed):
+    d = math.radians(direction)
+    return -speed * math.cos(d), -speed * math.sin(d)
+
+
+def dew_point(t, rh):
+    """Dew point (degC) from temperature (degC) and relative humidity (%), Magnus formula."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        g = np.log(rh / 100.0) + MAGNUS_B * t / (MAGNUS_C + t)
+        return MAGNUS_C * g / (MAGNUS_B - g)
+
+
+def dew_point_scalar(t, rh):
+    if rh <= 0:
+        return float("-inf")
+    g = math.log(rh / 100.0) + MAGNUS_B * t / (MAGNUS_C + t)
+    return MAGNUS_C * g / (MAGNUS_B - g)
+
+
+def dew_point_ok(t, rh, dp, tolerance=DEW_TOLERANCE):
+    """False where the reported dew point is above the temperature or far from Magnus."""
+    with np.errstate(invalid="ignore"):
+        return (dp <= t + tolerance) & (np.abs(dp - dew_point(t, rh)) <= tolerance)
+
+
+def dew_point_ok_scalar(t, rh, dp, tolerance=DEW_TOLERANCE):
+    return dp <= t + tolerance and abs(dp - dew_point_scalar(t, rh)) <= tolerance
@@ -0,0 +1,235 @@
+# Event capture: configurable rules on the live samples (gusts, direction shifts,
+# pressure jumps, battery sag). When a rule fires, the rows of the last PRE_SECONDS
+# (kept in an in-memory ring) and of the next POST_SECONDS are saved to an event file,
+# same columns as the hour files, with a json file of metadata next to it:
+#   <LOCAL_DATA_PATH>/20241010/events/20241010_143512_gust.csv  (+ .json)
+# in the day folder, deleted with it; copied to the R drive day folder, next to 20241010_14.csv
+# Rules cost O(1) per sample: a run length, or a value compared with the one `seconds`
+# ago (each sample enters and leaves a short deque once).
+# Rules: a json list in LOCAL_DATA_PATH/event_rules.json (recorder.rules_options), DEFAULT_RULES without it.
+# A rule: {"name": "gust", "rule": "above", "channel": "speed", "value": 15, "seconds": 3}
+#   above / below   channel above / below value for at least seconds
+#   change          channel changed by value or more within seconds (average: s, smoothing first)
+#   shift           same for a direction, the smallest angle between the two (vector averages)
+#   holdoff         s, quiet time after firing, default POST_SECONDS
+
+import collections
+import json
+import math
+import os
+import time
+
+# customized files
+import logs
+
+PRE_SECONDS = 60  # s, rows before the trigger
+POST_SECONDS = 60  # s, rows after the (last) trigger
+MAX_SECONDS = 900  # s, longest event file, continuous triggers start a new one
+FOLDER = "events"  # in the day folder
+RULES_FILE = "event_rules.json"  # in the local data path, replaces DEFAULT_RULES
+
+DEFAULT_RULES = [
+    {"name": "gust", "rule": "above", "channel": "speed", "value": 15.0, "seconds": 3},
+    {"name": "direction_shift", "rule": "shift", "channel": "direction", "value": 90.0, "seconds": 60,
+     "average": 10},
+    {"name": "pressure_jump", "rule": "change", "channel": "pressure", "value": 1.0, "seconds": 60},
+    {"name": "battery_sag", "rule": "below", "channel": "battery_v", "value": 11.8, "seconds": 30},
+]
+
+log = logs.get_logger(__name__)
+
+
+def angle_diff(a, b):
+    """a - b in degrees, -180..180"""
+    return (a - b + 180.0) % 360.0 - 180.0
+
+
+class Threshold(object):
+    """Channel above (or below) value for at least seconds, fires once per run."""
+    def __init__(self, config, index, above=True):
+        self.config = config
+        self.name = config["name"]
+        self.index = index
+        self.value = float(config["value"])
+        self.seconds = float(config.get("seconds", 0))
+        self.holdoff = float(config.get("holdoff", POST_SECONDS))
+        self.above = above
+        self.since = None  # start of the current run
+        self.fired = False
+        self.quiet_until = -math.inf
+
+    def update(self, epoch, values):
+        x = values[self.index]
+        if x > self.value if self.above else x < self.value:  # nan: False
+            if self.since is None:
+                self.since = epoch
+            if not self.fired and epoch - self.since >= self.seconds and epoch >= self.quiet_until:
+                self.fired = True
+                self.quiet_until = epoch + self.holdoff
+                return {"rule": self.name, "time": epoch, "value": x, "since": self.since}
+        else:
+            self.since = None
+            self.fired = False
+        return None
+
+
+class Change(object):
+    """Channel (optionally averaged) changed by value or more compared with seconds ago."""
+    def __init__(self, config, index, angle=False):
+        self.config = config
+        self.name = config["name"]
+        self.index = index
+        self.value = float(config["value"])
+        self.seconds = float(config.get("seconds", 60))
+        self.average = float(config.get("average", 0))
+        self.holdoff = float(config.get("holdoff", POST_SECONDS))
+        self.angle = angle
+        self.window = collections.deque()  # (epoch, x or (sin, cos)) of the running average
+        self.sum = [0.0, 0.0]
+        self.history = collections.deque()  # (epoch, averaged value) of the last seconds
+        self.quiet_until = -math.inf
+
+    def smooth(self, epoch, x):
+        if self.angle:
+            r = math.radians(x)
+            y = (math.sin(r), math.cos(r))
+        else:
+            y = (x, 0.0)
+        if self.average <= 0:
+            return x
+        self.window.append((epoch, y))
+        self.sum[0] += y[0]
+        self.sum[1] += y[1]
+        while epoch - self.window[0][0] >= self.average:
+            t, old = self.window.popleft()
+            self.sum[0] -= old[0]
+            self.sum[1] -= old[1]
+        if self.angle:
+            return math.degrees(math.atan2(self.sum[0], self.sum[1])) % 360.0
+        return self.sum[0] / len(self.window)
+
+    def update(self, epoch, values):
+        x = values[self.index]
+        if x != x:
+            return None
+        y = self.smooth(epoch, x)
+        self.history.append((epoch, y))
+        # history[0]: the newest value at least seconds old
+        while len(self.history) > 1 and epoch - self.history[1][0] >= self.seconds:
+            self.history.popleft()
+        t0, y0 = self.history[0]
+        if epoch - t0 < self.seconds or epoch < self.quiet_until:
+            return None
+        d = angle_diff(y, y0) if self.angle else y - y0
+        if abs(d) >= self.value:
+            self.quiet_until = epoch + self.holdoff
+            return {"rule": self.name, "time": epoch, "value": x, "change": d, "before": y0, "after": y}
+        return None
+
+
+def compile_rules(rules, names):
+    """Rule objects for the channels this recorder has, the others are left out."""
+    out = []
+    for config in rules:
+        channel = config["channel"]
+        if channel not in names:
+            log.info("event rule %s: no channel %s here, ignored", config["name"], channel)
+            continue
+        i = names.index(channel)
+        kind = config["rule"]
+        if kind in ("above", "below"):
+            out.append(Threshold(config, i, above=kind == "above"))
+        elif kind in ("change", "shift"):
+            out.append(Change(config, i, angle=kind == "shift"))
+        else:
+            raise ValueError("event rule %s: unknown rule %r" % (config["name"], kind))
+    return out
+
+
+def load_rules(path):
+    """Rules from a json file: a list of rule dicts."""
+    with open(path) as f:
+        return json.load(f)
+
+
+class Capture(object):
+    """
+    add(epoch, row, values) for every persisted frame: row is the hour file line,
+    values the channels in names. Returns the rules fired by this sample.
+    on_saved(csv path, json path) after an event file is written.
+    folder: the local data path, files go to <folder>/<day>/events/.
+    """
+    def __init__(self, folder, header, rules, names, rate, model="", pre=PRE_SECONDS, post=POST_SECONDS,
+                 on_saved=None):
+        self.folder = folder
+        self.header = header
+        self.rules = compile_rules(rules, list(names))
+        self.model = model
+        self.pre = pre
+        self.post = post
+        self.on_saved = on_saved
+        self.ring = collections.deque(maxlen=int(pre * rate * 1.5) + 10)  # (epoch, row)
+        self.event = None  # event being recorded
+        self.count = 0
+
+    def add(self, epoch, row, values):
+        self.ring.append((epoch, row))
+        fired = []
+        for r in self.rules:
+            x = r.update(epoch, values)
+            if x is not None:
+                fired.append(x)
+        e = self.event
+        if e is not None:
+            e["rows"].append(row)
+            e["last"] = epoch
+            if fired:
+                e["triggers"] += fired
+                e["end"] = epoch + self.post
+            if epoch >= e["end"] or epoch - e["start"] >= MAX_SECONDS:
+                self.save(complete=True)
+        elif fired:
+            # copies the ring once per event, not per sample
+            rows = [(t, r) for t, r in self.ring if t >= epoch - self.pre]
+            self.event = {"trigger_time": epoch, "triggers": fired, "start": rows[0][0], "last": epoch,
+                          "end": epoch + self.post, "rows": [r for t, r in rows]}
+        return fired
+
+    def save(self, complete=True):
+        e, self.event = self.event, None
+        if e is None:
+            return None
+        first = e["triggers"][0]
+        name = time.strftime("%Y%m%d_%H%M%S", time.localtime(e["trigger_time"])) + "_" + first["rule"]
+        folder = os.path.join(self.folder, name[:8], FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, name + ".csv")
+        with open(path, "w") as f:
+            f.write(self.header)
+            f.writelines(e["rows"])
+        meta = {
+            "model": self.model,
+            "trigger_time": e["trigger_time"],
+            "triggers": e["triggers"],
+            "rules": [r.config for r in self.rules if r.name in set(x["rule"] for x in e["triggers"])],
+            "start": e["start"],
+            "end": e["last"],
+            "rows": len(e["rows"]),
+            "pre_seconds": self.pre,
+            "post_seconds": self.post,
+            "complete": complete,  # False: recorder stopped during the post window
+            "hour_files": sorted(set(time.strftime("%Y%m%d_%H.csv", time.localtime(t))
+                                     for t in (e["start"], e["trigger_time"], e["last"]))),
+        }
+        with open(path[:-len(".csv")] + ".json", "w") as f:
+            json.dump(meta, f, indent=1)
+        self.count += 1
+        log.info("event %s: %s, %s rows saved: %s", first["rule"],
+                 ", ".join("%s %.4g" % (x["rule"], x["value"]) for x in e["triggers"]), len(e["rows"]), name)
+        if self.on_saved is not None:
+            self.on_saved(path, path[:-len(".csv")] + ".json")
+        return path
+
+    def close(self):
+        """Save an event still waiting for its post window."""
+        return self.save(complete=False)
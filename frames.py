@@ -0,0 +1,122 @@
+# Parse anemometer output frames and format csv rows.
+# GMX500: gui_GMX500.py, GMX500.py    WindSonic M: gui_windsonic.py
+
+import time
+from datetime import datetime
+
+# csv header: 18 items
+HEADER_GMX500 = "epoch_time," \
+                "local_clock_time," \
+                "velocity_u_m/s," \
+                "velocity_v_m/s," \
+                "Direction," \
+                "Speed_m/s," \
+                "Corrected_Direction," \
+                "Corrected_Speed_m/s," \
+                "Pressure_hPa," \
+                "Relative_Humidity_%," \
+                "Temperature_C," \
+                "Dew_point_C," \
+                "GPS_Latitude," \
+                "GPS_longitude," \
+                "GPS_Height_m," \
+                "GPS_Time," \
+                "Supply_Voltage," \
+                "Battery_V\n"
+
+HEADER_WINDSONIC = "epoch_time,local_clock_time,U_velocity_NS,V_velocity_WE,speed,direction\n"
+
+
+def clock_gmx500(epoch):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch))
+
+
+def clock_windsonic(epoch):
+    # use pandas library default time format, to ms
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def parse_gmx500(x):
+    """
+    Returns the 15 data fields of a GMX500 frame, raises if the frame is invalid.
+    (u, v, Direction, Speed, Corrected_Direction, Corrected_Speed, Pressure,
+     Humidity, Temperature, Dew point, GPS_Latitude, GPS_longitude, GPS_Height,
+     GPS_Time, Supply voltage)
+    """
+    y = x.split(',')
+    # occasionally I2C board sents out empty strings, this serves as a validation.
+    a1 = float(y[1])  # u-velocity
+    a2 = float(y[2])  # v-velocity
+    a3 = int(y[3])  # Direction
+    a4 = float(y[4])  # Speed
+    wind_dir = int(y[5])  # Corrected_Direction
+    wind_speed = float(y[6])  # Corrected_Speed
+    a5 = float(y[7])  # Pressure
+    a6 = float(y[8])  # Humidity
+    a7 = float(y[9])  # Temperature
+    a8 = float(y[10])  # Dew point
+    a9, a10, a11 = y[11].split(':')  # GPS_Latitude, GPS_longitude, GPS_Height
+    a13 = float(y[13])  # supply voltage
+    return (a1, a2, a3, a4, wind_dir, wind_speed, a5, a6, a7, a8,
+            a9, a10, a11, y[12], a13)
+
+
+def format_gmx500(epoch, clock_time, fields, v):
+    # need a space before clock time so excel reads it as string
+    return "%s, %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s\n" % \
+        ((epoch, clock_time) + tuple(fields) + (v,))
+
+
+def parse_windsonic(x):
+    """Returns (u, v) of a WindSonic frame, raises if the frame is invalid."""
+    y = x.split(',')
+    u = float(y[1])  # u axis speed, NS
+    v = float(y[2])  # v axis speed, WE
+    return u, v
+
+
+def format_windsonic(epoch, clock_time, u, v, wind_speed, wind_dir):
+    # need a space before clock time so excel reads it as string
+    return "%s, %s,%s,%s,%s,%s\n" % (epoch, clock_time, u, v, wind_speed, wind_dir)
+
+
+# read hour files back: reprocess.py and offline tools
+TEXT_COLUMNS = ("local_clock_time", "GPS_Time")
+
+
+def model_of(header):
+    return "gmx500" if header == HEADER_GMX500 else "windsonic"
+
+
+def read_csv(path):
+    """
+    (header line, column names, rows split into fields) of an hour csv.
+    Rows with a wrong number of fields (cut by a power loss) are left out.
+    """
+    with open(path, errors="replace") as f:
+        header = f.readline()
+        names = header.rstrip("\n").split(",")
+        rows = []
+        for line in f:
+            y = line.rstrip("\n").split(",")
+            if len(y) == len(names):
+                rows.append(y)
+    return header, names, rows
+
+
+def to_floats(x):
+    out = []
+    for a in x:
+        try:
+            out.append(float(a))
+        except ValueError:
+            out.append(float("nan"))
+    return out
+
+
+def numeric(names, rows, columns=None):
+    """float columns of read_csv() rows (all but the text columns by default), bad numbers are nan."""
+    if columns is None:
+        columns = [c for c in names if c not in TEXT_COLUMNS]
+    idx = [names.index(c) for c in columns]
+    return columns, [to_floats([y[i] for y in rows]) for i in idx]
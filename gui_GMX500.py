@@ -9,40 +9,24 @@ BAUDRATE = 19200
 VOLTAGE_MIN = 12  # battery is 12 V, lower than this means battery is dead.
 
 # GUI
-LOCAL_DATA_PATH = "/home/picarro/Wind_data"  # folder to save data locally
+LOCAL_DATA_PATH = "/home/picarro/Wind_data"  # folder to save data locally, alarm_rules.json / event_rules.json in it
 GUI_REFRESH_TIME = 1  # s
 PLOT_WINDOW_WIND = 10  # min, time length for wind data plot
 PLOT_WINDOW_V = 24  # hour, time length for battery data plot
 INTERVAL_V = 15  # min, plot a battery voltage point every # mins
 MONTH = 6  # delete files that is how many months old
-
-# csv header: 18 items
-HEADER = "epoch_time," \
-         "local_clock_time," \
-         "velocity_u_m/s," \
-         "velocity_v_m/s," \
-         "Direction," \
-         "Speed_m/s," \
-         "Corrected_Direction," \
-         "Corrected_Speed_m/s," \
-         "Pressure_hPa," \
-         "Relative_Humidity_%," \
-         "Temperature_C," \
-         "Dew_point_C," \
-         "GPS_Latitude," \
-         "GPS_longitude," \
-         "GPS_Height_m," \
-         "GPS_Time," \
-         "Supply_Voltage," \
-         "Battery_V\n"
+TMPFS_STAGING = 0  # 1: keep the active hour file in RAM, flush to SD card every few minutes
+EVENTS = 20  # recent log events shown in the Settings tab
+SEPARATE_PROCESS = 1  # 1: recorder runs in its own process (recorder_service.py), closing the GUI does not stop recording
 
 import sys
 import platform
 import os
 import shutil
 import time
+import queue
+import threading
 import numpy as np
-import csv
 
 import serial
 import serial.tools.list_ports as ls
@@ -88,10 +72,6 @@ if RASPI:  # on a raspberry pi, use PySide6
     )
     from PySide6.QtCore import QObject, QThread, Signal
 
-    # for I2C board
-    import board
-    from adafruit_ina219 import INA219
-
 else:
     # use PyQt6
     from PyQt6.QtGui import QPixmap, QIcon, QAction, QFont
@@ -124,17 +104,23 @@ from matplotlib import pyplot as plt
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qtagg import NavigationToolbar2QT as NavigationToolbar
 
-from windrose import WindroseAxes
 
 # customized files
 import style
-
-global stoprun  # 1 stop thread, 0 keep running
-global clearplot  # 1 clear plots, 0 not
-
-
-TEMP_FILE_WIND = os.path.join(LOCAL_DATA_PATH, "tempwind.csv")
-TEMP_FILE_V = os.path.join(LOCAL_DATA_PATH, "tempv.csv")
+import plots
+import windstats
+import instrument
+import logs
+import profiler
+import staging
+from recorder import GMX500Recorder, SHM_GMX500, SHM_GMX500_V, detect_port, rules_options, STATS_INTERVAL
+from shm_ring import read_latest, GMX500_COLUMNS
+from recorder_service import RecorderClient
+
+STAGING_DIR = staging.TMPFS_PATH if TMPFS_STAGING else None
+log = logs.get_logger("gui")
+# live data in shared memory: Corrected_Direction, Corrected_Speed
+WIND_COLUMNS = [GMX500_COLUMNS.index("corrected_direction"), GMX500_COLUMNS.index("corrected_speed")]
 
 # create folder for local data storage
 folder_data = '/home/picarro/Wind_data'
@@ -148,175 +134,77 @@ if not os.listdir(folder_data):  #  empty
 class Worker(QObject):
     finished = Signal()
     progress = Signal(str)
+    state = Signal(str)  # "running", "stopped", "error"
+    detected = Signal(bool)  # anemometer port checked, False: not started
+
+    def __init__(self, port):
+        super().__init__()
+        self.port = port
+        # control from the GUI thread
+        self.stop_event = threading.Event()
+        self.commands = queue.Queue()  # "clear"
+        self.rec = None  # the Settings tab reads its metrics
 
     def run(self):
         """Long-running task."""
-        global stoprun
-        stoprun = 0
-        global clearplot
-        clearplot = 0
-
-        total_wind_pts = PLOT_WINDOW_WIND * 60
-        total_v_pts = int(60 / INTERVAL_V * PLOT_WINDOW_V)
-
-        with open("par1/port.txt", "r") as f:
-            PORT = f.read()  # '/dev/ttyUSB2'
+        PORT = self.port  # '/dev/ttyUSB2'
+        # up to 2 s on a silent port, here and not on the GUI thread
+        ok = detect_port(PORT, BAUDRATE)
+        self.detected.emit(ok)
+        if not ok:
+            self.finished.emit()
+            return
+        with open("par1/port.txt", "w") as f:
+            f.write(PORT)
 
         with open("par1/rdrive.txt", "r") as f:
             RDRIVE_FOLDER = f.read()
 
-        wind = serial.Serial(PORT, BAUDRATE)
-        print('anemometer USB port: ', wind.name)
-
-        i2c_bus = board.I2C()  # uses board.SCL and board.SDA
-        ina219 = INA219(i2c_bus)
-
-        filename = time.strftime("%Y%m%d_%H")
-        self.progress.emit(filename)
-
-        # create folder of the day on local drive
-        local_folder_day = os.path.join(LOCAL_DATA_PATH, filename[:8])
-        if not os.path.isdir(local_folder_day):
-            os.mkdir(local_folder_day)
-
-        local_file_path = os.path.join(local_folder_day, filename + ".csv")
-        with open(local_file_path, "w") as f:
-            f.write(HEADER)
-
-        # create folder of the day on r-drive
-        r_folder_day = os.path.join(RDRIVE_FOLDER, filename[:8])
-        if not os.path.isdir(r_folder_day):
-            os.mkdir(r_folder_day)
-            
-        uncopied = []  # uncopied csv files, try again later
-        plot_data_wind = []
-        
-        # initiate the voltage part
-        time_tag = time.time()
-        plot_data_v = []
-        for i in range(2):
-            bus_voltage = ina219.bus_voltage
-            shunt_voltage = ina219.shunt_voltage
-            v = round(bus_voltage + shunt_voltage, 2)
-            plot_data_v.append([time_tag, v])
-            
-        with open(TEMP_FILE_V, 'w', newline='') as f:
-            write = csv.writer(f)
-            write.writerows(plot_data_v)
-        
-
-        while True:
-            if stoprun:
-                break
-                
-            if clearplot:
-                plot_data_wind = []
-                plot_data_v = []
-                clearplot = 0
-                print('plot cleared.')
-
-            epoch = time.time()
-            clock_time = time.strftime('%Y-%m-%d %H:%M:%S')
+        rec = None
+        try:
+            rec = GMX500Recorder(PORT, RDRIVE_FOLDER, PLOT_WINDOW_WIND, PLOT_WINDOW_V, INTERVAL_V,
+                                 voltage_min=VOLTAGE_MIN,
+                                 warning_msg=os.path.join(RDRIVE_FOLDER, "battery_warning.txt"),
+                                 local_data_path=LOCAL_DATA_PATH, staging_dir=STAGING_DIR,
+                                 on_rotate=self.progress.emit, **rules_options(LOCAL_DATA_PATH))
+            rec.start()
+            self.rec = rec
+        except Exception as e:
+            log.error("start failed: %s", e)
+            if rec is not None:
+                rec.close()
+            self.state.emit("error")
+            self.finished.emit()
+            return
+        self.state.emit("running")
 
-            now = time.strftime("%Y%m%d_%H")  # 20240712_14
-            
-            # create a new csv every hour and copy to r-drive
-            if now[-2:] != filename[-2:]:
-                # copy previous hour csv to r-drive
+        try:
+            stats_tag = time.time()
+            while not self.stop_event.wait(0.1):
                 try:
-                    shutil.copy2(local_file_path, r_folder_day)  # source, destination
-                except:
-                    uncopied.append([local_file_path, r_folder_day])
-                    print("! copy to r-drive failed: %s.csv, will try again later." % filename)
-
-                # data failed to copy previously: try again
-                if uncopied:
-                    for i in range(len(uncopied)):
-                        try:
-                            shutil.copy2(uncopied[0][0], uncopied[0][1])
-                            print("* copy to r-drive successful: %s.csv" % uncopied[0][0])
-                            uncopied.pop(0)
-                        except:
-                            pass
-
-                # create a new folder every day
-                if (now[-2:] == "00") and (filename[-2:] == "23"):
-                    # locally
-                    local_folder_day = os.path.join(LOCAL_DATA_PATH, now[:8])
-                    os.mkdir(local_folder_day)
-
-                    # on r-drive
-                    r_folder_day = os.path.join(RDRIVE_FOLDER, now[:8])
-                    os.mkdir(r_folder_day)                
-                
-                filename = now
-                local_file_path = os.path.join(local_folder_day, filename + ".csv")
-                with open(local_file_path, "w") as f:
-                    f.write(HEADER)
-                self.progress.emit(filename)
-
-            # get battery voltage from I2C board
-            bus_voltage = ina219.bus_voltage  # voltage on V- (load side)
-            shunt_voltage = ina219.shunt_voltage  # voltage between V+ and V- across the shunt
-            v = round(bus_voltage + shunt_voltage, 5)
-            # print("Battery: %s V" % v)
-
-            # data for battery voltage plot
-            if epoch - time_tag > INTERVAL_V * 60:
-                plot_data_v.append([epoch, round(v, 2)])
-
-                if len(plot_data_v) > total_v_pts:
-                    plot_data_v.pop(0)
-
-                with open(TEMP_FILE_V, 'w', newline='') as f:
-                    write = csv.writer(f)
-                    write.writerows(plot_data_v)
-
-                time_tag = epoch
-
-            try:
-                x = wind.readline().decode()
-                # print(x)
-                y = x.split(',')
-                # occasionally I2C board sents out empty strings, this serves as a validation.
-                a1 = float(y[1])  # u-velocity
-                a2 = float(y[2])  # v-velocity
-                a3 = int(y[3])  # Direction
-                a4 = float(y[4])  # Speed
-                wind_dir = int(y[5])  # Corrected_Direction
-                wind_speed = float(y[6])  # Corrected_Speed
-                a5 = float(y[7])  # Pressure
-                a6 = float(y[8])  # Humidity
-                a7 = float(y[9])  # Temperature
-                a8 = float(y[10])  # Dew point
-                a9, a10, a11 = y[11].split(':')  # GPS_Latitude, GPS_longitude, GPS_Height
-                a13 = float(y[13])  # supply voltage
-
-                with open(local_file_path, "a") as f:
-                    # need a space before clock time so excel reads it as string
-                    f.write("%s, %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s\n" %
-                            (epoch, clock_time, a1, a2, a3, 
-                             a4, wind_dir, wind_speed, a5, a6, 
-                             a7, a8, a9, a10, a11, 
-                             y[12], a13, v))
-
-                # data for wind rose plot
-                plot_data_wind.append([wind_dir, wind_speed])
-                if len(plot_data_wind) > total_wind_pts:
-                    plot_data_wind.pop(0)
-
-                with open(TEMP_FILE_WIND, 'w', newline='') as f:
-                    write = csv.writer(f)
-                    write.writerows(plot_data_wind)
-
-            except:
-                pass
-                # print("- invalid data.")
-
+                    while True:
+                        if self.commands.get_nowait() == "clear":
+                            rec.clear()
+                except queue.Empty:
+                    pass
+                if time.time() - stats_tag > STATS_INTERVAL:
+                    log.info(rec.pipe.stats_line())
+                    log.info(rec.metrics_line())
+                    stats_tag = time.time()
+
+            # flush staged data, then copy last file to R drive
+            if not rec.stop():
+                log.warning("stop: copy last file to r-drive not finished, will keep trying.")
+        finally:
+            rec.close()  # remove the shared memory, the next Start creates it again
+        self.state.emit("stopped")
         self.finished.emit()
 
 
 class Window(QWidget):
+    status_ready = Signal(object)  # recorder process status, polled in a background thread
+    port_detected = Signal(bool)  # result of detect_port() in a background thread
+
     def __init__(self):
         super().__init__()
         self.setGeometry(200, 200, 1200, 800)
@@ -402,12 +290,15 @@ class Window(QWidget):
         self.toolbar1.setFixedHeight(30)
         self.batteryLabel = QLabel()
         self.batteryLabel.setStyleSheet(style.red2())
+        self.alarmLabel = QLabel()  # active alarms of the recorder (alarms.py)
+        self.alarmLabel.setStyleSheet(style.red2())
 
         layout1 = QHBoxLayout()
         figure1Layout.addWidget(self.canvas1)
         figure1Layout.addLayout(layout1)
         layout1.addWidget(self.toolbar1)
         layout1.addWidget(self.batteryLabel)
+        layout1.addWidget(self.alarmLabel)
 
         # windrose plot
         self.figure2 = plt.figure()
@@ -434,10 +325,38 @@ class Window(QWidget):
         self.timer_plot.setInterval(GUI_REFRESH_TIME * 1000)
         self.timer_plot.timeout.connect(self.plot_wind)
 
+        # Settings tab: latency of the recording loop and of the GUI refresh
+        self.instr = instrument.Instruments()
+        self.timer_perf = QTimer()
+        self.timer_perf.setInterval(5000)
+        self.timer_perf.timeout.connect(self.show_metrics)
+        self.timer_perf.start()
+
         self.timer_battery = QTimer()
         self.timer_battery.setInterval(INTERVAL_V * 60 * 1000)
         self.timer_battery.timeout.connect(self.plot_voltage)
 
+        # recorder in its own process: show its real state, attach if it is already recording
+        self.state = "stopped"
+        self.port_detected.connect(self.show_port)
+        self.worker = None
+        self.client = None
+        self.client_busy = False  # start/stop request running in background
+        self.client_error = None
+        self.battery_status = None  # battery alert state of the recorder process
+        self.alarm_status = None  # alarms of the recorder process
+        self.metrics_status = None  # metrics of the recorder process, for the Settings tab
+        self.events_status = None  # recent log events of the recorder process, for the Settings tab
+        self.polling = False  # status request running in background
+        if SEPARATE_PROCESS:
+            self.client = RecorderClient("gmx500")
+            self.status_ready.connect(self.apply_status)
+            self.timer_state = QTimer()
+            self.timer_state.setInterval(1000)
+            self.timer_state.timeout.connect(self.check_state)
+            self.timer_state.start()
+            self.check_state()
+
 
     def createLayout1(self):  # tab1
         layout1 = QHBoxLayout()
@@ -598,8 +517,30 @@ class Window(QWidget):
         box2.setStyleSheet(style.box5())
         box2.setLayout(layout2)
 
+        # recording loop latency and frame counters
+        box3 = QGroupBox("Performance:")
+        box3.setStyleSheet(style.box5())
+        layout4 = QVBoxLayout()
+        layout4.setContentsMargins(20, 40, 20, 10)
+        box3.setLayout(layout4)
+        self.perfLabel = QLabel("Not recording.")
+        self.perfLabel.setStyleSheet("font-family: monospace;")
+        layout4.addWidget(self.perfLabel)
+
+        # recent log events of the recorder
+        box4 = QGroupBox("Recent Events:")
+        box4.setStyleSheet(style.box5())
+        layout5 = QVBoxLayout()
+        layout5.setContentsMargins(20, 40, 20, 10)
+        box4.setLayout(layout5)
+        self.eventsText = QTextEdit()
+        self.eventsText.setReadOnly(True)
+        layout5.addWidget(self.eventsText)
+
         leftlayout.addWidget(box1)
         leftlayout.addWidget(box2)
+        leftlayout.addWidget(box3)
+        leftlayout.addWidget(box4)
         leftlayout.addLayout(layout3)
         leftlayout.addStretch()
 
@@ -732,13 +673,17 @@ class Window(QWidget):
     ## functions
     # delete files saved 3 months ago
     def delete_folders(self):
-        folders = [name for name in os.listdir(LOCAL_DATA_PATH) if os.path.isdir(os.path.join(LOCAL_DATA_PATH, name))]
+        # day folders only: logs, staging or other folders next to them are kept
+        folders = [name for name in os.listdir(LOCAL_DATA_PATH)
+                   if len(name) == 8 and name.isdigit() and os.path.isdir(os.path.join(LOCAL_DATA_PATH, name))]
         folders.sort()
+        if not folders:
+            return
         # print(folders)
         epoch1 = int(time.mktime(time.strptime(folders[0], "%Y%m%d")))
         epoch_now = int(time.time())
         if (epoch_now - epoch1) > 2628000 * MONTH:  # seconds
-            print("! There are files older than %s months in the folder, will delete them" % (MONTH))
+            log.warning("There are files older than %s months in the folder, will delete them", MONTH)
             
             '''
             # message box not working on Pi, will hang
@@ -758,65 +703,23 @@ class Window(QWidget):
                     epoch1 = int(time.mktime(time.strptime(name, "%Y%m%d")))
                     if (epoch_now - epoch1) > 2628000 * MONTH:
                         shutil.rmtree(os.path.join(LOCAL_DATA_PATH, name))
-                        print('Delete folder: ', name)
+                        log.info("delete folder: %s", name)
                     else:
                         break
             else:
                 print("keep files.")
             
                 
-    # battery voltage time series plot
-    def plot_v(self, epoch_time, v):
-        self.figure1.clear()
-        # [left, bottom, width, height]
-        ax1 = self.figure1.add_axes([0.12, 0.1, 0.85, 0.85])
-
-        '''
-        ax1 = self.figure1.add_subplot(111)
-        box = ax1.get_position()
-        box.x0 = box.x0 + 0.04
-        box.x1 = box.x1 + 0.05
-        box.y0 = box.y0 - 0.01
-        box.y1 = box.y1 + 0.05
-        ax1.set_position(box)
-        '''
-        
-        ax1.plot(epoch_time, v, marker = ".", color = "black", linewidth = 0.7)
-        ax1.grid(alpha = 0.3)
-
-        # axis label
-        ax1.set_xlabel("Local Clock Time: %s" % (time.strftime("%Y-%m-%d")))
-        ax1.set_ylabel("Battery Voltage, V", fontsize=10)
-
-        # add mark for every half hour
-        xx = [epoch_time[0]]
-        xmak = [time.strftime('%H', time.localtime(epoch_time[0]))]  # '%H:%M'
-        for i in range(1, len(epoch_time)):
-            t = epoch_time[i]
-            clock0 = time.strftime('%H:%M', time.localtime(epoch_time[i-1]))
-            clock =  time.strftime('%H:%M', time.localtime(t))
-            # print(clock0, clock)
-            #if (clock0[:2] != clock[:2]) or (int(clock0[-2:]) <= 29 and int(clock[-2:]) >= 30):
-            if (clock0[:2] != clock[:2]):
-                xx.append(int(t))
-                xmak.append(time.strftime('%H', time.localtime(t)))  # '%H:%M'
-                
-        # print("xx: ", xx)
-        # print("xmak: ", xmak)
-        ax1.set_xticks(xx)
-        ax1.set_xticklabels(xmak, fontsize=8)
-
+    # live data from shared memory, written by the recorder process or worker thread
+    def get_data(self, key):
+        if key == "wind":
+            return read_latest(SHM_GMX500, PLOT_WINDOW_WIND * 60, WIND_COLUMNS)
+        return read_latest(SHM_GMX500_V)  # epoch, voltage
 
     # real time display and plot
     def plot_voltage(self):
         try:
-            n = os.path.getsize(TEMP_FILE_V)
-            if n:
-                data = np.genfromtxt(TEMP_FILE_V, delimiter=',')  # epoch, voltage
-                # print(data)
-                # this line produces warning, is suppressed
-            else:
-                data= []
+            data = self.get_data("v")  # epoch, voltage
 
             if data.size:
                 epoch_time = data[:, 0]
@@ -824,17 +727,13 @@ class Window(QWidget):
                 
                 v1 = v[-1]
                 self.voltageLabel.setText(str(v1))
-                # check if battery is dead
-                if v1 < VOLTAGE_MIN:
+                # check if battery is dead: the recorder decides (hysteresis, debounce)
+                # and writes the warning file, the GUI only shows its state
+                state = self.recorder_battery_state()
+                if state is None:
+                    state = "low" if v1 < VOLTAGE_MIN else "ok"
+                if state == "low":
                     b = 0
-                    x = "! Warning, battery dead: %s V, %s" % (v1, time.ctime())
-                    try:
-                        with open(self.warning_msg, 'a') as f:
-                            f.write(x + "\n")
-                    except:
-                        pass
-                    print(x)
-                
                     if b != self.battery_state:
                         self.batteryLabel.setText("Battery is dead!")
                         self.battery_state = 0
@@ -846,50 +745,92 @@ class Window(QWidget):
                         self.battery_state = 1
                         self.voltageLabel.setStyleSheet(style.green1())
 
-                self.plot_v(epoch_time, v)
+                plots.draw_voltage(self.figure1, epoch_time, v)
                 self.canvas1.draw()
         except:
-            print("battery plot failed")
+            log.exception("battery plot failed")
 
-    def plot_wind(self):
+    def recorder_battery_state(self):
+        """Battery alert state of the recorder: "ok", "low", None if unknown."""
+        try:
+            if self.client is not None:
+                x = self.battery_status
+            else:
+                x = self.worker.rec.battery.status()
+            return x["state"]
+        except Exception:
+            return None
+
+    def show_alarms(self):
+        """Names of the active alarms next to the battery state."""
         try:
-            n = os.path.getsize(TEMP_FILE_WIND)
-            if n:
-                data = np.genfromtxt(TEMP_FILE_WIND, delimiter=',')  # wind_dir, wind_speed
-                # this line produces warning, is suppressed
+            if self.client is not None:
+                x = self.alarm_status
             else:
-                data= []
+                x = self.worker.rec.alarms.status()
+            text = ", ".join(a["name"] for a in x["active"])
+        except Exception:
+            text = ""
+        self.alarmLabel.setText("Alarm: %s" % text if text else "")
+
+    def plot_wind(self):
+        t0 = time.perf_counter()
+        try:
+            data = self.get_data("wind")  # wind_dir, wind_speed
 
             if data.size:
                 wind_dir = data[:, 0]
                 wind_speed = data[:, 1]
 
                 # windrose plot
-                self.figure2.clear()
-                rect = [0.1, 0.2, 0.8, 0.7]
-                ax = WindroseAxes(self.figure2, rect)
-                self.figure2.add_axes(ax)
-
-                ax.bar(wind_dir, wind_speed, normed=True, opening=0.8, edgecolor='white')
-                ax.set_legend(title='Wind Speed in m/s', bbox_to_anchor=(-0.1, -0.27))
+                title = plots.stats_title(windstats.batch_dir(wind_dir, wind_speed))
+                plots.draw_windrose(self.figure2, wind_dir, wind_speed, title)
                 self.canvas2.draw()
+                self.instr.record("gui_refresh", time.perf_counter() - t0)
 
                 # real time values
                 self.windSpeedLabel.setText(str(wind_speed[-1]))
                 self.windDirLabel.setText(str(wind_dir[-1]))
                 self.hintLabel.setText(self.startText + "Real time display...")
+                self.show_alarms()
 
         except:
             self.hintLabel.setText(self.startText + " !Real time display failed.")
 
+    def show_metrics(self):
+        # only while the Settings tab is shown
+        if self.tabs.currentWidget() is not self.tab2:
+            return
+        x = None
+        try:
+            if self.client is not None:
+                # from the last status poll, no request on the GUI thread
+                if self.state == "running":
+                    x = self.metrics_status
+            elif self.worker is not None and self.worker.rec is not None:
+                x = self.worker.rec.metrics()
+        except Exception:
+            pass
+        try:
+            events = self.events_status if self.client is not None else logs.recent(EVENTS)
+            if events is not None:
+                self.eventsText.setPlainText("\n".join(events))
+        except Exception:
+            pass
+        if x is None:
+            self.perfLabel.setText("Not recording.")
+            return
+        x["histograms"]["gui_refresh"] = self.instr.hist("gui_refresh").summary()
+        self.perfLabel.setText(instrument.format_snapshot(x))
+
     def reportProgress(self, x):
         self.filename = x  # 20240712_14
 
-    def runLongTask(self):
+    def runLongTask(self, port):
         # Step 2: Create a QThread object
         self.thread = QThread()
         # Step 3: Create a worker object
-        self.worker = Worker()
+        self.worker = Worker(port)
         # Step 4: Move worker to the thread
         self.worker.moveToThread(self.thread)
         # Step 5: Connect signals and slots
@@ -898,16 +839,15 @@ class Window(QWidget):
         self.worker.finished.connect(self.worker.deleteLater)
         self.thread.finished.connect(self.thread.deleteLater)
         self.worker.progress.connect(self.reportProgress)
+        self.worker.state.connect(self.set_state)
+        self.worker.detected.connect(self.show_port)
         # Step 6: Start the thread
         self.thread.start()
 
 
     def start(self):
-        # error check
-        tag = self.port_detect()
-        if not tag:
-            self.hintLabel.setText(" ! Anemometer is not connected.")
-
+        # error check, the port is checked by the worker or the client thread (show_port)
+        tag = 1
         if tag:
             self.rdrive_folder = self.folderLineEdit.text()
             if os.path.isdir(self.rdrive_folder):
@@ -922,60 +862,133 @@ class Window(QWidget):
                 os.remove(self.warning_msg)
 
         if tag:
-            try:
-                self.runLongTask()
+            self.set_state("starting")
+            self.port = self.portComboBox.currentText()
+            if self.client is not None:
+                threading.Thread(target=self.client_command, args=("start",), daemon=True).start()
+            else:
+                self.runLongTask(self.port)
                 print('running long task')
-                time.sleep(3)
-                
-                # initiate battery plot: battery plot updated less (every few minutes)
-                # than wind plot, so display values on GUI at the beginning.
-                data = np.genfromtxt(TEMP_FILE_V, delimiter=',')
-                epoch_time = data[:, 0]
-                v = data[:, 1]
-                v1 = v[-1]
-                self.voltageLabel.setText(str(v1))
-                self.plot_v(epoch_time, v)
-                self.canvas1.draw()
-                
-                self.battery_state = 1  # 1: normal, 0: dead
-                self.timer_plot.start()
-                self.timer_battery.start()
-
-                self.StartButton.setEnabled(False)
-                self.ClearButton.setEnabled(True)
-                self.StopButton.setEnabled(True)
-                self.startText = "Started at: %s. " % time.strftime("%Y-%m-%d %H:%M:%S")
-                self.hintLabel.setText(self.startText)
-            except:
-                self.hintLabel.setText(" ! Error start.")
-
 
-    def stop(self):
-        filename = time.strftime("%Y%m%d_%H")
-        global stoprun
-        stoprun = 1
+    # recorder process: start/stop can take seconds, run them off the GUI thread
+    def client_command(self, cmd):
+        self.client_busy = True
+        try:
+            if cmd == "start":
+                ok = detect_port(self.port, BAUDRATE)
+                self.port_detected.emit(ok)
+                if not ok:
+                    self.client_busy = False
+                    return
+                with open("par1/port.txt", "w") as f:
+                    f.write(self.port)
+                if not self.client.launch():
+                    raise RuntimeError("recorder process did not start")
+                options = {
+                    "plot_window_wind": PLOT_WINDOW_WIND,
+                    "plot_window_v": PLOT_WINDOW_V,
+                    "interval_v": INTERVAL_V,
+                    "local_data_path": LOCAL_DATA_PATH,
+                    "staging_dir": STAGING_DIR,
+                    "voltage_min": VOLTAGE_MIN,
+                    "warning_msg": self.warning_msg,
+                }
+                self.client.request("start", port=self.port, rdrive=self.rdrive_folder, options=options)
+            else:
+                self.client.request(cmd)
+        except Exception as e:
+            log.error("recorder process %s failed: %s", cmd, e)
+            if cmd != "clear":
+                self.client_error = cmd
+        self.client_busy = False
+
+    def check_state(self):
+        """Recorder process: follow its real state, the request runs in the background."""
+        if self.client_busy:
+            return
+        if self.client_error is not None:
+            self.client_error = None
+            self.set_state("error")
+            return
+        if self.polling:
+            return  # slow service: the previous request is still waiting
+        self.polling = True
+        events = self.tabs.currentWidget() is self.tab2
+        threading.Thread(target=self.poll_status, args=(events,), daemon=True).start()
+
+    def poll_status(self, events):
+        try:
+            status = self.client.request("status")
+            if events:
+                status["events"] = self.client.request("log", n=EVENTS)["events"]
+        except Exception:
+            status = {"running": False}  # recorder process not running
+        self.polling = False
+        self.status_ready.emit(status)  # apply_status() on the GUI thread
+
+    def apply_status(self, status):
+        if self.client_busy:
+            return  # start/stop sent since the request
+        self.battery_status = status.get("battery")
+        self.alarm_status = status.get("alarms")
+        self.metrics_status = status.get("metrics")
+        if "events" in status:
+            self.events_status = status["events"]
+
+        if status["running"] and self.state != "running":
+            self.rdrive_folder = self.folderLineEdit.text()
+            self.warning_msg = os.path.join(self.rdrive_folder, "battery_warning.txt")
+            self.filename = status["filename"]
+            self.set_state("running", status["started"])
+        elif not status["running"] and self.state in ("running", "stopping"):
+            self.set_state("stopped")
+
+    def set_state(self, state, started=None):
+        self.state = state
+        if state == "running":
+            # initiate battery plot: battery plot updated less (every few minutes)
+            # than wind plot, so display values on GUI at the beginning.
+            self.battery_state = 1  # 1: normal, 0: dead
+            self.plot_voltage()
+            self.timer_plot.start()
+            self.timer_battery.start()
+
+            self.StartButton.setEnabled(False)
+            self.ClearButton.setEnabled(True)
+            self.StopButton.setEnabled(True)
+            if started is None:
+                started = time.time()
+            self.startText = "Started at: %s. " % time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started))
+            self.hintLabel.setText(self.startText)
+            return
 
         self.timer_plot.stop()
         self.timer_battery.stop()
-
-        self.StartButton.setEnabled(True)
+        self.StartButton.setEnabled(state in ("stopped", "error"))
         self.ClearButton.setEnabled(False)
         self.StopButton.setEnabled(False)
+        if state == "starting":
+            self.hintLabel.setText("Starting...")
+        elif state == "stopping":
+            self.hintLabel.setText("Stopping: saving data...")
+        elif state == "stopped":
+            self.hintLabel.setText("Stopped at: %s. " % time.strftime("%Y-%m-%d %H:%M:%S"))
+        else:
+            self.hintLabel.setText(" ! Error start.")
 
-        # copy last file to R drive
-        file_path = os.path.join(LOCAL_DATA_PATH, filename[:8], filename + ".csv")
-        r_folder_path = os.path.join(self.rdrive_folder, filename[:8])
-        try:
-            shutil.copy2(file_path, r_folder_path)  # source, destination
-        except:
-            print("copy last file to r-drive failed: %s.csv" % filename)
-
-        self.hintLabel.setText("Stopped at: %s. " % time.strftime("%Y-%m-%d %H:%M:%S"))
-
+    def stop(self):
+        self.set_state("stopping")
+        # recorder flushes and copies last file to R drive
+        if self.client is not None:
+            threading.Thread(target=self.client_command, args=("stop",), daemon=True).start()
+        else:
+            self.worker.stop_event.set()
 
     def clear_plots(self):
-        global clearplot
-        clearplot = 1
+        if self.client is not None:
+            threading.Thread(target=self.client_command, args=("clear",), daemon=True).start()
+        else:
+            self.worker.commands.put("clear")
 
 
     def brouse_folder(self):
@@ -989,27 +1002,26 @@ class Window(QWidget):
         self.portComboBox.addItems(PORTLIST)
 
     def port_detect(self):
+        """Detect button: check the port in the background, show_port() shows the result."""
         port = self.portComboBox.currentText()
-        print(port, BAUDRATE)
-        
-        wind = serial.Serial(port, BAUDRATE, timeout = 5)
-        x = wind.readline().decode()
-        if x:
-            with open("par1/port.txt", "w") as f:
-                f.write(port)
-            self.portHintLabel.setText("\u2713")
-            print("Anemometer connected.")
-            # print(x)
-            return 1
-        else:
-            self.portHintLabel.setText("\u2717")
-            print("Anemometer NOT connected.")
-            return 0
+        self.portHintLabel.setText("...")
+        threading.Thread(target=lambda: self.port_detected.emit(detect_port(port, BAUDRATE)), daemon=True).start()
+
+    def show_port(self, ok):
+        self.portHintLabel.setText("\u2713" if ok else "\u2717")
+        print("Anemometer connected." if ok else "Anemometer NOT connected.")
+        if not ok and self.state == "starting":
+            self.set_state("error")
+            self.hintLabel.setText(" ! Anemometer is not connected.")
+
 
 
 def main():
     app = QApplication(sys.argv)
+    logs.setup("gui_gmx500", LOCAL_DATA_PATH)
     window = Window()
+    # kill -USR1 <pid>: profile GUI and recorder threads, saved next to the data
+    profiler.install_signal(LOCAL_DATA_PATH)
     app.setWindowIcon(QIcon("icons/p2.jpeg"))
     window.show()
     app.exec()
@@ -7,21 +7,22 @@ BAUDRATE = 19200
 DATA_RATE = 4  # Hz, data output rate
 
 # GUI
-LOCAL_DATA_PATH = "/home/picarro/Wind_data"  # folder to save data locally
+LOCAL_DATA_PATH = "/home/picarro/Wind_data"  # folder to save data locally, alarm_rules.json / event_rules.json in it
 GUI_REFRESH_TIME = 1  # s
 PLOT_WINDOW = 5  # min, time length for GUI data display
 MONTH = 6  # delete files that is how many months old
-HEADER = "epoch_time,local_clock_time,U_velocity_NS,V_velocity_WE,speed,direction\n"  # csv header
+TMPFS_STAGING = 0  # 1: keep the active hour file in RAM, flush to SD card every few minutes
+EVENTS = 20  # recent log events shown in the Settings tab
 
 import sys
 import platform
 import os
 import shutil
 import time
-from datetime import datetime
+import queue
+import threading
 import numpy as np
 import pandas as pd
-import csv
 
 import serial
 import serial.tools.list_ports as ls
@@ -104,152 +105,98 @@ from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qtagg import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
 
-from windrose import WindroseAxes
 
 # customized files
 import style
-
-global stoprun  # 1 stop thread, 0 keep running
-global clearplot  # 1 clear plots, 0 not
-
-
-def wind_uv_to_dir(U, V):
-    """
-    Calculates the wind direction from the u and v component of wind.
-    Takes into account the wind direction coordinates is different than the
-    trig unit circle coordinate. If the wind directin is 360 then returns zero
-    (by %360)
-    Inputs:
-      U = west/east direction (wind from the west is positive, from the east is negative)
-      V = south/noth direction (wind from the south is positive, from the north is negative)
-    """
-    WDIR = (270 - np.rad2deg(np.arctan2(U, V))) % 360
-    return WDIR
-
-TEMP_FILE = os.path.join(LOCAL_DATA_PATH, "temp.csv")
-with open(TEMP_FILE, 'w', newline='') as f:
-    pass
+import plots
+import windstats
+import instrument
+import logs
+import profiler
+import staging
+from recorder import WindSonicRecorder, SHM_WINDSONIC, detect_port, rules_options, STATS_INTERVAL
+from shm_ring import read_latest
+
+STAGING_DIR = staging.TMPFS_PATH if TMPFS_STAGING else None
+log = logs.get_logger("gui")
     
 
 # Step 1: Create a worker class
 class Worker(QObject):
     finished = Signal()
     progress = Signal(str)
+    state = Signal(str)  # "running", "stopped", "error"
+    detected = Signal(bool)  # anemometer port checked, False: not started
+
+    def __init__(self, port):
+        super().__init__()
+        self.port = port
+        # control from the GUI thread
+        self.stop_event = threading.Event()
+        self.commands = queue.Queue()  # "clear"
+        self.rec = None  # the Settings tab reads its metrics
 
     def run(self):
         """Long-running task."""
-        global stoprun
-        stoprun = 0
-        global clearplot
-        clearplot = 0
-
-        with open("par1/port.txt", "r") as f:
-            PORT = f.read()  # '/dev/ttyUSB2'
+        PORT = self.port  # '/dev/ttyUSB2'
+        # up to 2 s on a silent port, here and not on the GUI thread
+        ok = detect_port(PORT, BAUDRATE)
+        self.detected.emit(ok)
+        if not ok:
+            self.finished.emit()
+            return
+        with open("par1/port.txt", "w") as f:
+            f.write(PORT)
 
         with open("par1/rdrive.txt", "r") as f:
             RDRIVE_FOLDER = f.read()
 
-        wind = serial.Serial(PORT, BAUDRATE)
-        print('anemometer USB port: ', wind.name)
-
-        filename = time.strftime("%Y%m%d_%H")
-        self.progress.emit(filename)
-
-        # create folder of the day on local drive
-        local_folder_day = os.path.join(LOCAL_DATA_PATH, filename[:8])
-        if not os.path.isdir(local_folder_day):
-            os.mkdir(local_folder_day)
-
-        local_file_path = os.path.join(local_folder_day, filename + ".csv")
-        with open(local_file_path, "w") as f:
-            f.write(HEADER)
-
-        # create folder of the day on r-drive
-        r_folder_day = os.path.join(RDRIVE_FOLDER, filename[:8])
-        if not os.path.isdir(r_folder_day):
-            os.mkdir(r_folder_day)
-            
-        uncopied = []  # uncopied csv files, try again later
-        plot_data = []
-
-        while True:
-            if stoprun:
-                break
-                
-            if clearplot:
-                plot_data = []
-                clearplot = 0
-                print('plot cleared.')
-
-            epoch = time.time()
-            # use pandas library default time format, to ms
-            clock_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-
-            now = time.strftime("%Y%m%d_%H")  # 20240712_14
-            
-            # create a new csv every hour and copy to r-drive
-            if now[-2:] != filename[-2:]:
-                # copy previous hour csv to r-drive
-                try:
-                    shutil.copy2(local_file_path, r_folder_day)  # source, destination
-                except:
-                    uncopied.append([local_file_path, r_folder_day])
-                    print("- copy to r-drive failed: %s.csv" % filename)
-                    
-                # data failed to copy now try again
-                if uncopied:
-                    for i in range(len(uncopied)):
-                        try:
-                            shutil.copy2(uncopied[0][0], uncopied[0][1])
-                            print("* copy to r-drive successful: %s.csv" % uncopied[0][0])
-                            uncopied.pop(0)
-                        except:
-                            pass
-
-                # create a new folder every day
-                if (now[-2:] == "00") and (filename[-2:] == "23"):
-                    # locally
-                    local_folder_day = os.path.join(LOCAL_DATA_PATH, now[:8])
-                    os.mkdir(local_folder_day)
-
-                    # on r-drive
-                    r_folder_day = os.path.join(RDRIVE_FOLDER, now[:8])
-                    os.mkdir(r_folder_day)                
-                
-                filename = now
-                local_file_path = os.path.join(local_folder_day, filename + ".csv")
-                with open(local_file_path, "w") as f:
-                    f.write(HEADER)
-                self.progress.emit(filename)
-
-            x = wind.readline().decode()
-            y = x.split(',')
-            u = float(y[1])  # u axis speed, NS
-            v = float(y[2])  # v axis speed, WE
-
-            wind_speed = np.sqrt(u ** 2 + v ** 2)
-            wind_dir = wind_uv_to_dir(u, v)
-
-            with open(local_file_path, "a") as f:
-                # need a space before clock time so excel reads it as string
-                f.write("%s, %s,%s,%s,%s,%s\n" % (epoch, clock_time, u, v,wind_speed,wind_dir))
-
-            # data for plotting
-            plot_data.append([epoch, u, v, wind_speed, wind_dir])
-            n = PLOT_WINDOW * DATA_RATE * 60
-            if len(plot_data) > n:
-                plot_data.pop(0)
-
-            with open(TEMP_FILE, 'w', newline='') as f:
-                write = csv.writer(f)
-                write.writerows(plot_data)
+        rec = None
+        try:
+            rec = WindSonicRecorder(PORT, RDRIVE_FOLDER, PLOT_WINDOW, DATA_RATE,
+                                    local_data_path=LOCAL_DATA_PATH, staging_dir=STAGING_DIR,
+                                    on_rotate=self.progress.emit, **rules_options(LOCAL_DATA_PATH))
+            rec.start()
+            self.rec = rec
+        except Exception as e:
+            log.error("start failed: %s", e)
+            if rec is not None:
+                rec.close()
+            self.state.emit("error")
+            self.finished.emit()
+            return
+        self.state.emit("running")
 
+        try:
+            stats_tag = time.time()
+            while not self.stop_event.wait(0.1):
+                try:
+                    while True:
+                        if self.commands.get_nowait() == "clear":
+                            rec.clear()
+                except queue.Empty:
+                    pass
+                if time.time() - stats_tag > STATS_INTERVAL:
+                    log.info(rec.pipe.stats_line())
+                    log.info(rec.metrics_line())
+                    stats_tag = time.time()
+
+            # flush staged data, then copy last file to R drive
+            if not rec.stop():
+                log.warning("stop: copy last file to r-drive not finished, will keep trying.")
+        finally:
+            rec.close()  # remove the shared memory, the next Start creates it again
+        self.state.emit("stopped")
         self.finished.emit()
 
 
 class Window(QWidget):
+    port_detected = Signal(bool)  # result of detect_port() in a background thread
+
     def __init__(self):
         super().__init__()
+        self.state = "stopped"
+        self.port_detected.connect(self.show_port)
         self.setGeometry(200, 200, 1200, 800)
         self.setWindowTitle("Wind")
         self.set_window_layout()
@@ -360,6 +307,13 @@ class Window(QWidget):
         self.timer_plot.setInterval(GUI_REFRESH_TIME * DATA_RATE * 1000)
         self.timer_plot.timeout.connect(self.plot_wind)
 
+        # Settings tab: latency of the recording loop and of the GUI refresh
+        self.instr = instrument.Instruments()
+        self.timer_perf = QTimer()
+        self.timer_perf.setInterval(5000)
+        self.timer_perf.timeout.connect(self.show_metrics)
+        self.timer_perf.start()
+
 
     def createLayout1(self):  # tab1
         layout1 = QHBoxLayout()
@@ -515,8 +469,30 @@ class Window(QWidget):
         box2.setStyleSheet(style.box5())
         box2.setLayout(layout2)
 
+        # recording loop latency and frame counters
+        box3 = QGroupBox("Performance:")
+        box3.setStyleSheet(style.box5())
+        layout4 = QVBoxLayout()
+        layout4.setContentsMargins(20, 40, 20, 10)
+        box3.setLayout(layout4)
+        self.perfLabel = QLabel("Not recording.")
+        self.perfLabel.setStyleSheet("font-family: monospace;")
+        layout4.addWidget(self.perfLabel)
+
+        # recent log events of the recorder
+        box4 = QGroupBox("Recent Events:")
+        box4.setStyleSheet(style.box5())
+        layout5 = QVBoxLayout()
+        layout5.setContentsMargins(20, 40, 20, 10)
+        box4.setLayout(layout5)
+        self.eventsText = QTextEdit()
+        self.eventsText.setReadOnly(True)
+        layout5.addWidget(self.eventsText)
+
         leftlayout.addWidget(box1)
         leftlayout.addWidget(box2)
+        leftlayout.addWidget(box3)
+        leftlayout.addWidget(box4)
         leftlayout.addLayout(layout3)
         leftlayout.addStretch()
 
@@ -625,8 +601,12 @@ class Window(QWidget):
     ## functions
     # delete files saved 3 months ago
     def delete_folders(self):
-        folders = [name for name in os.listdir(LOCAL_DATA_PATH) if os.path.isdir(os.path.join(LOCAL_DATA_PATH, name))]
+        # day folders only: logs, staging or other folders next to them are kept
+        folders = [name for name in os.listdir(LOCAL_DATA_PATH)
+                   if len(name) == 8 and name.isdigit() and os.path.isdir(os.path.join(LOCAL_DATA_PATH, name))]
         folders.sort()
+        if not folders:
+            return
         # print(folders)
         epoch1 = int(time.mktime(time.strptime(folders[0], "%Y%m%d")))
         epoch_now = int(time.time())
@@ -646,7 +626,7 @@ class Window(QWidget):
                     epoch1 = int(time.mktime(time.strptime(name, "%Y%m%d")))
                     if (epoch_now - epoch1) > 2628000 * MONTH:
                         shutil.rmtree(os.path.join(LOCAL_DATA_PATH, name))
-                        print('Delete folder: ', name)
+                        log.info("delete folder: %s", name)
                     else:
                         break
             else:
@@ -655,24 +635,10 @@ class Window(QWidget):
 
     # real time display and plot
     def plot_wind(self):
+        t0 = time.perf_counter()
         try:
-            # time series plot
-            self.figure1.clear()
-            ax1 = self.figure1.add_subplot(111)
-            box = ax1.get_position()
-            box.x0 = box.x0 + 0.05
-            box.x1 = box.x1 + 0.05
-            box.y0 = box.y0 - 0.02
-            box.y1 = box.y1 + 0.05
-            ax1.set_position(box)
-
-            n = os.path.getsize(TEMP_FILE)
-            if n:
-                data = np.genfromtxt(TEMP_FILE, delimiter=',')
-                # epoch, u, v, wind_speed, wind_dir
-                # this line produces warning, is suppressed
-            else:
-                data= []
+            # live data from shared memory: epoch, u, v, wind_speed, wind_dir
+            data = read_latest(SHM_WINDSONIC, PLOT_WINDOW * DATA_RATE * 60)
 
             if data.size:
                 epoch_time = data[:, 0]
@@ -681,32 +647,15 @@ class Window(QWidget):
                 wind_speed = data[:, 3]
                 wind_dir = data[:, 4]
 
-                ax1.quiver(epoch_time, wind_speed, wind_v, wind_u)
-
-                # axis label
-                ax1.set_xlabel("Local Clock Time: %s" % (time.strftime("%Y-%m-%d")))
-                ax1.set_ylabel("Wind Speed, m/s", fontsize=10)
-
-                # add mark for every minute
-                xx = list(epoch_time[::DATA_RATE * 60])
-                xmak = []
-                for i in xx:
-                    a = time.strftime('%H:%M', time.localtime(i))
-                    xmak.append(a)
-                ax1.set_xticks(xx)
-                ax1.set_xticklabels(xmak, fontsize=8)
-
+                # time series plot
+                plots.draw_wind_series(self.figure1, epoch_time, wind_u, wind_v, wind_speed, DATA_RATE)
                 self.canvas1.draw()
 
                 # windrose plot
-                self.figure2.clear()
-                rect = [0.1, 0.2, 0.8, 0.7]
-                ax = WindroseAxes(self.figure2, rect)
-                self.figure2.add_axes(ax)
-
-                ax.bar(wind_dir, wind_speed, normed=True, opening=0.8, edgecolor='white')
-                ax.set_legend(title='Wind Speed in m/s', bbox_to_anchor=(-0.1, -0.27))
+                title = plots.stats_title(windstats.batch(wind_u, wind_v, rate=DATA_RATE))
+                plots.draw_windrose(self.figure2, wind_dir, wind_speed, title)
                 self.canvas2.draw()
+                self.instr.record("gui_refresh", time.perf_counter() - t0)
 
                 # real time values
                 self.uLabel.setText(str(wind_u[-1]))
@@ -716,14 +665,32 @@ class Window(QWidget):
         except:
             self.hintLabel.setText(self.startText + " !Real time display failed.")
 
+    def show_metrics(self):
+        # only while the Settings tab is shown
+        if self.tabs.currentWidget() is not self.tab2:
+            return
+        x = None
+        try:
+            worker = getattr(self, "worker", None)
+            if worker is not None and worker.rec is not None:
+                x = worker.rec.metrics()
+        except Exception:
+            pass
+        self.eventsText.setPlainText("\n".join(logs.recent(EVENTS)))
+        if x is None:
+            self.perfLabel.setText("Not recording.")
+            return
+        x["histograms"]["gui_refresh"] = self.instr.hist("gui_refresh").summary()
+        self.perfLabel.setText(instrument.format_snapshot(x))
+
     def reportProgress(self, x):
         self.filename = x  # 20240712_14
 
-    def runLongTask(self):
+    def runLongTask(self, port):
         # Step 2: Create a QThread object
         self.thread = QThread()
         # Step 3: Create a worker object
-        self.worker = Worker()
+        self.worker = Worker(port)
         # Step 4: Move worker to the thread
         self.worker.moveToThread(self.thread)
         # Step 5: Connect signals and slots
@@ -732,15 +699,15 @@ class Window(QWidget):
         self.worker.finished.connect(self.worker.deleteLater)
         self.thread.finished.connect(self.thread.deleteLater)
         self.worker.progress.connect(self.reportProgress)
+        self.worker.state.connect(self.set_state)
+        self.worker.detected.connect(self.show_port)
         # Step 6: Start the thread
         self.thread.start()
 
 
     def start(self):
-        # error check
-        tag = self.port_detect()
-        if not tag:
-            self.hintLabel.setText(" ! Anemometer is not connected.")
+        # error check, the port is checked by the worker (show_port)
+        tag = 1
 
         '''
         if 0:
@@ -778,47 +745,43 @@ class Window(QWidget):
 
         if tag:
             print('3')
-            try:
-                self.runLongTask()
-                print('running long task')
-                time.sleep(3)
-                self.timer_plot.start()                
-
-                self.StartButton.setEnabled(False)
-                self.ClearButton.setEnabled(True)
-                self.StopButton.setEnabled(True)
-                # print('Record started.')
-                self.startText = "Started at: %s. " % time.strftime("%Y-%m-%d %H:%M:%S")
-                self.hintLabel.setText(self.startText)
-            except:
-                self.hintLabel.setText(" ! Error start.")
-
-
-    def stop(self):
-        filename = time.strftime("%Y%m%d_%H")
-        global stoprun
-        stoprun = 1
+            self.set_state("starting")
+            self.runLongTask(self.portComboBox.currentText())
+            print('running long task')
+
+    # buttons and hint follow the worker: "starting", "running", "stopping", "stopped", "error"
+    def set_state(self, state):
+        self.state = state
+        if state == "running":
+            self.timer_plot.start()
+            self.StartButton.setEnabled(False)
+            self.ClearButton.setEnabled(True)
+            self.StopButton.setEnabled(True)
+            # print('Record started.')
+            self.startText = "Started at: %s. " % time.strftime("%Y-%m-%d %H:%M:%S")
+            self.hintLabel.setText(self.startText)
+            return
 
         self.timer_plot.stop()
-        self.StartButton.setEnabled(True)
+        self.StartButton.setEnabled(state in ("stopped", "error"))
         self.ClearButton.setEnabled(False)
         self.StopButton.setEnabled(False)
-        # print('Record stopped.')
-
-        # copy last file to R drive
-        file_path = os.path.join(LOCAL_DATA_PATH, filename[:8], filename + ".csv")
-        r_folder_path = os.path.join(self.rdrive_folder, filename[:8])
-        try:
-            shutil.copy2(file_path, r_folder_path)  # source, destination
-        except:
-            print("copy last file to r-drive failed: %s.csv" % filename)
-
-        self.hintLabel.setText("Stopped at: %s. " % time.strftime("%Y-%m-%d %H:%M:%S"))
+        if state == "starting":
+            self.hintLabel.setText("Starting...")
+        elif state == "stopping":
+            self.hintLabel.setText("Stopping: saving data...")
+        elif state == "stopped":
+            # print('Record stopped.')
+            self.hintLabel.setText("Stopped at: %s. " % time.strftime("%Y-%m-%d %H:%M:%S"))
+        else:
+            self.hintLabel.setText(" ! Error start.")
 
+    def stop(self):
+        self.set_state("stopping")
+        self.worker.stop_event.set()  # worker flushes and copies last file to R drive
 
     def clear_plots(self):
-        global clearplot
-        clearplot = 1
+        self.worker.commands.put("clear")
 
 
     def brouse_folder(self):
@@ -832,25 +795,26 @@ class Window(QWidget):
         self.portComboBox.addItems(PORTLIST)
 
     def port_detect(self):
+        """Detect button: check the port in the background, show_port() shows the result."""
         port = self.portComboBox.currentText()
-        wind = serial.Serial(port, BAUDRATE, timeout = 5)
-        x = wind.readline().decode()
-        if x:
-            with open("par1/port.txt", "w") as f:
-                f.write(port)
-            self.portHintLabel.setText("\u2713")
-            print("Anemometer connected.")
-            # print(x)
-            return 1
-        else:
-            self.portHintLabel.setText("\u2717")
-            print("Anemometer NOT connected.")
-            return 0
+        self.portHintLabel.setText("...")
+        threading.Thread(target=lambda: self.port_detected.emit(detect_port(port, BAUDRATE)), daemon=True).start()
+
+    def show_port(self, ok):
+        self.portHintLabel.setText("\u2713" if ok else "\u2717")
+        print("Anemometer connected." if ok else "Anemometer NOT connected.")
+        if not ok and self.state == "starting":
+            self.set_state("error")
+            self.hintLabel.setText(" ! Anemometer is not connected.")
+
 
 
 def main():
     app = QApplication(sys.argv)
+    logs.setup("gui_windsonic", LOCAL_DATA_PATH)
     window = Window()
+    # kill -USR1 <pid>: profile GUI and recorder threads, saved next to the data
+    profiler.install_signal(LOCAL_DATA_PATH)
     app.setWindowIcon(QIcon("icons/p2.jpeg"))
     window.show()
     app.exec()
@@ -0,0 +1,129 @@
+# Lightweight latency histograms and counters for the recording loop.
+# HDR style: log-linear buckets, constant relative error, O(1) record, fixed memory.
+# Recorders keep one Instruments, shown in the GUI Settings tab and the GMX500.py stats line.
+
+import math
+import threading
+
+ENABLED = 1  # 0: record() and count() do nothing
+SUB_BUCKETS = 16  # per power of 2, ~3% resolution
+MAX_EXPONENT = 32  # up to 2^32 us, about 71 min
+
+
+class Histogram(object):
+    """
+    Latency histogram, values in seconds, stored in microsecond buckets.
+    Bucket of value x (us): exponent e of x, then SUB_BUCKETS linear steps inside [2^e, 2^(e+1)).
+    """
+    def __init__(self):
+        self.counts = [0] * (SUB_BUCKETS * (MAX_EXPONENT + 1))
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def index(us):
+        if us < SUB_BUCKETS:
+            return int(us)
+        m, e = math.frexp(us)  # us = m * 2^e, 0.5 <= m < 1
+        e = min(e, MAX_EXPONENT + 1)
+        return (e - 4) * SUB_BUCKETS + int((m * 2 - 1) * SUB_BUCKETS)
+
+    @staticmethod
+    def value(i):
+        """Upper edge (us) of bucket i."""
+        if i < SUB_BUCKETS:
+            return i + 1
+        e, s = divmod(i, SUB_BUCKETS)
+        return (1 + (s + 1) / SUB_BUCKETS) * 2 ** (e + 3)
+
+    def record(self, seconds):
+        if not ENABLED:
+            return
+        us = seconds * 1e6
+        self.counts[self.index(us)] += 1
+        self.n += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Value (s) below which q percent of the samples are, 0 if empty."""
+        if not self.n:
+            return 0.0
+        target = max(q / 100.0 * self.n, 1)
+        c = 0
+        for i, k in enumerate(self.counts):
+            c += k
+            if c >= target:
+                return min(self.value(i) / 1e6, self.max)
+        return self.max
+
+    def merge(self, other):
+        for i, k in enumerate(other.counts):
+            self.counts[i] += k
+        self.n += other.n
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        """n and mean/p50/p90/p99/max in ms."""
+        return {
+            "n": self.n,
+            "mean_ms": 1000 * self.total / max(self.n, 1),
+            "p50_ms": 1000 * self.percentile(50),
+            "p90_ms": 1000 * self.percentile(90),
+            "p99_ms": 1000 * self.percentile(99),
+            "max_ms": 1000 * self.max,
+        }
+
+
+class Instruments(object):
+    """Named histograms and counters, created on first use."""
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()  # only for creating new names
+
+    def hist(self, name):
+        h = self.histograms.get(name)
+        if h is None:
+            with self.lock:
+                h = self.histograms.setdefault(name, Histogram())
+        return h
+
+    def record(self, name, seconds):
+        if ENABLED:
+            self.hist(name).record(seconds)
+
+    def count(self, name, n=1):
+        if ENABLED:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        """Json friendly: {"histograms": {name: summary}, "counters": {name: n}}"""
+        return {
+            "histograms": {name: h.summary() for name, h in list(self.histograms.items())},
+            "counters": dict(self.counters),
+        }
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+def format_snapshot(x, line=False):
+    """Text of a snapshot: one stats line, or a table for the GUI."""
+    counters = ", ".join("%s %s" % (k, v) for k, v in sorted(x["counters"].items()))
+    if line:
+        h = " | ".join("%s p50 %.2f p99 %.2f max %.1f ms" % (k, s["p50_ms"], s["p99_ms"], s["max_ms"])
+                       for k, s in x["histograms"].items())
+        return "%s | %s" % (counters, h)
+
+    rows = ["%-12s %8s %8s %8s %8s %8s" % ("ms", "n", "p50", "p90", "p99", "max")]
+    for k, s in x["histograms"].items():
+        rows.append("%-12s %8d %8.2f %8.2f %8.2f %8.1f" %
+                    (k, s["n"], s["p50_ms"], s["p90_ms"], s["p99_ms"], s["max_ms"]))
+    rows.append(counters)
+    return "\n".join(rows)
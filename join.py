@@ -0,0 +1,257 @@
+# Join analyzer data (Picarro .dat or any csv with an epoch column) with the wind
+# archive: every analyzer row gets the wind at its time (merge-asof or linear
+# interpolation, within a tolerance), or both are resampled to a regular time grid.
+# Directions are interpolated as vectors: between 350 and 10 deg is 0, not 180.
+# The analyzer files are read in chunks of rows, the wind of each chunk comes from
+# loader.load_range() (sorted epoch arrays, parsed-hour cache), output rows are
+# written chunk by chunk: memory does not grow with the length of the period.
+# --gps-time: the wind at its GPS-corrected time (timing.py: host clock offset, drift
+# and latency removed) instead of the Pi clock, for an analyzer on UTC (NTP).
+#
+# $ python join.py /data/picarro/2024/10/*/*.dat --out joined.csv
+# $ python join.py analyzer.csv --time-column epoch --method linear --tolerance 2 --out joined.csv
+# $ python join.py /data/picarro/*.dat --grid 60 --method linear --columns CH4 CO2_dry --out 1min.csv
+# $ python join.py /data/picarro/2024/10/*/*.dat --gps-time --out joined.csv
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+# customized files
+import loader
+
+METHODS = ("nearest", "backward", "forward", "linear")
+TIME_COLUMN = "EPOCH_TIME"  # Picarro .dat
+TEXT_COLUMNS = ("DATE", "TIME")  # Picarro .dat, not numeric
+WIND_COLUMNS = {"gmx500": ["Corrected_Direction", "Corrected_Speed_m/s", "Pressure_hPa", "Temperature_C",
+                           "Relative_Humidity_%"],
+                "windsonic": ["direction", "speed"]}
+TOLERANCE = 1.0  # s, largest time difference to a wind sample that is still joined
+CHUNK_ROWS = 200000  # analyzer rows per chunk
+WRITE_ROWS = 20000  # rows formatted per write
+
+
+def is_angle(name):
+    return "direction" in name.lower()
+
+
+def align(target, epoch, columns, method="nearest", tolerance=TOLERANCE):
+    """
+    Values of columns (dict of arrays sorted by epoch) at the target times.
+    nearest/backward/forward: the sample closest / at or before / at or after the target,
+    linear: interpolated between the samples before and after (angles as unit vectors).
+    Targets without a sample within tolerance get nan.
+    Returns (dict of arrays, lag: sample time - target, nan for linear).
+    """
+    target = np.asarray(target, dtype=float)
+    n = len(epoch)
+    out = {}
+    if not n:
+        return {c: np.full(len(target), np.nan) for c in columns}, np.full(len(target), np.nan)
+    i = np.searchsorted(epoch, target, side="right")  # epoch[i - 1] <= target < epoch[i]
+    lo = np.clip(i - 1, 0, n - 1)
+    hi = np.clip(i, 0, n - 1)
+    d_lo = target - epoch[lo]  # >= 0 where i > 0
+    d_hi = epoch[hi] - target  # > 0 where i < n
+    ok_lo = (i > 0) & (d_lo <= tolerance)
+    ok_hi = (i < n) & (d_hi <= tolerance)
+
+    if method == "linear":
+        exact = ok_lo & (d_lo == 0)
+        ok = exact | (ok_lo & ok_hi)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            w = np.where(exact, 0.0, d_lo / (d_lo + d_hi))
+            for c, a in columns.items():
+                if is_angle(c):
+                    r = np.deg2rad(a)
+                    s = (1 - w) * np.sin(r[lo]) + w * np.sin(r[hi])
+                    k = (1 - w) * np.cos(r[lo]) + w * np.cos(r[hi])
+                    y = np.rad2deg(np.arctan2(s, k)) % 360
+                    y[y >= 360] = 0.0  # -1e-15 % 360
+                else:
+                    y = (1 - w) * a[lo] + w * a[hi]
+                out[c] = np.where(ok, y, np.nan)
+        return out, np.full(len(target), np.nan)
+
+    if method == "backward":
+        idx, ok = lo, ok_lo
+    elif method == "forward":
+        exact = ok_lo & (d_lo == 0)
+        idx, ok = np.where(exact, lo, hi), exact | ok_hi
+    else:
+        use_hi = ok_hi & (~ok_lo | (d_hi < d_lo))
+        idx, ok = np.where(use_hi, hi, lo), ok_lo | ok_hi
+    for c, a in columns.items():
+        out[c] = np.where(ok, a[idx], np.nan)
+    return out, np.where(ok, epoch[idx] - target, np.nan)
+
+
+class AnalyzerReader(object):
+    """
+    Chunks of numeric analyzer columns from text files, in file order:
+    whitespace separated (Picarro .dat) or csv, one header line per file.
+    Yields (epoch array sorted, dict of column arrays); unparsable rows are skipped.
+    """
+    def __init__(self, paths, time_column=TIME_COLUMN, columns=None, chunk_rows=CHUNK_ROWS):
+        self.paths = paths
+        self.time_column = time_column
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.skipped = 0
+
+    def header(self, path):
+        with open(path, errors="replace") as f:
+            line = f.readline()
+        sep = "," if "," in line else None
+        names = [x.strip() for x in line.split(sep)]
+        if self.time_column not in names:
+            raise KeyError("%s: no time column %r" % (path, self.time_column))
+        if self.columns is None:
+            self.columns = [c for c in names if c != self.time_column and c not in TEXT_COLUMNS]
+        missing = [c for c in self.columns if c not in names]
+        if missing:
+            raise KeyError("%s: no column %s" % (path, ", ".join(missing)))
+        return sep, [names.index(c) for c in [self.time_column] + self.columns]
+
+    def parse(self, lines, sep, idx):
+        try:
+            a = np.loadtxt(lines, delimiter=sep, usecols=idx, dtype=float, ndmin=2)
+        except ValueError:
+            rows = []
+            for line in lines:
+                y = line.split(sep)
+                try:
+                    rows.append([float(y[k]) for k in idx])
+                except (ValueError, IndexError):
+                    self.skipped += 1
+            a = np.array(rows, dtype=float).reshape(-1, len(idx))
+        return a
+
+    def chunk(self, parts):
+        a = np.vstack(parts)
+        a = a[np.argsort(a[:, 0], kind="stable")]
+        return a[:, 0], {c: a[:, k + 1] for k, c in enumerate(self.columns)}
+
+    def __iter__(self):
+        parts = []
+        rows = 0
+        for path in self.paths:
+            sep, idx = self.header(path)
+            with open(path, errors="replace") as f:
+                f.readline()
+                while True:
+                    lines = f.readlines(1 << 22)  # about 4 MB of text
+                    if not lines:
+                        break
+                    a = self.parse(lines, sep, idx)
+                    parts.append(a)
+                    rows += len(a)
+                    if rows >= self.chunk_rows:
+                        yield self.chunk(parts)
+                        parts, rows = [], 0
+        if rows:
+            yield self.chunk(parts)
+
+
+def wind_at(target, wind_columns, method, tolerance, root, cache_dir, gps_time=False):
+    """
+    Wind columns at the target times, from the hour files around them.
+    gps_time: target times are matched with the corrected wind times; hour files are
+    found by the raw times, so a large clock offset loads the range again, shifted.
+    """
+    if not len(target):
+        return {c: np.empty(0) for c in wind_columns}, np.empty(0)
+    margin = tolerance + 1.0
+    if not gps_time:
+        w = loader.load_range(target[0] - margin, target[-1] + margin, wind_columns, root, cache_dir)
+        epoch = w[loader.EPOCH]  # host clock steps back: rows out of order
+    else:
+        columns = wind_columns + [loader.CORRECTED]
+        w = loader.load_range(target[0] - margin, target[-1] + margin, columns, root, cache_dir)
+        if len(w[loader.EPOCH]):
+            shift = float(np.median(w[loader.EPOCH] - w[loader.CORRECTED]))  # raw - corrected: the offset
+            if abs(shift) > margin / 2:
+                w = loader.load_range(target[0] - margin + shift, target[-1] + margin + shift, columns, root,
+                                      cache_dir)
+        epoch = w[loader.CORRECTED]
+    if np.any(np.diff(epoch) < 0):
+        order = np.argsort(epoch, kind="stable")
+        epoch, w = epoch[order], {c: w[c][order] for c in wind_columns}
+    return align(target, epoch, {c: w[c] for c in wind_columns}, method, tolerance)
+
+
+def join(paths, out, wind_columns, root=loader.LOCAL_DATA_PATH, method="nearest", tolerance=TOLERANCE,
+         grid=None, time_column=TIME_COLUMN, columns=None, cache_dir=loader.CACHE_DIR, chunk_rows=CHUNK_ROWS,
+         gps_time=False):
+    """
+    Write the joined rows of the analyzer files to out (a csv path or file object).
+    grid: s, analyzer and wind both aligned to a regular grid instead of the analyzer times.
+    gps_time: wind at its GPS-corrected time, see wind_at().
+    Returns (rows written, analyzer rows read, rows skipped).
+    """
+    reader = AnalyzerReader(paths, time_column, columns, chunk_rows)
+    f = open(out, "w") if isinstance(out, str) else out
+    written = read = 0
+    header = False
+    prev = None  # last analyzer row of the previous chunk: grid points between two chunks
+    try:
+        for epoch, values in reader:
+            read += len(epoch)
+            if grid:
+                if prev is not None:
+                    epoch = np.concatenate([[prev[0]], epoch])
+                    values = {c: np.concatenate([[prev[1][c]], a]) for c, a in values.items()}
+                first = epoch[0] if prev is None else prev[0]
+                target = np.arange(np.ceil(first / grid) * grid, epoch[-1] + grid / 2, grid)
+                if prev is not None:
+                    target = target[target > prev[0]]
+                target = target[target <= epoch[-1]]
+                prev = (epoch[-1], {c: a[-1] for c, a in values.items()})
+                values, lag = align(target, epoch, values, method, tolerance)
+            else:
+                target = epoch
+            wind, lag = wind_at(target, wind_columns, method, tolerance, root, cache_dir, gps_time)
+            if not header:
+                header = True
+                f.write(",".join(["epoch_time"] + reader.columns + wind_columns + ["wind_lag_s"]) + "\n")
+            a = np.column_stack([target] + [values[c] for c in reader.columns] + [wind[c] for c in wind_columns] +
+                                [lag])
+            fmt = ",".join(["%.3f"] + ["%.10g"] * len(reader.columns) + ["%.7g"] * (len(wind_columns) + 1)) + "\n"
+            for k in range(0, len(a), WRITE_ROWS):
+                f.write("".join([fmt % tuple(r) for r in a[k:k + WRITE_ROWS].tolist()]))
+            written += len(a)
+    finally:
+        if isinstance(out, str):
+            f.close()
+    return written, read, reader.skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Join analyzer data with the wind archive")
+    parser.add_argument("paths", nargs="+", help="analyzer files (.dat or csv), in time order")
+    parser.add_argument("--out", default="-", help="output csv, - for stdout")
+    parser.add_argument("--root", default=loader.LOCAL_DATA_PATH, help="wind archive")
+    parser.add_argument("--model", choices=sorted(WIND_COLUMNS), default="gmx500")
+    parser.add_argument("--wind-columns", nargs="+", default=None, help="default by --model")
+    parser.add_argument("--method", choices=METHODS, default="nearest")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="s")
+    parser.add_argument("--grid", type=float, default=None, help="s, resample both to this grid")
+    parser.add_argument("--time-column", default=TIME_COLUMN)
+    parser.add_argument("--columns", nargs="+", default=None, help="analyzer columns, default all numeric")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--gps-time", action="store_true", help="wind at its GPS-corrected time (timing files)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    out = sys.stdout if args.out == "-" else args.out
+    written, read, skipped = join(args.paths, out, args.wind_columns or WIND_COLUMNS[args.model], args.root,
+                                  args.method, args.tolerance, args.grid, args.time_column, args.columns,
+                                  None if args.no_cache else loader.CACHE_DIR, gps_time=args.gps_time)
+    print("%s analyzer rows (%s skipped), %s rows written in %.1f s" %
+          (read, skipped, written, time.perf_counter() - t0), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
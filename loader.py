@@ -0,0 +1,207 @@
+# Load any time range of recorded data as numpy arrays (or a pandas DataFrame),
+# across day folders and hour files, only the columns asked for:
+#   x = loader.load_range("2024-10-10 06:00", "2024-10-17", ["Corrected_Direction", "Corrected_Speed_m/s"])
+#   x["epoch_time"], x["Corrected_Speed_m/s"]
+# Hour files are read in parallel threads and parsed once: every parsed column
+# is kept in an on-disk cache keyed by path, mtime and size of the hour file,
+# the second load of the same range only reads small .npy files.
+# "epoch_corrected": epoch_time on the GPS time scale, from the timing file of the
+# hour (timing.py, GMX500), epoch_time where there is none.
+# $ python loader.py 20241010 20241017 Corrected_Speed_m/s --root /home/picarro/Wind_data
+
+import argparse
+import hashlib
+import os
+import shutil
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# customized files
+import frames
+import timing
+
+LOCAL_DATA_PATH = "/home/picarro/Wind_data"
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "windpi")
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # oldest used entries are removed above this size
+READ_THREADS = 8
+EPOCH = "epoch_time"
+CORRECTED = timing.CORRECTED
+
+
+def to_epoch(x):
+    """epoch seconds from epoch, datetime, "2024-10-10", "2024-10-10 14:00", "20241010" or "20241010_14"."""
+    if isinstance(x, (int, float)):
+        return float(x)
+    if isinstance(x, datetime):
+        return x.timestamp()
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%Y%m%d_%H", "%Y%m%d"):
+        try:
+            return datetime.strptime(x, fmt).timestamp()
+        except ValueError:
+            pass
+    raise ValueError("unknown time format: %r" % (x,))
+
+
+def hour_paths(root, start, end):
+    """Existing hour files that may hold data of [start, end), local time file names."""
+    paths = []
+    t = start - start % 3600 - 3600  # files are named by local hour, DST shifts by one
+    while t < end + 3600:
+        name = time.strftime("%Y%m%d_%H", time.localtime(t))
+        p = os.path.join(root, name[:8], name + ".csv")
+        if os.path.isfile(p) and p not in paths:
+            paths.append(p)
+        t += 3600
+    return paths
+
+
+def cache_folder(path, cache_dir=CACHE_DIR):
+    """Cache entry of an hour file: a new mtime or size is a new entry."""
+    st = os.stat(path)
+    key = "%s|%s|%s" % (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+
+def parse_columns(path, columns):
+    """Only the given numeric columns of an hour csv, float64. Damaged files take the slow tolerant path."""
+    with open(path, errors="replace") as f:
+        names = f.readline().rstrip("\n").split(",")
+    for c in columns:
+        if c not in names:
+            raise KeyError("%s: no column %r" % (os.path.basename(path), c))
+        if c in frames.TEXT_COLUMNS:
+            raise ValueError("text column %r is not loaded" % c)
+    idx = [names.index(c) for c in columns]
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)  # header only: new hour file
+            a = np.loadtxt(path, delimiter=",", skiprows=1, usecols=idx, dtype=np.float64, ndmin=2)
+        return {c: np.ascontiguousarray(a[:, i]) for i, c in enumerate(columns)}
+    except ValueError:
+        # a row cut by a power loss or garbled frame
+        header, names, rows = frames.read_csv(path)
+        cols, values = frames.numeric(names, rows, columns)
+        return {c: np.array(v, dtype=np.float64) for c, v in zip(cols, values)}
+
+
+def read_hour(path, columns, cache_dir=CACHE_DIR):
+    """Columns of one hour file, from the cache where possible. Returns (arrays, parsed columns)."""
+    folder = cache_folder(path, cache_dir) if cache_dir else None
+    out = {}
+    missing = []
+    corrected = CORRECTED in columns
+    if corrected:
+        columns = [c for c in columns if c != CORRECTED]
+        if EPOCH not in columns:
+            columns.append(EPOCH)
+    for c in columns:
+        p = os.path.join(folder, c.replace("/", "_") + ".npy") if folder else None
+        if p and os.path.isfile(p):
+            try:
+                out[c] = np.load(p)
+                continue
+            except (OSError, ValueError):
+                pass  # half written, parse again
+        missing.append(c)
+    if missing:
+        out.update(parse_columns(path, missing))
+        if folder:
+            try:
+                os.makedirs(folder, exist_ok=True)
+                for c in missing:
+                    p = os.path.join(folder, c.replace("/", "_") + ".npy")
+                    np.save(p + ".tmp.npy", out[c])
+                    os.replace(p + ".tmp.npy", p)
+            except OSError:
+                pass  # read-only or full disk: works without cache
+    elif folder:
+        os.utime(folder)  # last use, for prune_cache()
+    if corrected:
+        out[CORRECTED] = timing.correct(path, out[EPOCH])  # not cached, the timing file may come later
+    return out, missing
+
+
+def load_range(start, end, columns=None, root=LOCAL_DATA_PATH, cache_dir=CACHE_DIR, as_frame=False,
+               threads=READ_THREADS):
+    """
+    Rows with start <= epoch_time < end of all hour files under root, as a dict of
+    float64 arrays (epoch_time always included), or a pandas DataFrame if as_frame.
+    columns: csv header names, default all numeric columns of the first file,
+             and CORRECTED (rows are still selected by the raw epoch_time).
+    cache_dir: None to parse without cache.
+    """
+    start, end = to_epoch(start), to_epoch(end)
+    paths = hour_paths(root, start, end)
+    if columns is None:
+        if not paths:
+            columns = []
+        else:
+            with open(paths[0], errors="replace") as f:
+                columns = [c for c in f.readline().rstrip("\n").split(",") if c not in frames.TEXT_COLUMNS]
+    columns = [EPOCH] + [c for c in columns if c != EPOCH]
+
+    with ThreadPoolExecutor(max(min(threads, len(paths)), 1)) as pool:
+        parts = list(pool.map(lambda p: read_hour(p, columns, cache_dir), paths))
+
+    x = {}
+    for c in columns:
+        x[c] = np.concatenate([p[0][c] for p in parts]) if parts else np.empty(0)
+    epoch = x[EPOCH]
+    sel = (epoch >= start) & (epoch < end)
+    if not sel.all():
+        x = {c: a[sel] for c, a in x.items()}
+    if cache_dir and any(p[1] for p in parts):
+        prune_cache(cache_dir)
+    if as_frame:
+        import pandas as pd
+        return pd.DataFrame(x)
+    return x
+
+
+def prune_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """Remove the least recently used entries until the cache is below max_bytes."""
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        folder = os.path.join(cache_dir, name)
+        try:
+            size = sum(e.stat().st_size for e in os.scandir(folder))
+            entries.append((os.stat(folder).st_mtime, size, folder))
+        except OSError:
+            continue
+        total += size
+    for mtime, size, folder in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(folder, ignore_errors=True)
+        total -= size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a time range of hour files, print a summary")
+    parser.add_argument("start", help="e.g. 20241010, 20241010_14, '2024-10-10 14:30'")
+    parser.add_argument("end")
+    parser.add_argument("columns", nargs="*", help="csv header names, default all numeric")
+    parser.add_argument("--root", default=LOCAL_DATA_PATH)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    x = load_range(args.start, args.end, args.columns or None, args.root,
+                   None if args.no_cache else CACHE_DIR)
+    dt = time.perf_counter() - t0
+    n = len(x[EPOCH])
+    print("%s rows, %s columns in %.3f s" % (n, len(x), dt))
+    for c, a in x.items():
+        if n:
+            print("%-24s %14.4f %14.4f %14.4f" % (c, np.nanmin(a), np.nanmean(a), np.nanmax(a)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Logging for recorders and GUIs: levels, a rotating log file on local disk,
+# a ring of recent events for the GUI, and rate limiting of repeated messages.
+# In a module:   log = logs.get_logger(__name__);  log.warning("start failed: %s", e)
+# Per-frame noise, opt-in: log.warning("invalid data: %r", x, extra=logs.LIMITED)
+# In a program:  logs.setup("gmx500")  once, at start.
+
+import collections
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+LOG_FOLDER = "/home/picarro/Wind_data"  # local disk, next to the data
+LOG_LEVEL = logging.INFO
+MAX_BYTES = 5 * 1024 * 1024  # rotate the log file at this size
+BACKUP_COUNT = 5  # rotated files kept
+RING_SIZE = 500  # recent events kept in memory for the GUI
+RATE_LIMIT_INTERVAL = 60  # s, a rate limited message is logged at most once per interval
+FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+ROOT = "windpi"
+RAW = ROOT + ".raw"  # raw frame echo, off unless enabled
+
+LIMITED = {"rate_limit": True}  # extra= of the messages to rate limit
+
+_ring = collections.deque(maxlen=RING_SIZE)
+
+
+def get_logger(name):
+    """Logger of a module, under the windpi root logger."""
+    return logging.getLogger(ROOT + "." + name.split(".")[-1])
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Pass a message logged with extra=LIMITED (same logger, same format string)
+    at most once per interval, the next one passed tells how many were suppressed.
+    Other messages (alarms, events, copies) always pass.
+    """
+    def __init__(self, interval=RATE_LIMIT_INTERVAL):
+        logging.Filter.__init__(self)
+        self.interval = interval
+        self.seen = {}  # key: [time passed, suppressed count]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        # one decision per record, the filter is shared by all handlers
+        decision = getattr(record, "_rate_ok", None)
+        if decision is not None:
+            return decision
+        record._rate_ok = self.decide(record)
+        return record._rate_ok
+
+    def decide(self, record):
+        if not getattr(record, "rate_limit", False):
+            return True
+        key = (record.name, record.msg)
+        now = time.time()
+        with self.lock:
+            x = self.seen.get(key)
+            if x is not None and now - x[0] < self.interval:
+                x[1] += 1
+                return False
+            suppressed = x[1] if x is not None else 0
+            self.seen[key] = [now, 0]
+        if suppressed:
+            record.msg = "%s (%s similar suppressed)" % (record.msg, suppressed)
+        return True
+
+
+class RingHandler(logging.Handler):
+    """Keeps formatted recent events in memory."""
+    def emit(self, record):
+        try:
+            _ring.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+def recent(n=None):
+    """Recent events, oldest first."""
+    x = list(_ring)
+    return x if n is None else x[-n:]
+
+
+def setup(name, folder=LOG_FOLDER, level=LOG_LEVEL, console=True, echo_raw=False):
+    """
+    Configure the windpi loggers once per process, log file: folder/windpi_<name>.log
+    echo_raw: print every raw anemometer frame (slow over SSH).
+    """
+    root = logging.getLogger(ROOT)
+    if getattr(root, "_windpi_setup", False):
+        return root
+    root.setLevel(level)
+    root.propagate = False
+    formatter = logging.Formatter(FORMAT)
+    limit = RateLimitFilter()
+
+    handlers = [RingHandler()]
+    if console:
+        handlers.append(logging.StreamHandler())
+    if folder and os.path.isdir(folder):
+        handlers.append(logging.handlers.RotatingFileHandler(
+            os.path.join(folder, "windpi_%s.log" % name), maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT))
+    for h in handlers:
+        h.setFormatter(formatter)
+        h.addFilter(limit)
+        root.addHandler(h)
+
+    # raw frames only go to the console, not to the log file or the ring
+    raw = logging.getLogger(RAW)
+    raw.propagate = False
+    raw.setLevel(logging.DEBUG if echo_raw else logging.CRITICAL)
+    h = logging.StreamHandler()
+    h.setFormatter(logging.Formatter("%(message)s"))
+    raw.addHandler(h)
+    root._windpi_setup = True
+    return root
+
+
+def raw_enabled():
+    return logging.getLogger(RAW).isEnabledFor(logging.DEBUG)
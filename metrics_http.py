@@ -0,0 +1,167 @@
+# Recorder metrics in Prometheus text format on http://host:port/metrics
+# The server thread waits for connections and only reads counters when scraped,
+# the acquisition threads never wait for it.
+# $ curl http://127.0.0.1:9500/metrics
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# customized files
+import logs
+
+METRICS_HOST = "127.0.0.1"  # "0.0.0.0" to let the fleet Prometheus scrape the Pi
+METRICS_PORT = 9500
+
+log = logs.get_logger(__name__)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes():
+    """Resident memory of this process, 0 if unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def cpu_seconds():
+    t = os.times()
+    return t.user + t.system
+
+
+class Exporter(object):
+    """
+    Formats the metrics of the recorder returned by get_recorder(),
+    None when nothing is recording (recorder_service.py between start and stop).
+    """
+    def __init__(self, get_recorder):
+        self.get_recorder = get_recorder
+        self.lock = threading.Lock()
+        self.last = None  # (time, valid frames) at the previous scrape, for the sample rate
+
+    def sample_rate(self, rec, valid):
+        now = time.time()
+        with self.lock:
+            last, self.last = self.last, (now, valid)
+        if last is None or now - last[0] <= 0 or valid < last[1]:
+            # first scrape or recorder restarted: average since start
+            dt = now - rec.started if rec.started else 0
+            return valid / dt if dt > 0 else 0.0
+        return (valid - last[1]) / (now - last[0])
+
+    def render(self):
+        lines = []
+
+        def add(name, value, help_text, kind="gauge", labels=""):
+            if help_text:
+                lines.append("# HELP %s %s" % (name, help_text))
+                lines.append("# TYPE %s %s" % (name, kind))
+            value = float(value)
+            lines.append("%s%s %s" % (name, labels, "NaN" if value != value else repr(value)))
+
+        add("process_cpu_seconds_total", cpu_seconds(), "User and system CPU time.", "counter")
+        add("process_resident_memory_bytes", rss_bytes(), "Resident memory size.")
+
+        rec = self.get_recorder()
+        add("windpi_up", 1 if rec is not None and rec.is_running() else 0, "1 while recording.")
+        if rec is None:
+            return "\n".join(lines) + "\n"
+
+        m = rec.metrics()
+        c = m["counters"]
+        labels = '{model="%s"}' % rec.name
+        add("windpi_sample_rate_hz", self.sample_rate(rec, c.get("valid", 0)),
+            "Valid frames per second since the previous scrape.", labels=labels)
+        add("windpi_frames_parsed_total", c.get("valid", 0), "Valid frames.", "counter", labels)
+        add("windpi_frames_rejected_total", c.get("invalid", 0), "Invalid frames.", "counter", labels)
+        add("windpi_frames_dropped_total", c.get("dropped", 0), "Frames dropped by full queues.", "counter", labels)
+
+        storage = rec.storage
+        if storage is not None:
+            add("windpi_bytes_written_total", storage.bytes_written, "Bytes of csv rows written.", "counter", labels)
+            add("windpi_file_rotations_total", storage.rotation_count, "Hour file rotations.", "counter", labels)
+            add("windpi_upload_backlog_files", storage.uploader.backlog_size(),
+                "Files waiting to be copied to R drive.", labels=labels)
+            add("windpi_upload_backlog_age_seconds", storage.uploader.backlog_age(),
+                "Age of the oldest file waiting to be copied.", labels=labels)
+        if rec.last_read is not None:
+            add("windpi_last_serial_read_timestamp_seconds", rec.last_read,
+                "Epoch time of the last line from the anemometer.", labels=labels)
+        battery = getattr(rec, "last_battery", None)
+        if battery is not None:
+            add("windpi_battery_volts", battery, "Last battery voltage.", labels=labels)
+
+        clock = getattr(rec, "timing", None)
+        if clock is not None:
+            x = clock.filter.status()
+            add("windpi_clock_offset_seconds", x["offset"] if x["offset"] is not None else float("nan"),
+                "Host clock minus GPS time (lower envelope fit).", labels=labels)
+            add("windpi_clock_drift_ppm", x["drift_ppm"] if x["drift_ppm"] is not None else float("nan"),
+                "Host clock drift against GPS time.", labels=labels)
+            add("windpi_clock_locked", 1 if x["locked"] else 0, "1 while the offset fit is used.", labels=labels)
+            add("windpi_clock_steps_total", x["steps"], "Host clock steps detected.", "counter", labels)
+            add("windpi_frames_late_total", c.get("late_frames", 0),
+                "Frames with more latency than timing.LATENCY_MAX.", "counter", labels)
+
+        engine = getattr(rec, "alarms", None)
+        if engine is not None:
+            states = engine.states()
+            for k, (metric, help_text, kind) in enumerate((
+                    ("windpi_alarm_active", "1 while the alarm is raised.", "gauge"),
+                    ("windpi_alarm_raised_total", "Times the alarm was raised.", "counter"))):
+                for i, (name, severity, active, raised) in enumerate(states):
+                    add(metric, (active, raised)[k], help_text if i == 0 else None, kind,
+                        '{model="%s",alarm="%s",severity="%s"}' % (rec.name, name, severity))
+
+        first = True
+        for stage, s in m["histograms"].items():
+            for q, key in (("0.5", "p50_ms"), ("0.9", "p90_ms"), ("0.99", "p99_ms")):
+                add("windpi_latency_seconds", s[key] / 1000, "Recording loop latency." if first else None,
+                    "summary", '{model="%s",stage="%s",quantile="%s"}' % (rec.name, stage, q))
+                first = False
+            add("windpi_latency_seconds_count", s["n"], None,
+                labels='{model="%s",stage="%s"}' % (rec.name, stage))
+        return "\n".join(lines) + "\n"
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.exporter.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # no line per scrape
+
+
+class MetricsServer(object):
+    """
+    MetricsServer(lambda: rec).start() serves /metrics in a daemon thread.
+    get_recorder: returns the recorder, or None when there is none.
+    """
+    def __init__(self, get_recorder, port=METRICS_PORT, host=METRICS_HOST):
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.server.exporter = Exporter(get_recorder)
+        self.thread = None
+
+    def start(self):
+        # long poll interval: the thread wakes up for requests, otherwise rarely
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(5,), name="metrics", daemon=True)
+        self.thread.start()
+        log.info("metrics on http://%s:%s/metrics", *self.server.server_address[:2])
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
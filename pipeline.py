@@ -0,0 +1,220 @@
+# Acquisition pipeline: read+timestamp -> parse -> persist -> publish.
+# Every stage runs in its own thread, stages are connected by bounded queues,
+# so a slow write (SD card stall, full disk) does not delay the next readline().
+
+import queue
+import threading
+import time
+
+QUEUE_SIZE = 256  # max items waiting in front of a stage
+PUT_TIMEOUT = 0.5  # s, how long a "block" stage makes the upstream wait before dropping
+
+_STOP = object()  # sentinel, drains the pipeline stage by stage
+
+
+class Stage(object):
+    """
+    One pipeline stage: func(item) is called for every item in the input queue.
+    It returns the item for the next stage, or None to drop it (e.g. invalid data).
+    An exception in func counts as an error and drops the item.
+
+    on_full, what to do when the input queue is full:
+      "block": upstream waits up to PUT_TIMEOUT (backpressure), then drops the item
+      "drop_new": drop the incoming item
+      "drop_oldest": drop the oldest waiting item, keep the newest
+
+    batch > 1: func(items) gets a list of up to batch waiting items (at least one,
+    never waits for more) and returns a list for the next stage, None entries are dropped.
+    An exception then drops the whole batch.
+    """
+    def __init__(self, name, func, maxsize=QUEUE_SIZE, on_full="block", batch=1):
+        self.name = name
+        self.func = func
+        self.on_full = on_full
+        self.batch = batch
+        self.q = queue.Queue(maxsize)
+        self.next = None  # next stage
+        self.thread = None
+
+        self.processed = 0
+        self.dropped = 0  # dropped because the queue was full
+        self.errors = 0  # func raised, item dropped
+        self.wait_total = 0.0  # s, time items spent in the queue
+        self.wait_max = 0.0
+        self.busy_total = 0.0  # s, time spent in func
+        self.busy_max = 0.0
+
+    def put(self, item):
+        """Hand an item to this stage, returns False if it was dropped."""
+        entry = (time.perf_counter(), item)
+        try:
+            if self.on_full == "block":
+                self.q.put(entry, timeout=PUT_TIMEOUT)
+            else:
+                self.q.put_nowait(entry)
+            return True
+        except queue.Full:
+            pass
+
+        if self.on_full == "drop_oldest":
+            try:
+                self.q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.q.put_nowait(entry)
+            except queue.Full:
+                pass
+        self.dropped += 1
+        return False
+
+    def run(self):
+        while True:
+            entries = [self.q.get()]
+            while len(entries) < self.batch and entries[-1][1] is not _STOP:
+                try:
+                    entries.append(self.q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = entries[-1][1] is _STOP
+            if stop:
+                entries.pop()
+            if entries:
+                self.process(entries)
+            if stop:
+                if self.next is not None:
+                    self.next.q.put((time.perf_counter(), _STOP))
+                break
+
+    def process(self, entries):
+        t1 = time.perf_counter()
+        for t0, item in entries:
+            wait = t1 - t0
+            self.wait_total += wait
+            if wait > self.wait_max:
+                self.wait_max = wait
+
+        try:
+            if self.batch > 1:
+                outs = self.func([item for t0, item in entries])
+            else:
+                outs = [self.func(entries[0][1])]
+        except Exception:
+            outs = []
+            self.errors += len(entries)
+        busy = time.perf_counter() - t1
+        self.busy_total += busy
+        if busy > self.busy_max:
+            self.busy_max = busy
+        self.processed += len(entries)
+
+        if self.next is not None:
+            for out in outs:
+                if out is not None:
+                    self.next.put(out)
+
+    def stats(self):
+        n = max(self.processed, 1)
+        return {
+            "name": self.name,
+            "depth": self.q.qsize(),
+            "maxsize": self.q.maxsize,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "wait_avg_ms": 1000 * self.wait_total / n,
+            "wait_max_ms": 1000 * self.wait_max,
+            "busy_avg_ms": 1000 * self.busy_total / n,
+            "busy_max_ms": 1000 * self.busy_max,
+        }
+
+
+class Pipeline(object):
+    """
+    source() is the first stage (read + timestamp): called in a loop by its
+    own thread, returns an item or None (nothing read, e.g. serial timeout).
+    stages: list of Stage, run in order.
+    """
+    def __init__(self, source, stages, name="pipeline"):
+        self.source = source
+        self.stages = stages
+        self.name = name
+        for i in range(len(stages) - 1):
+            stages[i].next = stages[i + 1]
+
+        self.stop_event = threading.Event()
+        self.read_thread = None
+
+        self.read_count = 0
+        self.read_errors = 0
+        self.read_total = 0.0  # s, time spent in source()
+        self.read_max = 0.0
+
+    def _read_loop(self):
+        first = self.stages[0]
+        while not self.stop_event.is_set():
+            t0 = time.perf_counter()
+            try:
+                item = self.source()
+            except Exception:
+                self.read_errors += 1
+                time.sleep(0.1)  # e.g. port unplugged, do not spin
+                continue
+            dt = time.perf_counter() - t0
+            self.read_total += dt
+            if dt > self.read_max:
+                self.read_max = dt
+
+            if item is not None:
+                self.read_count += 1
+                first.put(item)
+
+        first.q.put((time.perf_counter(), _STOP))
+
+    def start(self):
+        for s in self.stages:
+            s.thread = threading.Thread(target=s.run, name="%s-%s" % (self.name, s.name), daemon=True)
+            s.thread.start()
+        self.read_thread = threading.Thread(target=self._read_loop, name="%s-read" % self.name, daemon=True)
+        self.read_thread.start()
+
+    def stop(self, timeout=5):
+        """Stop reading, let queued items drain through all stages."""
+        self.stop_event.set()
+        deadline = time.time() + timeout
+        for t in [self.read_thread] + [s.thread for s in self.stages]:
+            if t is not None:
+                t.join(max(deadline - time.time(), 0))
+        return not any(s.thread.is_alive() for s in self.stages)
+
+    def is_running(self):
+        return self.read_thread is not None and self.read_thread.is_alive()
+
+    def backlog(self):
+        """Largest number of items waiting in front of a stage."""
+        return max(s.q.qsize() for s in self.stages)
+
+    def stats(self):
+        n = max(self.read_count, 1)
+        read = {
+            "name": "read",
+            "depth": 0,
+            "maxsize": 0,
+            "processed": self.read_count,
+            "dropped": 0,
+            "errors": self.read_errors,
+            "wait_avg_ms": 0.0,
+            "wait_max_ms": 0.0,
+            "busy_avg_ms": 1000 * self.read_total / n,
+            "busy_max_ms": 1000 * self.read_max,
+        }
+        return [read] + [s.stats() for s in self.stages]
+
+    def stats_line(self):
+        """One line summary: name depth/maxsize, dropped, errors, avg wait and busy time."""
+        x = []
+        for s in self.stats():
+            x.append("%s %s/%s drop %s err %s wait %.1f busy %.1f ms" %
+                     (s["name"], s["depth"], s["maxsize"], s["dropped"], s["errors"],
+                      s["wait_avg_ms"], s["busy_avg_ms"]))
+        return " | ".join(x)
@@ -0,0 +1,95 @@
+# Matplotlib drawing shared by the GUIs, benchmark.py and offline tools.
+# Functions draw on a figure, the caller draws the canvas.
+
+import time
+
+from windrose import WindroseAxes
+
+# customized files
+import roses
+
+
+# battery voltage time series plot
+def draw_voltage(figure, epoch_time, v):
+    figure.clear()
+    # [left, bottom, width, height]
+    ax1 = figure.add_axes([0.12, 0.1, 0.85, 0.85])
+
+    ax1.plot(epoch_time, v, marker = ".", color = "black", linewidth = 0.7)
+    ax1.grid(alpha = 0.3)
+
+    # axis label
+    ax1.set_xlabel("Local Clock Time: %s" % (time.strftime("%Y-%m-%d")))
+    ax1.set_ylabel("Battery Voltage, V", fontsize=10)
+
+    # add mark for every hour
+    xx = [epoch_time[0]]
+    xmak = [time.strftime('%H', time.localtime(epoch_time[0]))]  # '%H:%M'
+    for i in range(1, len(epoch_time)):
+        t = epoch_time[i]
+        clock0 = time.strftime('%H:%M', time.localtime(epoch_time[i-1]))
+        clock =  time.strftime('%H:%M', time.localtime(t))
+        if (clock0[:2] != clock[:2]):
+            xx.append(int(t))
+            xmak.append(time.strftime('%H', time.localtime(t)))  # '%H:%M'
+
+    ax1.set_xticks(xx)
+    ax1.set_xticklabels(xmak, fontsize=8)
+    return ax1
+
+
+# wind rose plot
+def draw_windrose(figure, wind_dir, wind_speed, title=None):
+    figure.clear()
+    rect = [0.1, 0.2, 0.8, 0.7]
+    ax = WindroseAxes(figure, rect)
+    figure.add_axes(ax)
+
+    # fixed bins: live, hourly and any-period roses share one legend
+    ax.bar(wind_dir, wind_speed, normed=True, opening=0.8, edgecolor='white',
+           bins=roses.SPEED_BINS, nsector=roses.NSECTOR)
+    ax.set_legend(title='Wind Speed in m/s', bbox_to_anchor=(-0.1, -0.27))
+    if title:
+        ax.set_title(title, fontsize=8)
+    return ax
+
+
+# wind rose of a histogram (roses.py), drawn exactly like the live one
+def draw_windrose_counts(figure, counts, title=None):
+    wind_dir, wind_speed = roses.samples(counts)
+    return draw_windrose(figure, wind_dir, wind_speed, title)
+
+
+def stats_title(x):
+    """One line summary of windstats results for a plot title."""
+    return "vector mean %.1f m/s %.0f deg, speed %.1f m/s, gust factor %.2f, sigma theta %.0f deg, TI %.2f" % (
+        x["vector_speed"], x["direction"], x["speed"], x["gust_factor"], x["sigma_theta"],
+        x["turbulence_intensity"])
+
+
+# wind speed time series plot, arrows show the direction (WindSonic M)
+def draw_wind_series(figure, epoch_time, wind_u, wind_v, wind_speed, data_rate):
+    figure.clear()
+    ax1 = figure.add_subplot(111)
+    box = ax1.get_position()
+    box.x0 = box.x0 + 0.05
+    box.x1 = box.x1 + 0.05
+    box.y0 = box.y0 - 0.02
+    box.y1 = box.y1 + 0.05
+    ax1.set_position(box)
+
+    ax1.quiver(epoch_time, wind_speed, wind_v, wind_u)
+
+    # axis label
+    ax1.set_xlabel("Local Clock Time: %s" % (time.strftime("%Y-%m-%d")))
+    ax1.set_ylabel("Wind Speed, m/s", fontsize=10)
+
+    # add mark for every minute
+    xx = list(epoch_time[::data_rate * 60])
+    xmak = []
+    for i in xx:
+        a = time.strftime('%H:%M', time.localtime(i))
+        xmak.append(a)
+    ax1.set_xticks(xx)
+    ax1.set_xticklabels(xmak, fontsize=8)
+    return ax1
@@ -0,0 +1,117 @@
+# On-demand sampling profiler of all threads of a running recorder or GUI.
+# Nothing runs until it is triggered: kill -USR1 <pid>, or 'p' in GMX500.py.
+# For PROFILE_SECONDS a thread samples the stacks of all other threads,
+# then writes LOCAL_DATA_PATH/profile_20241031_140000_<pid>.txt:
+# top functions per thread and folded stacks (flamegraph.pl, speedscope).
+
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+
+# customized files
+import logs
+
+PROFILE_SECONDS = 30  # s
+SAMPLE_INTERVAL = 0.005  # s, 200 Hz
+TOP = 20  # functions listed per thread
+
+log = logs.get_logger(__name__)
+
+
+def frame_name(code):
+    return "%s (%s:%s)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class SamplingProfiler(object):
+    def __init__(self, folder, seconds=PROFILE_SECONDS, interval=SAMPLE_INTERVAL):
+        self.folder = folder
+        self.seconds = seconds
+        self.interval = interval
+        self.thread = None
+        self.last_file = None
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds=None):
+        """Start a profile in the background, False if one is already running."""
+        if self.is_running():
+            return False
+        self.thread = threading.Thread(target=self.run, args=(seconds or self.seconds,),
+                                       name="profiler", daemon=True)
+        self.thread.start()
+        return True
+
+    def run(self, seconds):
+        me = threading.get_ident()
+        stacks = collections.Counter()  # (thread name, frames root -> leaf): samples
+        n = 0
+        t0 = time.time()
+        while time.time() - t0 < seconds:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stacks[(names.get(ident, str(ident)), tuple(reversed(stack)))] += 1
+            n += 1
+            time.sleep(self.interval)
+
+        path = os.path.join(self.folder, "profile_%s_%s.txt" % (time.strftime("%Y%m%d_%H%M%S"), os.getpid()))
+        try:
+            self.write(path, stacks, n, time.time() - t0)
+            self.last_file = path
+            log.info("profile saved: %s", path)
+        except OSError as e:
+            log.error("profile not saved: %s", e)
+
+    def write(self, path, stacks, n, duration):
+        threads = collections.defaultdict(collections.Counter)  # name: stack: samples
+        for (name, stack), k in stacks.items():
+            threads[name][stack] += k
+
+        with open(path, "w") as f:
+            f.write("# sampling profile, pid %s, %.1f s, %s samples every %.1f ms\n" %
+                    (os.getpid(), duration, n, 1000 * self.interval))
+            f.write("# samples of a thread waiting (serial read, sleep, queue get) count like busy ones,\n"
+                    "# look at the leaf function to tell them apart.\n\n")
+
+            for name, st in sorted(threads.items()):
+                total = sum(st.values())
+                own = collections.Counter()  # leaf function
+                cumulative = collections.Counter()  # anywhere in the stack
+                for stack, k in st.items():
+                    if stack:
+                        own[stack[-1]] += k
+                    for code in set(stack):
+                        cumulative[code] += k
+
+                f.write("## thread %s: %s samples\n" % (name, total))
+                f.write("%8s %8s  function\n" % ("own %", "cum %"))
+                for code, k in cumulative.most_common(TOP):
+                    f.write("%8.1f %8.1f  %s\n" % (100.0 * own[code] / total, 100.0 * k / total, frame_name(code)))
+                f.write("\n")
+
+            f.write("## folded stacks\n")
+            for (name, stack), k in stacks.most_common():
+                f.write("%s;%s %s\n" % (name.replace(" ", "_"), ";".join(frame_name(c) for c in stack), k))
+
+
+def install_signal(folder, seconds=PROFILE_SECONDS):
+    """kill -USR1 <pid> starts a profile. Call from the main thread, returns the profiler."""
+    profiler = SamplingProfiler(folder, seconds)
+    if not hasattr(signal, "SIGUSR1"):  # Windows
+        return profiler
+
+    def handler(signum, frame):
+        if profiler.start():
+            log.info("profiling %s s...", profiler.seconds)
+
+    signal.signal(signal.SIGUSR1, handler)
+    return profiler
@@ -0,0 +1,243 @@
+# Data completeness: expected vs received samples, gaps (lost frames) and
+# bursts (backlogged UART lines arriving at once, their arrival time is not
+# the measurement time). The recorder writes one QA sidecar per hour file:
+# LOCAL_DATA_PATH/20241010/20241010_14.qa.json
+# and the per-row flags next to it (one uint8 per row, OK/AFTER_GAP/BURST):
+# LOCAL_DATA_PATH/20241010/20241010_14.flags.npy
+# The same detector runs offline over the archive, in parallel:
+# $ python qa.py /home/picarro/Wind_data --jobs 4 --report completeness.csv
+# $ python qa.py /home/picarro/Wind_data/20241010 --rate 4 --sidecars
+
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# customized files
+import frames
+
+GAP_FACTOR = 1.5  # interval longer than 1.5 sample periods: frames lost
+BURST_FACTOR = 0.2  # interval shorter than 0.2 sample periods: lines arrived together
+BURST_MIN = 3  # rows, shorter runs are normal USB serial jitter
+MAX_EVENTS = 1000  # gaps/bursts kept per hour, the counts keep going
+SUFFIX_FLAGS = ".flags.npy"
+
+# flags returned by GapDetector.add()
+OK = 0
+AFTER_GAP = 1  # first row after lost frames
+BURST = 2  # arrival timestamp unreliable (flag may come one row late: the run is found at its 2nd row,
+# GapDetector.flags has the final per-row value)
+
+
+class GapDetector(object):
+    """
+    Feed every row timestamp with add(epoch), O(1) per row.
+    summary() at the end of an hour, then reset().
+    flags: one byte per row, in file order, bursts shorter than burst_min cleared.
+    """
+    def __init__(self, rate, gap_factor=GAP_FACTOR, burst_factor=BURST_FACTOR, burst_min=BURST_MIN):
+        self.rate = rate
+        self.gap_dt = gap_factor / rate
+        self.burst_dt = burst_factor / rate
+        self.burst_min = burst_min
+        self.reset()
+
+    def reset(self):
+        self.first = None
+        self.last = None
+        self.received = 0
+        self.invalid = 0
+        # [start epoch, end epoch, frames missing]; a UART stall shows as a gap
+        # followed by a burst of the held frames, completeness counts them once
+        self.gaps = []
+        self.gap_count = 0
+        self.missing = 0
+        self.max_gap = 0.0
+        self.bursts = []  # [first row, last row, first epoch, last epoch]; rows: 1 = first data row
+        self.burst_count = 0
+        self.unreliable = 0  # rows in bursts
+        self.backwards = 0  # clock stepped back
+        self.run = None  # [first row, first epoch] of the current run of close rows
+        self.flags = bytearray()
+
+    def count_invalid(self):
+        self.invalid += 1
+
+    def close_run(self, last_row):
+        if self.run is None:
+            return
+        first_row, first_epoch = self.run
+        n = last_row - first_row + 1
+        if n < self.burst_min:
+            for i in range(first_row - 1, last_row):
+                self.flags[i] &= ~BURST & 0xff
+        else:
+            self.burst_count += 1
+            self.unreliable += n
+            if len(self.bursts) < MAX_EVENTS:
+                self.bursts.append([first_row, last_row, first_epoch, self.last])
+        self.run = None
+
+    def add(self, epoch):
+        self.received += 1
+        flag = OK
+        if self.last is None:
+            self.first = epoch
+        else:
+            dt = epoch - self.last
+            if dt < 0:
+                self.backwards += 1
+            if dt < self.burst_dt:
+                if self.run is None:
+                    self.run = [self.received - 1, self.last]  # the previous row starts the run
+                    self.flags[-1] |= BURST
+                flag = BURST
+            else:
+                self.close_run(self.received - 1)  # the run ended at the previous row
+                if dt > self.gap_dt:
+                    missing = int(round(dt * self.rate)) - 1
+                    self.gap_count += 1
+                    self.missing += missing
+                    self.max_gap = max(self.max_gap, dt)
+                    if len(self.gaps) < MAX_EVENTS:
+                        self.gaps.append([self.last, epoch, missing])
+                    flag = AFTER_GAP
+        self.last = epoch
+        self.flags.append(flag)
+        return flag
+
+    def summary(self, name=""):
+        self.close_run(self.received)
+        span = self.last - self.first if self.received else 0.0
+        expected = int(round(span * self.rate)) + 1 if self.received else 0
+        return {
+            "file": name,
+            "rate_hz": self.rate,
+            "first": self.first,
+            "last": self.last,
+            "received": self.received,
+            "expected": expected,  # between first and last row
+            "expected_hour": int(self.rate * 3600),
+            "completeness": self.received / expected if expected else 0.0,
+            "invalid": self.invalid,
+            "gap_count": self.gap_count,
+            "missing": self.missing,
+            "max_gap_s": self.max_gap,
+            "burst_count": self.burst_count,
+            "unreliable_rows": self.unreliable,
+            "backwards": self.backwards,
+            "gaps": self.gaps,
+            "bursts": self.bursts,
+        }
+
+
+def sidecar_path(csv_path):
+    return csv_path[:-len(".csv")] + ".qa.json"
+
+
+def write_sidecar(csv_path, summary):
+    path = sidecar_path(csv_path)
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=1)
+    return path
+
+
+def flags_path(csv_path):
+    return csv_path[:-len(".csv")] + SUFFIX_FLAGS
+
+
+def write_flags(csv_path, flags):
+    """Per-row flags of an hour file, row i = i-th row with a valid epoch_time."""
+    path = flags_path(csv_path)
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, np.frombuffer(bytes(flags), dtype=np.uint8))
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def read_flags(csv_path):
+    return np.load(flags_path(csv_path))
+
+
+def rate_of(header, default_rate):
+    # GMX500 outputs 1 Hz, WindSonic rate is set in the anemometer
+    return 1.0 if header == frames.HEADER_GMX500 else default_rate
+
+
+def check_file(csv_path, rate=4.0, sidecar=False):
+    """Run the detector over one hour csv, returns the summary."""
+    with open(csv_path, errors="replace") as f:
+        header = f.readline()
+        det = GapDetector(rate_of(header, rate))
+        for line in f:
+            try:
+                epoch = float(line.split(",", 1)[0])
+            except ValueError:
+                det.count_invalid()
+                continue
+            det.add(epoch)
+    x = det.summary(os.path.basename(csv_path))
+    if sidecar:
+        write_sidecar(csv_path, x)
+        write_flags(csv_path, det.flags)
+    return x
+
+
+def _check(args):
+    return check_file(*args)
+
+
+def hour_files(paths):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += glob.glob(os.path.join(p, "**", "????????_??.csv"), recursive=True)
+        else:
+            files.append(p)
+    return sorted(files)
+
+
+REPORT_COLUMNS = ["file", "received", "expected", "completeness", "invalid", "gap_count", "missing",
+                  "max_gap_s", "burst_count", "unreliable_rows", "backwards"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wind data completeness report")
+    parser.add_argument("paths", nargs="+", help="hour csv files or folders")
+    parser.add_argument("--rate", type=float, default=4.0, help="Hz, WindSonic data rate (GMX500: 1 Hz)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="parallel processes")
+    parser.add_argument("--sidecars", action="store_true", help="write a .qa.json and .flags.npy next to every hour file")
+    parser.add_argument("--report", default=None, help="csv report, one row per hour file")
+    args = parser.parse_args()
+
+    files = hour_files(args.paths)
+    with ProcessPoolExecutor(args.jobs) as pool:
+        results = list(pool.map(_check, [(f, args.rate, args.sidecars) for f in files], chunksize=8))
+
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(",".join(REPORT_COLUMNS) + "\n")
+            for x in results:
+                f.write(",".join(str(x[k]) for k in REPORT_COLUMNS) + "\n")
+
+    # summary per day
+    days = {}
+    for x in results:
+        d = days.setdefault(x["file"][:8], [0, 0, 0, 0, 0])
+        d[0] += x["received"]
+        d[1] += x["expected"]
+        d[2] += x["gap_count"]
+        d[3] += x["burst_count"]
+        d[4] += x["invalid"]
+    print("%-10s %10s %10s %8s %6s %6s %8s" % ("day", "received", "expected", "complete", "gaps", "bursts", "invalid"))
+    for day, d in sorted(days.items()):
+        print("%-10s %10s %10s %7.2f%% %6s %6s %8s" %
+              (day, d[0], d[1], 100.0 * d[0] / max(d[1], 1), d[2], d[3], d[4]))
+    print("%s files checked" % len(results))
+
+
+if __name__ == "__main__":
+    main()
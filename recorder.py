@@ -0,0 +1,680 @@
+# Data recorders without GUI, shared by gui_GMX500.py, gui_windsonic.py,
+# GMX500.py and recorder_service.py (recorder in its own process).
+
+import os
+import threading
+import time
+
+import numpy as np
+import serial
+
+# customized files
+import alarms
+import derive
+import events
+import frames
+import instrument
+import logs
+import pipeline
+import qa
+import roses
+import spectra
+import timing
+import windstats
+from battery import BatteryAlert, Notifier
+from shm_ring import SharedRing, GMX500_COLUMNS, WINDSONIC_COLUMNS, BATTERY_COLUMNS
+from storage import HourlyStorage
+
+BAUDRATE = 19200
+LOCAL_DATA_PATH = "/home/picarro/Wind_data"  # folder to save data locally
+STATS_INTERVAL = 60  # s, programs log pipeline queue depth and latency every # seconds
+READ_TIMEOUT = 0.5  # s, serial read timeout, a silent port cannot block stop
+STOP_TIMEOUT = 5  # s, max time for stop: drain pipeline, flush, copy last file to R drive
+STOP_RETRY = 5  # s, a pipeline that did not drain in time is waited for again every # seconds
+SHM_MINUTES = 60  # min, live data kept in shared memory for GUI and other readers
+PARSE_BATCH = 64  # frames parsed and derived together when a backlog is waiting
+STATS_WINDOW = 600  # s, live wind statistics in status()
+SPECTRA_QUEUE = 4096  # frames waiting for the low priority spectra stage
+
+# shared memory names
+SHM_GMX500 = "windpi_gmx500"
+SHM_GMX500_V = SHM_GMX500 + "_v"  # battery voltage, one point every interval_v
+SHM_WINDSONIC = "windpi_windsonic"
+
+log = logs.get_logger(__name__)
+raw_log = logs.get_logger(logs.RAW)
+
+
+def detect_port(port, baudrate=BAUDRATE, timeout=2.0):
+    """True if the anemometer sends a line within timeout. Blocking: call it off the GUI thread."""
+    try:
+        wind = serial.Serial(port, baudrate, timeout=timeout)
+        try:
+            x = wind.readline()
+        finally:
+            wind.close()
+    except (serial.SerialException, OSError, ValueError) as e:
+        log.warning("port %s: %s", port, e)  # unplugged, busy or no port selected
+        return False
+    return bool(x)
+
+
+def rules_options(folder=LOCAL_DATA_PATH):
+    """
+    Recorder(**options) keywords of the rules files in folder (alarms.RULES_FILE, events.RULES_FILE),
+    a missing file keeps the default rules, [] in a file turns them off.
+    """
+    options = {}
+    for key, module in (("alarm_rules", alarms), ("event_rules", events)):
+        path = os.path.join(folder, module.RULES_FILE)
+        if os.path.isfile(path):
+            options[key] = module.load_rules(path)
+            log.info("%s: %s rules", path, len(options[key]))
+    return options
+
+
+def to_float(x):
+    try:
+        return float(x)
+    except ValueError:
+        return np.nan
+
+
+class Recorder(object):
+    """
+    Base recorder: hour files + read/parse/persist/publish pipeline.
+    Subclasses define header, open_devices(), read(), parse(), derive(), format_row() and publish().
+    source: object with readline() and close() used instead of the serial port,
+            e.g. replay.Replay, its clock() timestamps the data.
+    """
+    name = "recorder"
+    header = ""
+    rate = 1.0  # Hz, anemometer output rate, for gap detection
+    stats_names = ()  # extra channels of the live statistics
+    rose_names = ("speed",)  # channels summarized in the hourly rose file, see rose_sample()
+    event_names = ("speed", "direction")  # channels of the event rules, see event_values()
+    alarm_names = ("speed", "direction", "u", "v")  # channels of the alarm rules, see alarm_values()
+    gps_time = False  # frames carry GPS_Time: clock offset and latency tracking, see gps_text()
+
+    def __init__(self, port, rdrive_folder, local_data_path=LOCAL_DATA_PATH,
+                 staging_dir=None, on_rotate=None, source=None, spectra=True, event_rules=None,
+                 alarm_rules=None):
+        self.port = port
+        self.rdrive_folder = rdrive_folder
+        self.local_data_path = local_data_path
+        self.staging_dir = staging_dir
+        self.on_rotate = on_rotate
+        self.source = source
+        self.clock = time.time if source is None else source.clock
+        self.use_spectra = spectra
+        # None: events.DEFAULT_RULES, []: no event capture
+        self.event_rules = events.DEFAULT_RULES if event_rules is None else event_rules
+        # None: alarms.DEFAULT_RULES, []: no alarms
+        self.alarm_rules = alarms.DEFAULT_RULES if alarm_rules is None else alarm_rules
+
+        self.storage = None
+        self.pipe = None
+        self.lock = threading.Lock()  # shared memory is written by publish and control threads
+        self.closed = False  # shared memory removed by close(), a pipeline still draining skips it
+        self.started = None  # epoch time of start
+        self.filename = None  # current hour file: 20241010_14
+        self.partial = b""  # beginning of a line cut by read timeout
+        self.last_read = None  # epoch time of the last full line from the port
+        # latency histograms: serial_wait, i2c, parse, write, plot_buffer; counters: valid, invalid
+        self.instr = instrument.Instruments()
+        self.instr.counters.update(valid=0, invalid=0)
+        self.qa = None  # gaps and bursts of the current hour file
+        self.wind_stats = None  # windstats.Sliding, fed by publish()
+        self.rose = None  # roses.HourRose of the current hour file, fed by persist()
+        self.spectra = None  # spectra.SlidingWelch and its hourly result files, fed by analyze()
+        self.spectra_store = None
+        self.spectra_nice = False  # spectra thread priority lowered
+        self.capture = None  # events.Capture, fed by persist()
+        self.alarms = None  # alarms.AlarmEngine, fed by check_alarms()
+        self.timing = None  # timing.HourTiming of the current hour file, fed by persist()
+
+    def open_devices(self):
+        if self.source is not None:
+            self.wind = self.source
+            return
+        self.wind = serial.Serial(self.port, BAUDRATE, timeout=READ_TIMEOUT)
+        log.info("anemometer USB port: %s", self.wind.name)
+
+    def read_line(self):
+        """One full line from the anemometer, None if the read timed out."""
+        t0 = time.perf_counter()
+        x = self.wind.readline()
+        self.instr.record("serial_wait", time.perf_counter() - t0)
+        if not x.endswith(b"\n"):
+            self.partial += x
+            return None
+        if self.partial:
+            x = self.partial + x
+            self.partial = b""
+        self.last_read = time.time()
+        return x
+
+    def qa_summary(self, local_file_path):
+        """QA sidecar content of the finished hour file, subclasses add their part."""
+        x = self.qa.summary(os.path.basename(local_file_path))
+        self.qa.reset()
+        if self.timing is not None:
+            x["timing"] = timing.summary(self.timing)  # clock offset, drift, late frames
+        return x
+
+    def finished(self, local_file_path):
+        """Hour file done: write its QA sidecar and row flags, wind rose and timing file, copied to R drive with it."""
+        flags = self.qa.flags  # final after summary(), reset() starts a new one
+        x = self.qa_summary(local_file_path)
+        if x["gap_count"] or x["burst_count"]:
+            log.warning("%s: %s gaps, %s frames missing, %s bursts",
+                        x["file"], x["gap_count"], x["missing"], x["burst_count"])
+        files = []
+        try:
+            files.append(qa.write_sidecar(local_file_path, x))
+            files.append(qa.write_flags(local_file_path, flags))
+        except OSError:
+            pass
+        try:
+            path = local_file_path[:-len(".csv")] + roses.SUFFIX
+            self.rose.save(path)
+            files.append(path)
+        except OSError as e:
+            log.warning("wind rose not saved: %s", e)
+        self.rose.reset()
+        if self.timing is not None:
+            try:
+                path = timing.timing_path(local_file_path)
+                self.timing.save(path)
+                files.append(path)
+            except OSError as e:
+                log.warning("timing not saved: %s", e)
+            self.timing.reset()
+        return files
+
+    def rotated(self, filename):
+        self.filename = filename
+        if self.on_rotate is not None:
+            self.on_rotate(filename)
+
+    def parse_batch(self, items):
+        """Parse the frames one by one, then derive channels for the whole batch at once."""
+        t0 = time.perf_counter()
+        out = []
+        for item in items:
+            try:
+                out.append(self.parse(item))
+            except Exception:
+                self.instr.count("invalid")
+                self.qa.count_invalid()
+                log.warning("invalid data: %r", item[1][:80], extra=logs.LIMITED)
+        if out:
+            out = self.derive(out)
+        dt = (time.perf_counter() - t0) / len(items)
+        for i in range(len(out)):
+            self.instr.record("parse", dt)  # per frame
+        self.instr.count("valid", len(out))
+        return out
+
+    def derive(self, items):
+        return items
+
+    def rose_sample(self, item):
+        """(direction, speed, values of rose_names) of a derived item."""
+        raise NotImplementedError
+
+    def wind_sample(self, item):
+        """(epoch, u, v, speed) of a derived item, for the spectra."""
+        raise NotImplementedError
+
+    def event_values(self, item):
+        """Values of event_names of a derived item."""
+        raise NotImplementedError
+
+    def alarm_values(self, item):
+        """Values of alarm_names of a derived item, floats."""
+        raise NotImplementedError
+
+    def gps_text(self, item):
+        """GPS_Time field of a derived item, if gps_time."""
+        raise NotImplementedError
+
+    def persist(self, item):
+        t0 = time.perf_counter()
+        epoch = item[0]
+        row = self.format_row(item)
+        self.storage.write(epoch, row)
+        self.instr.record("write", time.perf_counter() - t0)
+        self.qa.add(epoch)
+        self.rose.add(epoch, *self.rose_sample(item))
+        if self.timing is not None:
+            corrected, latency, flags = self.timing.add(epoch, self.gps_text(item))
+            if latency == latency:
+                self.instr.record("gps_latency", max(latency, 0.0))
+            if flags & timing.LATE:
+                self.instr.count("late_frames")
+            if flags & timing.NO_GPS:
+                self.instr.count("no_gps_time")
+        if self.capture is not None:
+            fired = self.capture.add(epoch, row, self.event_values(item))
+            if fired:
+                self.instr.count("event_triggers", len(fired))
+        return item
+
+    def publish_item(self, item):
+        t0 = time.perf_counter()
+        self.publish(item)
+        self.instr.record("plot_buffer", time.perf_counter() - t0)
+        return item
+
+    # stage 3b: alarm rules, the whole batch at once, transitions in sample order
+    def check_alarms(self, items):
+        epoch = [x[0] for x in items]
+        try:
+            self.alarms.update(epoch, [self.alarm_values(x) for x in items])
+        except Exception as e:  # publish comes next, do not drop its rows
+            self.instr.count("alarm_errors")
+            log.warning("alarms: %s", e, extra=logs.LIMITED)
+        return items
+
+    # stage 6: spectra, low priority thread, may drop frames (short gaps are interpolated)
+    def analyze(self, items):
+        if not self.spectra_nice:
+            spectra.lower_priority()
+            self.spectra_nice = True
+        epoch, u, v, speed = np.array([self.wind_sample(x) for x in items], dtype=float).T
+        self.spectra_store.add(self.spectra.extend(epoch, u, v, speed))
+
+    def spectra_saved(self, path):
+        day = os.path.basename(path)[:8]
+        self.storage.uploader.enqueue(path, os.path.join(self.rdrive_folder, day))
+
+    # R drive: next to the hour files of the day (the uploader only creates the day folder)
+    def event_saved(self, *paths):
+        day = os.path.basename(paths[0])[:8]
+        for path in paths:
+            self.storage.uploader.enqueue(path, os.path.join(self.rdrive_folder, day))
+
+    def start(self):
+        self.open_devices()
+        self.qa = qa.GapDetector(self.rate)
+        self.wind_stats = windstats.Sliding(STATS_WINDOW, self.rate, self.stats_names)
+        self.rose = roses.HourRose(self.rose_names)
+        if self.gps_time:
+            self.timing = timing.HourTiming()
+        if self.use_spectra:
+            self.spectra = spectra.SlidingWelch(self.rate)
+            self.spectra_store = spectra.Store(self.local_data_path, self.spectra, on_saved=self.spectra_saved)
+            self.spectra_nice = False
+        if self.alarm_rules:
+            self.alarms = alarms.AlarmEngine(self.alarm_rules, self.alarm_names)
+            self.alarms.start()
+        if self.event_rules:
+            self.capture = events.Capture(self.local_data_path, self.header,
+                                          self.event_rules, self.event_names, self.rate, self.name,
+                                          on_saved=self.event_saved)
+        self.storage = HourlyStorage(self.local_data_path, self.rdrive_folder, self.header,
+                                     self.staging_dir, on_rotate=self.rotated, clock=self.clock,
+                                     on_finish=self.finished)
+        stages = [
+            pipeline.Stage("parse", self.parse_batch, on_full="drop_oldest", batch=PARSE_BATCH),
+            pipeline.Stage("persist", self.persist),
+        ]
+        if self.alarms is not None:
+            # every written row, before the drop_oldest stages: "for" runs are not cut by drops
+            stages.append(pipeline.Stage("alarms", self.check_alarms, batch=PARSE_BATCH))
+        stages.append(pipeline.Stage("publish", self.publish_item, on_full="drop_oldest"))
+        if self.use_spectra:
+            stages.append(pipeline.Stage("spectra", self.analyze, maxsize=SPECTRA_QUEUE, on_full="drop_oldest",
+                                         batch=SPECTRA_QUEUE))
+        self.pipe = pipeline.Pipeline(self.read, stages, name=self.name)
+        if self.source is not None:
+            self.source.pipe = self.pipe  # replay waits for the pipeline instead of dropping data
+        self.pipe.start()
+        self.started = time.time()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """
+        Stop reading, flush staged data, copy last file to R drive.
+        Returns within about timeout seconds, False if something was left behind
+        (the copy keeps trying in the background).
+        """
+        if self.pipe is None:
+            return True
+        t0 = time.time()
+        pipe, self.pipe = self.pipe, None
+        self.started = None
+        if not pipe.stop(timeout / 2):
+            # stages still write to the hour file, spectra and events: close them only after the last item
+            log.warning("stop: pipeline not drained in %.1f s, files are closed when it is", timeout / 2)
+            threading.Thread(target=self.close_when_drained, args=(pipe,), name="%s-stop" % self.name,
+                             daemon=True).start()
+            return False
+        return self.close_outputs(max(timeout - (time.time() - t0), 0))
+
+    def close_when_drained(self, pipe):
+        while not pipe.stop(STOP_RETRY):
+            log.warning("stop: pipeline still busy: %s", pipe.stats_line())
+        if not self.close_outputs(STOP_TIMEOUT):
+            log.warning("stop: copy last file to r-drive not finished, will keep trying.")
+
+    def close_outputs(self, timeout):
+        """After the last stage finished: save spectra and events, flush and copy the hour file."""
+        if self.alarms is not None:
+            self.alarms.close()
+        if self.spectra_store is not None:
+            try:
+                self.spectra_store.save()  # windows of the last hour
+            except OSError as e:
+                log.warning("spectra not saved: %s", e)
+        if self.capture is not None:
+            try:
+                self.capture.close()  # event still in its post window
+            except OSError as e:
+                log.warning("event not saved: %s", e)
+        ok = self.storage.close(timeout)
+        self.wind.close()
+        return ok
+
+    def is_running(self):
+        return self.pipe is not None
+
+    def close(self):
+        pass
+
+    def metrics(self):
+        """Latency histograms and valid/invalid/dropped frame counters."""
+        x = self.instr.snapshot()
+        if self.pipe is not None:
+            x["counters"]["dropped"] = sum(s["dropped"] for s in self.pipe.stats())
+        return x
+
+    def metrics_line(self):
+        return instrument.format_snapshot(self.metrics(), line=True)
+
+    def status(self):
+        return {
+            "model": self.name,
+            "running": self.is_running(),
+            "started": self.started,
+            "filename": self.filename,
+            "stats": self.pipe.stats() if self.pipe is not None else [],
+            "metrics": self.metrics(),
+            "wind_stats": self.wind_stats.result() if self.wind_stats is not None else None,
+            "spectra": self.spectra_store.summary() if self.spectra_store is not None else None,
+            "alarms": self.alarms.status() if self.alarms is not None else None,
+            "timing": self.timing.filter.status() if self.timing is not None else None,
+            "upload_backlog": self.storage.uploader.backlog_size() if self.storage is not None else 0,
+            "upload_backlog_age": self.storage.uploader.backlog_age() if self.storage is not None else 0,
+        }
+
+
+class GMX500Recorder(Recorder):
+    name = "gmx500"
+    header = frames.HEADER_GMX500
+    stats_names = windstats.GMX500_NAMES
+    rose_names = roses.channel_names("gmx500")
+    event_names = ("speed", "direction", "pressure", "humidity", "temperature", "battery_v")
+    alarm_names = ("speed", "direction", "u", "v", "pressure", "humidity", "temperature", "dew_point",
+                   "gps_latitude", "gps_longitude", "gps_height", "battery_v")
+    gps_time = True
+
+    def __init__(self, port, rdrive_folder, plot_window_wind=10, plot_window_v=24, interval_v=15,
+                 voltage_min=None, warning_msg=None, echo=False, ina219=None, shm_name=SHM_GMX500, **kw):
+        Recorder.__init__(self, port, rdrive_folder, **kw)
+        self.total_wind_pts = plot_window_wind * 60
+        self.total_v_pts = int(60 / interval_v * plot_window_v)
+        self.interval_v = interval_v
+        self.voltage_min = voltage_min  # None: no battery alert
+        self.warning_msg = warning_msg  # battery warning file, None: do not write
+        self.battery = BatteryAlert(voltage_min) if voltage_min is not None else None
+        self.notifier = None
+        self.echo = echo  # raw frames and battery voltage to the console (logs.RAW logger)
+        self.ina219 = ina219  # None: I2C board on the raspberry pi, or e.g. simulator.FakeINA219()
+
+        # live data for the GUI and other local readers, data rate 1 Hz
+        # shm_name: SHM_GMX500 for the live recorder, another name for replay and benchmarks
+        self.ring = SharedRing.create(shm_name, len(GMX500_COLUMNS), SHM_MINUTES * 60)
+        self.ring_v = SharedRing.create(shm_name + "_v", len(BATTERY_COLUMNS), self.total_v_pts)
+        self.time_tag = 0
+        self.last_battery = float("nan")
+
+    def open_devices(self):
+        Recorder.open_devices(self)
+        if self.ina219 is None:
+            # for I2C board
+            import board
+            from adafruit_ina219 import INA219
+            i2c_bus = board.I2C()  # uses board.SCL and board.SDA
+            self.ina219 = INA219(i2c_bus)
+
+        # initiate the voltage part
+        self.time_tag = self.clock()
+        for i in range(2):
+            self.ring_v.append([self.time_tag, round(self.read_battery(), 2)])
+
+    def start(self):
+        if self.battery is not None:
+            self.notifier = Notifier(self.warning_msg)
+        Recorder.start(self)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        ok = Recorder.stop(self, timeout)
+        if self.notifier is not None:
+            self.notifier.close()
+            self.notifier = None
+        return ok
+
+    def qa_summary(self, local_file_path):
+        x = Recorder.qa_summary(self, local_file_path)
+        if self.battery is not None:
+            x["battery"] = self.battery.hour_summary()
+        return x
+
+    def status(self):
+        x = Recorder.status(self)
+        x["battery"] = self.battery.status() if self.battery is not None else None
+        return x
+
+    def read_battery(self):
+        bus_voltage = self.ina219.bus_voltage  # voltage on V- (load side)
+        shunt_voltage = self.ina219.shunt_voltage  # voltage between V+ and V- across the shunt
+        return round(bus_voltage + shunt_voltage, 5)
+
+    # stage 1: read + timestamp
+    def read(self):
+        x = self.read_line()
+        if x is None:
+            return None
+        epoch = self.clock()
+        # get battery voltage from I2C board
+        t0 = time.perf_counter()
+        try:
+            v = self.read_battery()
+        except Exception:
+            v = float("nan")  # I2C error, keep the wind data
+            self.instr.count("i2c_error")
+        self.instr.record("i2c", time.perf_counter() - t0)
+        return epoch, x, v
+
+    # stage 2: parse, invalid frames raise and are counted as errors
+    def parse(self, item):
+        epoch, x, v = item
+        x = x.decode()
+        if self.echo:
+            raw_log.debug(x.rstrip())
+        return epoch, frames.parse_gmx500(x), v
+
+    # stage 2b: corrected u/v for the statistics, dew point sanity, on the whole batch
+    # item: (epoch, fields, v, (u, v, dew point ok)), fields as in the frame
+    def derive(self, items):
+        if len(items) >= derive.VECTOR_MIN:
+            f = [x[1] for x in items]
+            direction = np.array([x[4] for x in f], dtype=float)
+            speed = np.array([x[5] for x in f])
+            rh, t, dp = np.array([x[7:10] for x in f]).T
+            u, v = derive.dir_to_uv(direction, speed)
+            dew_ok = derive.dew_point_ok(t, rh, dp)
+            out = [x + (y,) for x, y in zip(items, zip(u.tolist(), v.tolist(), dew_ok.tolist()))]
+        else:
+            out = []
+            for x in items:
+                f = x[1]
+                out.append(x + (derive.dir_to_uv_scalar(f[4], f[5]) +
+                                (derive.dew_point_ok_scalar(f[8], f[7], f[9]),),))
+        suspect = sum(1 for x in out if not x[3][2])
+        if suspect:
+            self.instr.count("dew_point_suspect", suspect)
+        return out
+
+    # stage 3: write to hour file, battery warning: every written row is in the hour summary
+    def persist(self, item):
+        item = Recorder.persist(self, item)
+        if self.battery is not None:
+            # one notification per state change and reminders, written in the background
+            x = self.battery.update(item[0], item[2])
+            if x is not None and self.notifier is not None:
+                self.notifier.send(x)
+        return item
+
+    def format_row(self, item):
+        epoch, fields, v = item[:3]
+        return frames.format_gmx500(epoch, frames.clock_gmx500(epoch), fields, v)
+
+    # Corrected_Direction, Corrected_Speed; speed, pressure, humidity, temperature, battery
+    def rose_sample(self, item):
+        fields, v = item[1], item[2]
+        return fields[4], fields[5], (fields[5], fields[6], fields[7], fields[8], v)
+
+    # corrected u/v from derive(), Corrected_Speed
+    def wind_sample(self, item):
+        return item[0], item[3][0], item[3][1], item[1][5]
+
+    def event_values(self, item):
+        fields = item[1]
+        return fields[5], fields[4], fields[6], fields[7], fields[8], item[2]
+
+    def alarm_values(self, item):
+        f = item[1]
+        return (f[5], f[4], f[0], f[1], f[6], f[7], f[8], f[9], to_float(f[10]), to_float(f[11]), to_float(f[12]),
+                item[2])
+
+    def gps_text(self, item):
+        return item[1][13]
+
+    # stage 4: plot buffers, live statistics
+    def publish(self, item):
+        epoch, fields, v, derived = item
+        self.last_battery = v
+        if self.echo:
+            raw_log.debug("Battery: %s V", v)
+        # pressure, humidity, temperature
+        self.wind_stats.add(epoch, derived[0], derived[1], fields[6:9])
+
+        with self.lock:
+            if self.closed:
+                return
+            # data for battery voltage plot
+            if epoch - self.time_tag > self.interval_v * 60:
+                self.ring_v.append([epoch, round(v, 2)])
+                self.time_tag = epoch
+
+            # all channels, GPS_Time is text and not shared
+            self.ring.append([epoch] + [to_float(x) for x in fields[:13]] + [fields[14], v])
+
+    def clear(self):
+        with self.lock:
+            self.ring.clear()
+            self.ring_v.clear()
+        log.info("plot cleared.")
+
+    def data(self):
+        # Corrected_Direction, Corrected_Speed for wind rose plot
+        rows, count = self.ring.latest(self.total_wind_pts)
+        v, count = self.ring_v.latest()
+        return {"wind": rows[:, 5:7].tolist(), "v": v.tolist()}
+
+    def close(self):
+        """Remove shared memory, when the process exits or the recorder is not used again."""
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.ring.unlink()
+                self.ring_v.unlink()
+
+
+class WindSonicRecorder(Recorder):
+    name = "windsonic"
+    header = frames.HEADER_WINDSONIC
+
+    def __init__(self, port, rdrive_folder, plot_window=5, data_rate=4, shm_name=SHM_WINDSONIC, **kw):
+        Recorder.__init__(self, port, rdrive_folder, **kw)
+        self.rate = data_rate
+        self.total_pts = plot_window * data_rate * 60
+        # live data for the GUI and other local readers: epoch, u, v, wind_speed, wind_dir
+        self.ring = SharedRing.create(shm_name, len(WINDSONIC_COLUMNS), SHM_MINUTES * 60 * data_rate)
+
+    # stage 1: read + timestamp
+    def read(self):
+        x = self.read_line()
+        if x is None:
+            return None
+        return self.clock(), x
+
+    # stage 2: parse, invalid frames raise and are counted as errors
+    def parse(self, item):
+        epoch, x = item
+        u, v = frames.parse_windsonic(x.decode())
+        return epoch, u, v
+
+    # stage 2b: speed and direction, on the whole batch
+    # item: (epoch, u, v, wind_speed, wind_dir)
+    def derive(self, items):
+        if len(items) >= derive.VECTOR_MIN:
+            a = np.array(items)
+            u, v = a[:, 1], a[:, 2]
+            speed = derive.wind_speed(u, v).tolist()
+            direction = derive.wind_uv_to_dir(u, v).tolist()
+            return [x + (speed[i], direction[i]) for i, x in enumerate(items)]
+        return [x + (derive.wind_speed_scalar(x[1], x[2]), derive.wind_uv_to_dir_scalar(x[1], x[2]))
+                for x in items]
+
+    # stage 3: write to hour file
+    def format_row(self, item):
+        epoch, u, v, wind_speed, wind_dir = item
+        return frames.format_windsonic(epoch, frames.clock_windsonic(epoch), u, v, wind_speed, wind_dir)
+
+    def rose_sample(self, item):
+        return item[4], item[3], (item[3],)
+
+    def wind_sample(self, item):
+        return item[:4]
+
+    def event_values(self, item):
+        return item[3], item[4]
+
+    def alarm_values(self, item):
+        return item[3], item[4], item[1], item[2]
+
+    # stage 4: plot buffer, live statistics
+    def publish(self, item):
+        self.wind_stats.add(item[0], item[1], item[2])
+        with self.lock:
+            if not self.closed:
+                self.ring.append(item)
+
+    def clear(self):
+        with self.lock:
+            self.ring.clear()
+        log.info("plot cleared.")
+
+    def data(self):
+        rows, count = self.ring.latest(self.total_pts)
+        return {"wind": rows.tolist()}
+
+    def close(self):
+        """Remove shared memory, when the process exits or the recorder is not used again."""
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.ring.unlink()
@@ -0,0 +1,180 @@
+# Run the GMX500 (or WindSonic M) recorder in its own process.
+# The GUI sends commands over a local socket and reads live data from shared
+# memory (shm_ring.py), so closing or restarting the GUI does not stop recording.
+# $ python recorder_service.py            (GMX500)
+# $ python recorder_service.py windsonic
+
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+# customized files
+import logs
+import staging
+from recorder import GMX500Recorder, WindSonicRecorder, LOCAL_DATA_PATH, rules_options
+from metrics_http import MetricsServer
+import profiler
+
+SERVICE_HOST = "127.0.0.1"  # local only
+SERVICE_PORT = {"gmx500": 50500, "windsonic": 50501}
+METRICS_PORT = {"gmx500": 0, "windsonic": 0}  # Prometheus /metrics, e.g. 9500 and 9501, 0: off
+TMPFS_STAGING = 0  # 1: keep the active hour file in RAM, flush to SD card every few minutes
+
+log = logs.get_logger(__name__)
+
+
+class Service(object):
+    """Holds one recorder, executes commands: start, stop, clear, status, data, log, shutdown."""
+    def __init__(self, model):
+        self.model = model
+        self.recorder = None
+        self.lock = threading.Lock()  # one command at a time
+        self.server = None
+
+    def new_recorder(self, port, rdrive_folder, options):
+        # options: GUI settings passed to the recorder, e.g. plot_window_wind
+        options.setdefault("staging_dir", staging.TMPFS_PATH if TMPFS_STAGING else None)
+        options = dict(rules_options(options.get("local_data_path", LOCAL_DATA_PATH)), **options)
+        if self.model == "gmx500":
+            return GMX500Recorder(port, rdrive_folder, **options)
+        return WindSonicRecorder(port, rdrive_folder, **options)
+
+    def execute(self, request):
+        cmd = request.get("cmd")
+        with self.lock:
+            if cmd == "start":
+                if self.recorder is not None and self.recorder.is_running():
+                    return {"ok": False, "error": "already running"}
+                if self.recorder is not None:
+                    self.recorder.close()  # stopped one: remove its shared memory before the new one creates it
+                    self.recorder = None
+                self.recorder = self.new_recorder(request["port"], request["rdrive"],
+                                                  request.get("options", {}))
+                self.recorder.start()
+                log.info("recorder started")
+                return {"ok": True}
+
+            if cmd == "stop":
+                if self.recorder is not None:
+                    self.recorder.stop()
+                    log.info("recorder stopped")
+                return {"ok": True}
+
+            if cmd == "clear":
+                if self.recorder is not None:
+                    self.recorder.clear()
+                return {"ok": True}
+
+            if cmd == "status":
+                if self.recorder is None:
+                    return {"ok": True, "model": self.model, "running": False}
+                x = self.recorder.status()
+                x["ok"] = True
+                return x
+
+            if cmd == "log":
+                # recent events for the GUI
+                return {"ok": True, "events": logs.recent(request.get("n"))}
+
+            if cmd == "data":
+                if self.recorder is None:
+                    return {"ok": True, "wind": [], "v": []}
+                x = self.recorder.data()
+                x["ok"] = True
+                return x
+
+            if cmd == "shutdown":
+                if self.recorder is not None:
+                    self.recorder.stop()
+                    self.recorder.close()
+                    self.recorder = None
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return {"ok": True}
+
+        return {"ok": False, "error": "unknown command: %s" % cmd}
+
+
+class Handler(socketserver.StreamRequestHandler):
+    # one json request per line, one json reply per line
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.service.execute(json.loads(line))
+            except Exception as e:
+                reply = {"ok": False, "error": repr(e)}
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class RecorderClient(object):
+    """Used by the GUI, a new connection per request so the service can restart any time."""
+    def __init__(self, model="gmx500", timeout=5):
+        self.address = (SERVICE_HOST, SERVICE_PORT[model])
+        self.model = model
+        self.timeout = timeout
+
+    def request(self, cmd, **kw):
+        kw["cmd"] = cmd
+        with socket.create_connection(self.address, timeout=self.timeout) as s:
+            s.sendall((json.dumps(kw) + "\n").encode())
+            f = s.makefile("rb")
+            reply = json.loads(f.readline())
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error"))
+        return reply
+
+    def is_alive(self):
+        try:
+            self.request("status")
+            return True
+        except Exception:
+            return False
+
+    def launch(self, wait=10):
+        """Start the service in a new session: it keeps running when the GUI closes."""
+        if self.is_alive():
+            return True
+        log = open(os.path.join(LOCAL_DATA_PATH, "recorder_service_%s.log" % self.model), "a")
+        here = os.path.dirname(os.path.abspath(__file__))
+        subprocess.Popen([sys.executable, "-u", os.path.join(here, "recorder_service.py"), self.model],
+                         cwd=here, stdout=log, stderr=log, start_new_session=True)
+        t0 = time.time()
+        while time.time() - t0 < wait:
+            if self.is_alive():
+                return True
+            time.sleep(0.2)
+        return False
+
+
+def main(model="gmx500"):
+    logs.setup("service_%s" % model, LOCAL_DATA_PATH)
+    service = Service(model)
+    server = Server((SERVICE_HOST, SERVICE_PORT[model]), Handler)
+    server.service = service
+    service.server = server
+    log.info("recorder service '%s' listening on %s:%s", model, *server.server_address)
+    if METRICS_PORT[model]:
+        MetricsServer(lambda: service.recorder, METRICS_PORT[model]).start()
+    profiler.install_signal(LOCAL_DATA_PATH)  # kill -USR1 <pid>
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if service.recorder is not None:
+            service.recorder.stop()
+            service.recorder.close()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "gmx500")
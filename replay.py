@@ -0,0 +1,213 @@
+# Replay archived data through the recorder pipeline (parse, persist, publish),
+# for soak tests of rotation, R drive copy and GUI rendering, and for profiling with real data.
+# Input: hour csv files (GMX500 or WindSonic schema, a file or a folder: its ????????_??.csv files,
+# not event files or logs) or raw serial logs, named explicitly: one frame per line,
+# "epoch<TAB>frame" or just the frame.
+# $ python replay.py gmx500 /home/picarro/Wind_data/202410 --speed 100 --out /tmp/replay
+# $ python replay.py windsonic wind.log --rate 4 --speed max --out /tmp/replay
+# GUIs and other shared memory readers display the replayed data like live data.
+
+import argparse
+import glob
+import os
+import time
+
+# customized files
+import frames
+import logs
+from recorder import GMX500Recorder, WindSonicRecorder, READ_TIMEOUT
+from pipeline import QUEUE_SIZE
+from simulator import checksum
+
+SPEEDS = {"1": 1.0, "10": 10.0, "100": 100.0, "max": 0.0}
+STATS_INTERVAL = 10  # s
+SHM_REPLAY = "windpi_replay_%s"  # shared memory of the replayed recorder, by pid
+HOUR_FILES = "????????_??.csv"  # found in folders; raw logs are named explicitly
+
+
+def gmx500_row_to_frame(y):
+    # hour csv row (18 items) -> GMX500 frame
+    body = "Q,%s,%s:%s:%s,%s,%s,0000," % (",".join(y[2:12]), y[12], y[13], y[14], y[15], y[16])
+    return "\x02%s\x03%s\r\n" % (body, checksum(body))
+
+
+def windsonic_row_to_frame(y):
+    # hour csv row (6 items) -> WindSonic frame
+    body = "Q,%s,%s,M,00," % (y[2], y[3])
+    return "\x02%s\x03%s\r\n" % (body, checksum(body))
+
+
+def list_files(paths):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += sorted(glob.glob(os.path.join(p, "**", HOUR_FILES), recursive=True))
+        else:
+            files.append(p)
+    return files
+
+
+class ReplayINA219(object):
+    """Battery voltage of the replayed row, in place of the I2C board."""
+    def __init__(self, replay):
+        self.replay = replay
+
+    @property
+    def bus_voltage(self):
+        return self.replay.battery
+
+    @property
+    def shunt_voltage(self):
+        return 0.0
+
+
+class Replay(object):
+    """
+    Serial port stand-in for Recorder(source=Replay(...)): readline() returns
+    archived frames, clock() the archived time of the last frame.
+    speed: 1 real time, 10, 100..., 0 as fast as the pipeline takes them (no data dropped).
+    rate: Hz, timestamps of raw frames logged without time.
+    """
+    def __init__(self, paths, speed=1.0, rate=1.0):
+        self.files = list_files(paths)
+        self.speed = speed
+        self.rate = rate
+        self.pipe = None  # set by Recorder.start()
+        self.lines = self.frames()
+
+        self.count = 0  # frames replayed
+        self.skipped = 0  # csv rows that could not be turned into a frame
+        self.battery = float("nan")
+        self.done = False
+        self.t_wall = None  # wall clock and data time at first frame
+        self.t_data = None
+
+        # first frame, so clock() is right before the first read
+        self.next_epoch, self.next_line, self.next_battery = next(self.lines, (None, None, None))
+        self.epoch = self.next_epoch if self.next_epoch is not None else time.time()
+
+    def frames(self):
+        """Yields (epoch, frame bytes, battery voltage) from all files."""
+        epoch = None
+        for path in self.files:
+            with open(path, errors="replace") as f:
+                header = f.readline()
+                if header == frames.HEADER_GMX500 or header == frames.HEADER_WINDSONIC:
+                    gmx500 = header == frames.HEADER_GMX500
+                    for row in f:
+                        y = row.rstrip("\r\n").split(",")
+                        try:
+                            if gmx500:
+                                yield float(y[0]), gmx500_row_to_frame(y).encode(), float(y[17])
+                            else:
+                                yield float(y[0]), windsonic_row_to_frame(y).encode(), float("nan")
+                        except (ValueError, IndexError):
+                            self.skipped += 1
+                    continue
+
+                # raw serial log
+                f.seek(0)
+                for line in f:
+                    timed = False
+                    if "\t" in line:
+                        t, x = line.split("\t", 1)
+                        try:
+                            epoch = float(t)
+                            line, timed = x, True
+                        except ValueError:
+                            pass
+                    if epoch is None:
+                        epoch = os.path.getmtime(path)
+                    elif not timed:
+                        epoch += 1.0 / self.rate
+                    yield epoch, line.encode(), float("nan")
+
+    def clock(self):
+        return self.epoch
+
+    def readline(self):
+        if self.next_line is None:
+            self.done = True
+            time.sleep(READ_TIMEOUT)
+            return b""
+
+        # lossless: wait while the pipeline is busy instead of dropping frames
+        t0 = time.time()
+        while self.pipe is not None and self.pipe.backlog() > QUEUE_SIZE // 2:
+            if time.time() - t0 > READ_TIMEOUT:
+                return b""
+            time.sleep(0.002)
+
+        if self.speed > 0:
+            if self.t_wall is None:
+                self.t_wall, self.t_data = time.time(), self.next_epoch
+            delay = self.t_wall + (self.next_epoch - self.t_data) / self.speed - time.time()
+            if delay > READ_TIMEOUT:
+                # long gap in the archive, return so stop() is never blocked
+                time.sleep(READ_TIMEOUT)
+                return b""
+            if delay > 0:
+                time.sleep(delay)
+
+        x = self.next_line
+        self.epoch, self.battery = self.next_epoch, self.next_battery
+        self.count += 1
+        self.next_epoch, self.next_line, self.next_battery = next(self.lines, (None, None, None))
+        return x
+
+    def close(self):
+        self.lines.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay archived wind data through the recorder pipeline")
+    parser.add_argument("model", choices=["gmx500", "windsonic"])
+    parser.add_argument("paths", nargs="+", help="hour csv files, raw serial logs or folders")
+    parser.add_argument("--speed", default="1", help="1, 10, 100, any factor, or max")
+    parser.add_argument("--rate", type=float, default=1.0, help="Hz, for raw logs without timestamps")
+    parser.add_argument("--out", required=True, help="folder for the replayed hour files")
+    parser.add_argument("--rdrive", default=None, help="R drive folder, default: OUT/rdrive")
+    args = parser.parse_args()
+    logs.setup("replay", folder=None)
+
+    speed = SPEEDS[args.speed] if args.speed in SPEEDS else float(args.speed)
+    rdrive = args.rdrive or os.path.join(args.out, "rdrive")
+    for folder in (args.out, rdrive):
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    replay = Replay(args.paths, speed, args.rate)
+    print("replay %s files at %s" % (len(replay.files), "max speed" if not speed else "%gx" % speed))
+    # own shared memory: a recorder running on this Pi keeps its live rings (GUI, dashboard)
+    shm_name = SHM_REPLAY % os.getpid()
+    if args.model == "gmx500":
+        rec = GMX500Recorder(None, rdrive, local_data_path=args.out, source=replay,
+                             ina219=ReplayINA219(replay), shm_name=shm_name)
+    else:
+        rec = WindSonicRecorder(None, rdrive, local_data_path=args.out, source=replay,
+                                data_rate=max(int(args.rate), 1), shm_name=shm_name)
+
+    t0 = time.time()
+    rec.start()
+    try:
+        stats_tag = time.time()
+        while not replay.done:
+            time.sleep(0.2)
+            if time.time() - stats_tag > STATS_INTERVAL:
+                print("%s frames, %s | %s" % (replay.count, time.ctime(replay.clock()), rec.pipe.stats_line()))
+                stats_tag = time.time()
+    except KeyboardInterrupt:
+        pass
+    while rec.pipe.backlog():
+        time.sleep(0.1)
+    print(rec.pipe.stats_line())
+    print(rec.metrics_line())
+    rec.stop()
+    rec.close()
+    dt = time.time() - t0
+    print("replayed %s frames (%s skipped rows) in %.1f s: %.0f frames/s, %s rotations" %
+          (replay.count, replay.skipped, dt, replay.count / max(dt, 1e-9), rec.storage.rotation_count))
+
+
+if __name__ == "__main__":
+    main()
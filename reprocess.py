@@ -0,0 +1,389 @@
+# Reprocess the archive of hour files in parallel: every hour file of a date
+# range goes through one pipeline in a process pool. Finished files are written
+# to a checkpoint, an interrupted run (Ctrl+C, power cut) resumes where it stopped;
+# files changed since (mtime, size) are done again.
+# Works on LOCAL_DATA_PATH or the R drive tree, both are <root>/20241010/20241010_14.csv
+#
+# $ python reprocess.py validate /home/picarro/Wind_data --start 20240101 --end 20241231 --out /tmp/re
+# $ python reprocess.py rollup /mnt/r/.../GMX500 --period 600 --out /home/picarro/rollups
+# $ python reprocess.py convert /home/picarro/Wind_data --format parquet --out /home/picarro/parquet
+# $ python reprocess.py windrose /home/picarro/Wind_data --in-place      rose next to every hour file
+#
+# pipelines:
+#   derive    recompute derived columns (WindSonic speed/direction; GMX500 corrected u/v, Magnus dew point)
+#   validate  completeness, gaps, bursts (qa.py), unparsable rows, values out of range
+#   convert   numeric columns to .npz or .parquet (pandas + pyarrow)
+#   rollup    windstats over fixed windows, one csv for the whole range
+#   windrose  direction x speed histogram and channel stats per hour (roses.py), as the recorder
+#             writes them at rotation (backfill with --in-place), summed for the range
+#   spectra   Welch spectra and integral time scales over sliding windows (spectra.py), per hour file,
+#             one csv of the integral scales for the range
+#   timing    host clock offset, drift and latency against GPS_Time (timing.py, GMX500), the timing
+#             file the recorder writes at rotation (backfill with --in-place), one csv of hour summaries
+
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# customized files
+import derive
+import frames
+import qa
+import roses
+import spectra
+import timing
+import windstats
+
+LOCAL_DATA_PATH = "/home/picarro/Wind_data"
+PROGRESS_INTERVAL = 10  # s
+RATE_WINDSONIC = 4.0  # Hz, default WindSonic data rate
+
+# plausible ranges, values outside count as suspect in validate
+RANGES = {
+    "gmx500": {"Corrected_Speed_m/s": (0, 75), "Corrected_Direction": (0, 360), "Pressure_hPa": (500, 1100),
+               "Relative_Humidity_%": (0, 100), "Temperature_C": (-50, 70), "Battery_V": (9, 16)},
+    "windsonic": {"speed": (0, 75), "direction": (0, 360)},
+}
+# direction and speed columns of the wind rose
+ROSE_COLUMNS = {"gmx500": ("Corrected_Direction", "Corrected_Speed_m/s"), "windsonic": ("direction", "speed")}
+SUFFIX = {"derive": ".csv", "validate": ".qa.json", "convert": None, "rollup": ".rollup.csv",
+          "windrose": roses.SUFFIX, "spectra": spectra.SUFFIX, "timing": timing.SUFFIX}
+
+
+def hour_files(root, start=None, end=None):
+    """Hour files under root/<day>/, days from start to end (YYYYMMDD, inclusive)."""
+    files = []
+    for day in sorted(os.listdir(root)):
+        if len(day) != 8 or not day.isdigit() or not os.path.isdir(os.path.join(root, day)):
+            continue
+        if (start and day < start) or (end and day > end):
+            continue
+        files += sorted(glob.glob(os.path.join(root, day, "%s_??.csv" % day)))
+    return files
+
+
+def output_path(path, pipeline, out, suffix):
+    """Mirror of the archive layout under out/<pipeline>/, or next to the hour file if out is None."""
+    name = os.path.basename(path)[:-len(".csv")] + suffix
+    if out is None:
+        return os.path.join(os.path.dirname(path), name)
+    folder = os.path.join(out, pipeline, os.path.basename(os.path.dirname(path)))
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, name)
+
+
+# pipelines: (path, destination, options) -> small json-able result
+def do_derive(path, dest, opts):
+    header, names, rows = frames.read_csv(path)
+    model = frames.model_of(header)
+    if model == "windsonic":
+        cols, (u, v, speed, direction) = frames.numeric(names, rows, ["U_velocity_NS", "V_velocity_WE",
+                                                                      "speed", "direction"])
+        u, v = np.array(u), np.array(v)
+        new_speed = derive.wind_speed(u, v)
+        new_dir = derive.wind_uv_to_dir(u, v)
+        changed = int(np.count_nonzero((np.abs(new_speed - np.array(speed)) > 1e-6) |
+                                       (np.abs(new_dir - np.array(direction)) > 1e-6)))
+        i, j = names.index("speed"), names.index("direction")
+        for y, s, d in zip(rows, new_speed.tolist(), new_dir.tolist()):
+            y[i], y[j] = str(s), str(d)
+        extra_header = ""
+    else:
+        cols, (direction, speed, rh, t, dp) = frames.numeric(names, rows, [
+            "Corrected_Direction", "Corrected_Speed_m/s", "Relative_Humidity_%", "Temperature_C", "Dew_point_C"])
+        u, v = derive.dir_to_uv(np.array(direction), np.array(speed))
+        magnus = derive.dew_point(np.array(t), np.array(rh))
+        ok = derive.dew_point_ok(np.array(t), np.array(rh), np.array(dp))
+        changed = int(np.count_nonzero(~ok))
+        for y, a, b, c, d in zip(rows, u.tolist(), v.tolist(), magnus.tolist(), ok.tolist()):
+            y += ["%.4f" % a, "%.4f" % b, "%.2f" % c, str(int(d))]
+        extra_header = ",corrected_u,corrected_v,dew_point_magnus,dew_point_ok"
+    tmp = dest + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(header.rstrip("\n") + extra_header + "\n")
+        f.writelines(",".join(y) + "\n" for y in rows)
+    os.replace(tmp, dest)
+    return {"rows": len(rows), "changed": changed}
+
+
+def do_validate(path, dest, opts):
+    sidecars = opts["in_place"] or opts["sidecars"]
+    x = qa.check_file(path, opts["rate"], sidecar=sidecars)  # also the row flags
+    header, names, rows = frames.read_csv(path)
+    model = frames.model_of(header)
+    limits = RANGES[model]
+    cols, values = frames.numeric(names, rows, list(limits))
+    out_of_range = {}
+    with np.errstate(invalid="ignore"):
+        for c, a in zip(cols, values):
+            a = np.array(a)
+            lo, hi = limits[c]
+            out_of_range[c] = int(np.count_nonzero(~((a >= lo) & (a <= hi))))
+    x["model"] = model
+    x["out_of_range"] = out_of_range
+    if model == "gmx500":
+        cols, (rh, t, dp) = frames.numeric(names, rows, ["Relative_Humidity_%", "Temperature_C", "Dew_point_C"])
+        x["dew_point_suspect"] = int(np.count_nonzero(~derive.dew_point_ok(np.array(t), np.array(rh), np.array(dp))))
+    if sidecars:
+        qa.write_sidecar(path, x)
+    # the report keeps the counts, not the event lists
+    del x["gaps"], x["bursts"]
+    return x
+
+
+def do_convert(path, dest, opts):
+    header, names, rows = frames.read_csv(path)
+    cols, values = frames.numeric(names, rows)
+    arrays = {c: np.array(a, dtype=float) for c, a in zip(cols, values)}
+    if opts["format"] == "parquet":
+        import pandas as pd
+        pd.DataFrame(arrays).to_parquet(dest + ".tmp", index=False)
+    else:
+        with open(dest + ".tmp", "wb") as f:
+            np.savez_compressed(f, **arrays)
+    os.replace(dest + ".tmp", dest)
+    return {"rows": len(rows), "columns": len(cols)}
+
+
+def do_rollup(path, dest, opts):
+    epoch, u, v, extra, names, rate = windstats.read_hour(path)
+    rate = rate or opts["rate"]
+    w = windstats.Tumbling(opts["period"], rate, names)
+    results = []
+    for i in range(len(epoch)):
+        x = w.add(epoch[i], u[i], v[i], tuple(extra[i]))
+        if x is not None:
+            results.append(x)
+    x = w.flush()
+    if x is not None:
+        results.append(x)
+    keys = rollup_keys(names)
+    with open(dest + ".tmp", "w") as f:
+        f.write(",".join(keys) + "\n")
+        for x in results:
+            f.write("%.0f,%.0f," % (x["start"], x["end"]) + ",".join("%.6g" % x[k] for k in keys[2:]) + "\n")
+    os.replace(dest + ".tmp", dest)
+    return {"windows": len(results)}
+
+
+def rollup_keys(names):
+    return ["start", "end"] + windstats.KEYS + ["%s_%s" % (c, s) for c in names for s in ("mean", "std")]
+
+
+# same file as written by the recorder at rotation: backfill with --in-place
+def do_windrose(path, dest, opts):
+    header, names, rows = frames.read_csv(path)
+    model = frames.model_of(header)
+    channels = roses.CHANNELS[model]
+    cols, values = frames.numeric(names, rows, ["epoch_time"] + list(ROSE_COLUMNS[model]) + [c for n, c in channels])
+    epoch, direction, speed = values[:3]
+    counts = roses.histogram(direction, speed)
+    roses.save(dest, counts, names=roses.channel_names(model), stats=roses.channel_stats(values[3:]),
+               first=epoch[0] if epoch else None, last=epoch[-1] if epoch else None)
+    return {"samples": int(counts.sum())}
+
+
+# windows start again at every hour file (the live recorder runs across hours)
+def do_spectra(path, dest, opts):
+    a, results, data = spectra.analyze_hour(path, opts["window"], rate=opts["rate"])
+    spectra.save(dest, results, a.freq, a.rate, a.nperseg)
+    return {"windows": len(results)}
+
+
+# the clock filter starts again at every hour file: unlocked for its first minutes
+def do_timing(path, dest, opts):
+    hour = timing.analyze_hour(path)
+    hour.save(dest)
+    return timing.summary(hour)
+
+
+PIPELINES = {"derive": do_derive, "validate": do_validate, "convert": do_convert,
+             "rollup": do_rollup, "windrose": do_windrose, "spectra": do_spectra, "timing": do_timing}
+
+
+def run_one(task):
+    pipeline, path, dest, opts = task
+    t0 = time.time()
+    try:
+        x = PIPELINES[pipeline](path, dest, opts)
+    except Exception as e:
+        return path, {"error": "%s: %s" % (type(e).__name__, e)}
+    x["seconds"] = round(time.time() - t0, 3)
+    return path, x
+
+
+class Checkpoint(object):
+    """Finished files, one json line each: path, mtime, size, result."""
+    def __init__(self, path, restart=False):
+        self.path = path
+        self.done = {}
+        if restart and os.path.isfile(path):
+            os.remove(path)
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        x = json.loads(line)
+                    except ValueError:
+                        continue  # last line cut by the interruption
+                    self.done[x["file"]] = x
+        self.f = open(path, "a")
+
+    @staticmethod
+    def key(path):
+        st = os.stat(path)
+        return st.st_mtime, st.st_size
+
+    def is_done(self, path):
+        x = self.done.get(path)
+        return x is not None and (x["mtime"], x["size"]) == self.key(path) and "error" not in x["result"]
+
+    def add(self, path, result):
+        mtime, size = self.key(path)
+        x = {"file": path, "mtime": mtime, "size": size, "result": result}
+        self.done[path] = x
+        self.f.write(json.dumps(x) + "\n")
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def finish(pipeline, files, checkpoint, out, name, opts):
+    """Range outputs from the per-hour results."""
+    results = [(f, checkpoint.done[f]["result"]) for f in files if f in checkpoint.done]
+    results = [(f, x) for f, x in results if "error" not in x]
+    if pipeline == "validate":
+        path = os.path.join(out, "validate_%s.csv" % name)
+        cols = qa.REPORT_COLUMNS + ["dew_point_suspect", "out_of_range"]
+        with open(path, "w") as f:
+            f.write(",".join(cols) + "\n")
+            for p, x in results:
+                x["out_of_range"] = sum(x["out_of_range"].values())
+                f.write(",".join(str(x.get(c, "")) for c in cols) + "\n")
+        return path
+    if pipeline == "rollup":
+        path = os.path.join(out, "rollup_%s.csv" % name)
+        header = None
+        with open(path, "w") as f:
+            for p, x in results:
+                with open(output_path(p, pipeline, opts["out"], SUFFIX[pipeline])) as g:
+                    h = g.readline()
+                    if header is None:
+                        header = h
+                        f.write(h)
+                    f.writelines(g)
+        return path
+    if pipeline == "windrose":
+        total = roses.merge(roses.load(output_path(p, pipeline, opts["out"], SUFFIX[pipeline])) for p, x in results)
+        if total is None:
+            return None
+        path = os.path.join(out, "windrose_%s.npz" % name)
+        roses.save(path, total["counts"], total["nsector"], total["bins"], total["names"], total["stats"],
+                   *total["span"])
+        return path
+    if pipeline == "spectra":
+        path = os.path.join(out, "spectra_%s.csv" % name)
+        with open(path, "w") as f:
+            f.write("start,end,integral_time_u,integral_time_v,integral_time_speed,integral_length,"
+                    "variance_u,variance_v,variance_speed\n")
+            for p, x in results:
+                y = spectra.load(output_path(p, pipeline, opts["out"], SUFFIX[pipeline]))
+                for i in range(len(y["end"])):
+                    f.write("%.0f,%.0f," % (y["start"][i], y["end"][i]) +
+                            ",".join("%.6g" % z for z in list(y["integral_time"][i]) + [y["integral_length"][i]] +
+                                     list(y["variance"][i])) + "\n")
+        return path
+    if pipeline == "timing":
+        path = os.path.join(out, "timing_%s.csv" % name)
+        cols = ["rows", "offset", "drift_ppm", "latency_p50", "latency_p99", "latency_max", "late", "no_gps",
+                "unlocked", "steps"]
+        with open(path, "w") as f:
+            f.write(",".join(["file"] + cols) + "\n")
+            for p, x in results:
+                f.write(",".join([os.path.basename(p)] + ["" if x.get(c) is None else str(x[c]) for c in cols]) +
+                        "\n")
+        return path
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocess hour files in parallel")
+    parser.add_argument("pipeline", choices=sorted(PIPELINES))
+    parser.add_argument("root", nargs="?", default=LOCAL_DATA_PATH, help="LOCAL_DATA_PATH or R drive folder")
+    parser.add_argument("--start", default=None, help="first day, YYYYMMDD")
+    parser.add_argument("--end", default=None, help="last day, YYYYMMDD")
+    parser.add_argument("--out", default=None, help="output folder (checkpoint, per-hour and range outputs)")
+    parser.add_argument("--in-place", action="store_true", help="per-hour outputs next to the hour files")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="parallel processes")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint, do everything again")
+    parser.add_argument("--rate", type=float, default=RATE_WINDSONIC, help="Hz, WindSonic data rate")
+    parser.add_argument("--period", type=float, default=600, help="s, rollup window, divides 3600")
+    parser.add_argument("--window", type=float, default=spectra.WINDOW_SECONDS, help="s, spectra window")
+    parser.add_argument("--format", choices=["npz", "parquet"], default="npz", help="convert output")
+    parser.add_argument("--sidecars", action="store_true", help="validate: also write .qa.json and .flags.npy next to the hour files")
+    args = parser.parse_args()
+
+    if args.out is None and not args.in_place:
+        parser.error("--out or --in-place is required")
+    if args.in_place and args.pipeline in ("derive", "convert"):
+        parser.error("%s does not overwrite the archive, use --out" % args.pipeline)
+    if 3600 % args.period:
+        parser.error("--period must divide 3600, windows cannot span two hour files")
+    if args.pipeline == "convert" and args.format == "parquet":
+        try:
+            import pandas, pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("parquet needs pandas and pyarrow: pip install pandas pyarrow")
+    out = args.out or args.root
+    os.makedirs(out, exist_ok=True)
+
+    opts = {"rate": args.rate, "period": args.period, "window": args.window, "format": args.format, "sidecars": args.sidecars,
+            "in_place": args.in_place, "out": None if args.in_place else args.out}
+    suffix = SUFFIX[args.pipeline] or "." + args.format
+    files = hour_files(args.root, args.start, args.end)
+    name = "%s_%s" % (args.start or "first", args.end or "last")
+    checkpoint = Checkpoint(os.path.join(out, "%s_%s.checkpoint.jsonl" % (args.pipeline, name)), args.restart)
+    todo = [f for f in files if not checkpoint.is_done(f)]
+    print("%s: %s hour files, %s done before, %s to do, %s processes" %
+          (args.pipeline, len(files), len(files) - len(todo), len(todo), args.jobs))
+
+    t0 = tag = time.time()
+    done = errors = 0
+    futures = []
+    try:
+        with ProcessPoolExecutor(args.jobs) as pool:
+            futures = [pool.submit(run_one, (args.pipeline, f, output_path(f, args.pipeline, opts["out"], suffix),
+                                             opts)) for f in todo]
+            for fut in as_completed(futures):
+                path, x = fut.result()
+                checkpoint.add(path, x)
+                done += 1
+                if "error" in x:
+                    errors += 1
+                    print("error %s: %s" % (path, x["error"]))
+                if time.time() - tag > PROGRESS_INTERVAL or done == len(todo):
+                    rate = done / max(time.time() - t0, 1e-9)
+                    print("%s/%s files, %.1f files/s, %s errors, %.0f s left" %
+                          (done, len(todo), rate, errors, (len(todo) - done) / max(rate, 1e-9)))
+                    tag = time.time()
+    except KeyboardInterrupt:
+        print("interrupted, %s files done, run again to resume" % done)
+        for fut in futures:
+            fut.cancel()
+        checkpoint.close()
+        return
+    checkpoint.close()
+
+    path = finish(args.pipeline, files, checkpoint, out, name, opts)
+    if path:
+        print("saved %s" % path)
+
+
+if __name__ == "__main__":
+    main()
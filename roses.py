@@ -0,0 +1,237 @@
+# Wind rose histograms with fixed bins: direction sectors x speed classes,
+# plus mergeable summary stats (n, sum, sum of squares, min, max) per channel.
+# The recorder writes one per hour file at rotation (20241010_14.rose.npz, next to
+# the csv and copied to R drive with it), reprocess.py backfills older archives:
+# $ python reprocess.py windrose /home/picarro/Wind_data --in-place
+# A rose of any period is then a sum of small arrays instead of a rescan of the data:
+# $ python roses.py /home/picarro/Wind_data --start 20240701 --end 20240731 --hours 12-17 --png july_pm.png
+# Binning is the one of windrose.histogram() with bins=SPEED_BINS, nsector=NSECTOR:
+# sectors centred on north, speed classes [bin, next bin), the last one open.
+
+import argparse
+import bisect
+import glob
+import math
+import os
+
+import numpy as np
+
+NSECTOR = 16
+SPEED_BINS = [0.0, 1.0, 2.0, 3.0, 4.0, 6.0, 8.0, 10.0, 15.0]  # m/s, lower edges
+MAX_SAMPLES = 1000000  # samples handed to WindroseAxes when drawing a histogram
+SUFFIX = ".rose.npz"
+# summarized channels per model: (name, hour file column)
+CHANNELS = {
+    "gmx500": (("speed", "Corrected_Speed_m/s"), ("pressure", "Pressure_hPa"), ("humidity", "Relative_Humidity_%"),
+               ("temperature", "Temperature_C"), ("battery_v", "Battery_V")),
+    "windsonic": (("speed", "speed"),),
+}
+
+
+def channel_names(model):
+    return tuple(name for name, column in CHANNELS[model])
+
+
+def dir_edges(nsector=NSECTOR):
+    angle = 360.0 / nsector
+    return np.arange(-angle / 2, 360.0 + angle, angle)
+
+
+def histogram(direction, speed, nsector=NSECTOR, bins=SPEED_BINS):
+    """Counts, shape (speed classes, sectors), int64. nan samples are left out."""
+    direction = np.asarray(direction, dtype=float)
+    speed = np.asarray(speed, dtype=float)
+    ok = np.isfinite(direction) & np.isfinite(speed)
+    table = np.histogram2d(speed[ok], direction[ok], bins=[list(bins) + [np.inf], dir_edges(nsector)])[0]
+    table[:, 0] += table[:, -1]  # north: [-angle/2, angle/2) and [360 - angle/2, 360 + angle/2]
+    return table[:, :-1].astype(np.int64)
+
+
+class HourRose(object):
+    """
+    Histogram and channel summaries built one sample at a time, O(1) per sample
+    (the recorder persist stage), same counts as histogram().
+    """
+    def __init__(self, names=("speed",), nsector=NSECTOR, bins=SPEED_BINS):
+        self.names = tuple(names)
+        self.nsector = nsector
+        self.bins = list(bins)
+        self.edges = dir_edges(nsector).tolist()
+        self.reset()
+
+    def reset(self):
+        self.counts = np.zeros((len(self.bins), self.nsector), dtype=np.int64)
+        k = len(self.names)
+        self.n = [0] * k
+        self.sum = [0.0] * k
+        self.sumsq = [0.0] * k
+        self.min = [math.inf] * k
+        self.max = [-math.inf] * k
+        self.first = None
+        self.last = None
+
+    def add(self, epoch, direction, speed, channels=()):
+        if self.first is None:
+            self.first = epoch
+        self.last = epoch
+        # np.histogram2d: [edge, next edge), the last bin includes its right edge
+        if direction == direction and speed == speed:
+            j = bisect.bisect_right(self.edges, direction) - 1
+            if direction == self.edges[-1]:
+                j = self.nsector
+            i = bisect.bisect_right(self.bins, speed) - 1
+            if 0 <= j <= self.nsector and i >= 0:
+                self.counts[i, j % self.nsector] += 1
+        for k, x in enumerate(channels):
+            if x == x:
+                self.n[k] += 1
+                self.sum[k] += x
+                self.sumsq[k] += x * x
+                if x < self.min[k]:
+                    self.min[k] = x
+                if x > self.max[k]:
+                    self.max[k] = x
+
+    def save(self, path):
+        save(path, self.counts, self.nsector, self.bins, self.names,
+             np.array([self.n, self.sum, self.sumsq, self.min, self.max], dtype=float),
+             self.first, self.last)
+
+
+def channel_stats(values):
+    """Stats rows n, sum, sumsq, min, max of a list of arrays (one per channel), nan left out."""
+    stats = np.zeros((5, len(values)))
+    stats[3], stats[4] = np.inf, -np.inf
+    for k, x in enumerate(values):
+        x = np.asarray(x, dtype=float)
+        x = x[~np.isnan(x)]
+        if len(x):
+            stats[:, k] = [len(x), x.sum(), (x * x).sum(), x.min(), x.max()]
+    return stats
+
+
+def save(path, counts, nsector=NSECTOR, bins=SPEED_BINS, names=(), stats=None, first=None, last=None):
+    """stats: rows n, sum, sumsq, min, max; one column per name."""
+    if stats is None:
+        stats = np.zeros((5, 0))
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, counts=counts, nsector=nsector, bins=np.asarray(bins, dtype=float),
+                 names=np.array(names, dtype=str), stats=stats,
+                 span=np.array([np.nan if first is None else first, np.nan if last is None else last]))
+    os.replace(path + ".tmp", path)
+
+
+def load(path):
+    """dict: counts, nsector, bins, names, stats, span"""
+    with np.load(path) as x:
+        return {"counts": x["counts"], "nsector": int(x["nsector"]), "bins": x["bins"].tolist(),
+                "names": x["names"].tolist(), "stats": x["stats"], "span": x["span"].tolist()}
+
+
+def merge(roses):
+    """Sum of roses with the same binning. Channel stats are merged by name."""
+    total = None
+    for r in roses:
+        if total is None:
+            total = {k: (v.copy() if isinstance(v, np.ndarray) else list(v) if isinstance(v, list) else v)
+                     for k, v in r.items()}
+            continue
+        if r["nsector"] != total["nsector"] or r["bins"] != total["bins"]:
+            raise ValueError("roses with different bins cannot be merged")
+        total["counts"] = total["counts"] + r["counts"]
+        for k, name in enumerate(r["names"]):
+            if name not in total["names"]:
+                total["names"].append(name)
+                total["stats"] = np.hstack([total["stats"], [[0], [0], [0], [np.inf], [-np.inf]]])
+            m = total["names"].index(name)
+            s, t = r["stats"][:, k], total["stats"][:, m]
+            total["stats"][:, m] = [t[0] + s[0], t[1] + s[1], t[2] + s[2], min(t[3], s[3]), max(t[4], s[4])]
+        total["span"] = [np.nanmin([total["span"][0], r["span"][0]]), np.nanmax([total["span"][1], r["span"][1]])]
+    return total
+
+
+def summary(rose):
+    """{name: {n, mean, std, min, max}} of the channel stats."""
+    x = {}
+    for k, name in enumerate(rose["names"]):
+        n, s, ss, lo, hi = rose["stats"][:, k]
+        mean = s / n if n else math.nan
+        x[name] = {"n": int(n), "mean": mean, "std": math.sqrt(max(ss / n - mean * mean, 0.0)) if n else math.nan,
+                   "min": lo if n else math.nan, "max": hi if n else math.nan}
+    return x
+
+
+def samples(counts, nsector=NSECTOR, bins=SPEED_BINS, max_samples=MAX_SAMPLES):
+    """
+    Direction and speed samples with exactly these counts (sector centres, a speed
+    inside each class), for WindroseAxes.bar(). Above max_samples the counts are
+    divided by their gcd, then scaled down (the rose is normed, proportions stay within 1/max_samples).
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if total > max_samples:
+        g = np.gcd.reduce(counts[counts > 0])
+        counts = counts // max(int(g), 1)
+        if counts.sum() > max_samples:
+            counts = np.round(counts * (max_samples / counts.sum())).astype(np.int64)
+    angle = 360.0 / nsector
+    centres = np.arange(nsector) * angle
+    speeds = [(bins[i] + bins[i + 1]) / 2 for i in range(len(bins) - 1)] + [bins[-1] + 1.0]
+    flat = counts.ravel()  # speed class major
+    return (np.repeat(np.tile(centres, len(bins)), flat),
+            np.repeat(np.repeat(speeds, nsector), flat))
+
+
+def rose_files(root, start=None, end=None, hours=None):
+    """Rose files under root/<day>/, days start..end (YYYYMMDD, inclusive), hours: set of local hours."""
+    files = []
+    for path in sorted(glob.glob(os.path.join(root, "????????", "????????_??" + SUFFIX))):
+        name = os.path.basename(path)
+        day, hour = name[:8], int(name[9:11])
+        if (start and day < start) or (end and day > end) or (hours is not None and hour not in hours):
+            continue
+        files.append(path)
+    return files
+
+
+def parse_hours(x):
+    """"12-17" or "6,7,8" -> set of hours"""
+    hours = set()
+    for part in x.split(","):
+        a, _, b = part.partition("-")
+        hours.update(range(int(a), int(b or a) + 1))
+    return hours
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wind rose of any period from the hourly rose files")
+    parser.add_argument("root", help="LOCAL_DATA_PATH or R drive folder")
+    parser.add_argument("--start", default=None, help="first day, YYYYMMDD")
+    parser.add_argument("--end", default=None, help="last day, YYYYMMDD")
+    parser.add_argument("--hours", default=None, help="local hours, e.g. 12-17")
+    parser.add_argument("--png", default=None, help="save the plot")
+    args = parser.parse_args()
+
+    files = rose_files(args.root, args.start, args.end, parse_hours(args.hours) if args.hours else None)
+    if not files:
+        print("no rose files, backfill: python reprocess.py windrose %s --in-place" % args.root)
+        return
+    total = merge(load(f) for f in files)
+    print("%s hour files, %s samples" % (len(files), int(total["counts"].sum())))
+    for name, s in summary(total).items():
+        print("%-12s n %9s  mean %9.3f  std %8.3f  min %9.3f  max %9.3f" %
+              (name, s["n"], s["mean"], s["std"], s["min"], s["max"]))
+    if args.png:
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib.figure import Figure
+        import plots
+        figure = Figure(figsize=(6, 6))
+        plots.draw_windrose_counts(figure, total["counts"], "%s..%s %s" % (
+            os.path.basename(files[0])[:11], os.path.basename(files[-1])[:11], args.hours or ""))
+        figure.savefig(args.png)
+        print("saved %s" % args.png)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# Live data in a shared memory ring buffer, one writer (the recorder),
+# any number of local readers (GUI, terminal dashboard, analysis scripts).
+# A seqlock in the header lets readers copy consistent data without locks.
+# $ python shm_ring.py windpi_gmx500      print the latest samples
+
+import sys
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+# header: int64 x 8
+SEQ = 0  # seqlock counter, odd while the writer is busy
+COUNT = 1  # total number of rows written
+BASE = 2  # rows before this count are cleared (clear plots)
+CAPACITY = 3
+NCOLS = 4
+HEADER_SIZE = 8 * 8
+
+# columns, all float64
+GMX500_COLUMNS = ["epoch_time", "velocity_u", "velocity_v", "direction", "speed",
+                  "corrected_direction", "corrected_speed", "pressure", "humidity",
+                  "temperature", "dew_point", "gps_latitude", "gps_longitude", "gps_height",
+                  "supply_voltage", "battery_v"]
+WINDSONIC_COLUMNS = ["epoch_time", "velocity_u", "velocity_v", "speed", "direction"]
+BATTERY_COLUMNS = ["epoch_time", "battery_v"]
+
+_created = set()  # segments created by this process
+
+
+def _untrack(shm):
+    # readers must not unlink the segment when they exit (python < 3.13)
+    if shm.name in _created:
+        return
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+
+class SharedRing(object):
+    """
+    Use SharedRing.create() in the recorder and SharedRing.attach() in readers.
+    """
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((8,), dtype=np.int64, buffer=shm.buf)
+        self.capacity = int(self.header[CAPACITY])
+        self.ncols = int(self.header[NCOLS])
+        self.data = np.ndarray((self.capacity, self.ncols), dtype=np.float64,
+                               buffer=shm.buf, offset=HEADER_SIZE)
+
+    @classmethod
+    def create(cls, name, ncols, capacity):
+        """Create the segment, or reuse it if one of the same shape exists."""
+        size = HEADER_SIZE + 8 * ncols * capacity
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            header = np.ndarray((8,), dtype=np.int64, buffer=shm.buf)
+            header[:] = 0
+            header[CAPACITY] = capacity
+            header[NCOLS] = ncols
+        except FileExistsError:
+            shm = shared_memory.SharedMemory(name=name)
+            header = np.ndarray((8,), dtype=np.int64, buffer=shm.buf)
+            if header[CAPACITY] != capacity or header[NCOLS] != ncols:
+                del header
+                shm.close()
+                shm.unlink()
+                return cls.create(name, ncols, capacity)
+            del header
+        _created.add(shm.name)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        shm = shared_memory.SharedMemory(name=name)
+        _untrack(shm)
+        return cls(shm, owner=False)
+
+    # writer
+    def append(self, row):
+        h = self.header
+        h[SEQ] += 1  # odd: writing
+        self.data[h[COUNT] % self.capacity] = row
+        h[COUNT] += 1
+        h[SEQ] += 1
+
+    def clear(self):
+        h = self.header
+        h[SEQ] += 1
+        h[BASE] = h[COUNT]
+        h[SEQ] += 1
+
+    # readers
+    def count(self):
+        return int(self.header[COUNT])
+
+    def latest(self, n=None, since=None, retries=100):
+        """
+        Copy of the newest n rows (all rows in the ring if n is None),
+        or of the rows written after total count `since`, oldest first.
+        Returns (rows, count): pass count as `since` next time to get new rows only.
+        """
+        h = self.header
+        for i in range(retries):
+            seq = int(h[SEQ])
+            if seq % 2:
+                time.sleep(0)
+                continue
+            count = int(h[COUNT])
+            first = max(count - self.capacity, int(h[BASE]))
+            if since is not None:
+                first = max(first, since)
+            if n is not None:
+                first = max(first, count - n)
+            idx = np.arange(first, count) % self.capacity
+            rows = self.data[idx]  # fancy indexing copies
+            if int(h[SEQ]) == seq:
+                return rows, count
+        raise RuntimeError("shared memory ring busy")
+
+    def close(self):
+        del self.header, self.data
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+            _created.discard(self.shm.name)
+
+
+def read_latest(name, n=None, columns=None):
+    """Attach, copy the newest n rows, detach. Empty array if no recorder is running."""
+    try:
+        ring = SharedRing.attach(name)
+    except FileNotFoundError:
+        return np.empty((0, len(columns) if columns else 0))
+    try:
+        rows, count = ring.latest(n)
+    finally:
+        ring.close()
+    if columns is not None:
+        rows = rows[:, columns]
+    return rows
+
+
+if __name__ == "__main__":
+    name = sys.argv[1] if len(sys.argv) > 1 else "windpi_gmx500"
+    ring = SharedRing.attach(name)
+    since = max(ring.count() - 10, 0)
+    try:
+        while True:
+            rows, since = ring.latest(since=since)
+            for row in rows:
+                print(",".join("%g" % x for x in row))
+            time.sleep(1)
+    except KeyboardInterrupt:
+        ring.close()
@@ -0,0 +1,220 @@
+# Anemometer simulator for load and regression testing without hardware (Linux).
+# Creates a pseudo-terminal and writes GMX500 or WindSonic M frames to it,
+# point the recorder at the printed port instead of /dev/ttyUSB0.
+# $ python simulator.py gmx500 --rate 32 --corrupt 0.01 --gap 0.01
+# FakeINA219 stands in for the I2C battery board: GMX500Recorder(..., ina219=FakeINA219())
+
+import argparse
+import os
+import pty
+import random
+import threading
+import time
+import tty
+
+# customized files
+import derive
+
+
+class FakeINA219(object):
+    """Same attributes as adafruit_ina219.INA219, battery slowly drains, reads can fail."""
+    def __init__(self, voltage=12.8, drain=0.0, noise=0.005, fail=0.0):
+        self.voltage = voltage
+        self.drain = drain  # V per hour
+        self.noise = noise
+        self.fail = fail  # probability of an I2C error
+        self.t0 = time.time()
+
+    def _check(self):
+        if self.fail and random.random() < self.fail:
+            raise OSError("simulated I2C error")
+
+    @property
+    def bus_voltage(self):
+        self._check()
+        hours = (time.time() - self.t0) / 3600
+        return self.voltage - self.drain * hours - 0.002 + random.gauss(0, self.noise)
+
+    @property
+    def shunt_voltage(self):
+        self._check()
+        return 0.002
+
+
+class Wind(object):
+    # random walk of wind speed and direction
+    def __init__(self, speed=3.0, direction=220.0):
+        self.speed = speed
+        self.direction = direction
+
+    def step(self):
+        self.speed = min(max(self.speed + random.gauss(0, 0.2), 0.0), 40.0)
+        self.direction = (self.direction + random.gauss(0, 5)) % 360
+        # meteorological direction: where the wind comes from, u/v as derive.py (Gill N-S / W-E axes)
+        u, v = derive.dir_to_uv_scalar(self.direction, self.speed)
+        return u, v, self.speed, self.direction
+
+
+def checksum(body):
+    # Gill: XOR of all characters between STX and ETX
+    c = 0
+    for ch in body:
+        c ^= ord(ch)
+    return "%02X" % c
+
+
+def gmx500_frame(wind, epoch):
+    u, v, speed, direction = wind.step()
+    gps_time = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(epoch)) + ".%d" % (int(epoch * 10) % 10)
+    body = "Q,%+07.2f,%+07.2f,%03d,%06.2f,%03d,%06.2f,%06.1f,%05.1f,%+05.1f,%+05.1f," \
+           "%+010.6f:%+011.6f:%+08.2f,%s,%+05.1f,0000," % (
+               u, v, int(direction), speed, int(direction), speed,
+               1013.2 + random.gauss(0, 0.1), 45.0 + random.gauss(0, 0.5),
+               21.4 + random.gauss(0, 0.05), 9.1 + random.gauss(0, 0.05),
+               37.385, -121.990, 45.2, gps_time, 12.1)
+    return "\x02%s\x03%s\r\n" % (body, checksum(body))
+
+
+def windsonic_frame(wind, epoch):
+    u, v, speed, direction = wind.step()
+    body = "Q,%+07.2f,%+07.2f,M,00," % (u, v)
+    return "\x02%s\x03%s\r\n" % (body, checksum(body))
+
+
+FRAMES = {"gmx500": gmx500_frame, "windsonic": windsonic_frame}
+
+
+class Simulator(object):
+    """
+    rate: frames per second
+    corrupt: probability a frame is garbled (bytes flipped or cut)
+    gap: probability a frame is lost
+    stall: probability per frame of a burst stall: frames are held back
+           for stall_time seconds, then written at once (backlogged UART)
+    disconnect_after: s, close the port after this time (device unplugged)
+    """
+    def __init__(self, model="gmx500", rate=1.0, corrupt=0.0, gap=0.0, stall=0.0,
+                 stall_time=3.0, disconnect_after=None, seed=None):
+        self.make_frame = FRAMES[model]
+        self.rate = rate
+        self.corrupt = corrupt
+        self.gap = gap
+        self.stall = stall
+        self.stall_time = stall_time
+        self.disconnect_after = disconnect_after
+        self.random = random.Random(seed)
+        if seed is not None:
+            random.seed(seed)
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)  # e.g. /dev/pts/3
+
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.sent = 0
+        self.lost = 0
+        self.corrupted = 0
+        self.stalls = 0
+
+    def garble(self, x):
+        self.corrupted += 1
+        b = list(x[:-2])
+        if self.random.random() < 0.5:
+            b = b[:self.random.randrange(1, len(b))]  # cut
+        else:
+            for i in range(3):
+                b[self.random.randrange(len(b))] = chr(self.random.randrange(32, 127))
+        return "".join(b) + "\r\n"
+
+    def run(self):
+        wind = Wind()
+        period = 1.0 / self.rate
+        t_next = time.time()
+        t_end = time.time() + self.disconnect_after if self.disconnect_after else None
+        held = []  # frames held back during a stall
+        stall_until = 0
+
+        while not self.stop_event.is_set():
+            now = time.time()
+            if t_end and now > t_end:
+                print("simulator: disconnect")
+                break
+
+            x = self.make_frame(wind, now)
+            if self.gap and self.random.random() < self.gap:
+                self.lost += 1
+                x = None
+            elif self.corrupt and self.random.random() < self.corrupt:
+                x = self.garble(x)
+
+            if self.stall and not stall_until and self.random.random() < self.stall:
+                stall_until = now + self.stall_time
+                self.stalls += 1
+            if x is not None:
+                held.append(x)
+            if now >= stall_until:
+                stall_until = 0
+                try:
+                    os.write(self.master, "".join(held).encode())
+                except OSError:
+                    break
+                self.sent += len(held)
+                held = []
+
+            t_next += period
+            delay = t_next - time.time()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                t_next = time.time()  # cannot keep up, do not burst
+
+        self.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="simulator", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(2)
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {"sent": self.sent, "lost": self.lost, "corrupted": self.corrupted, "stalls": self.stalls}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gill anemometer simulator on a pseudo-terminal")
+    parser.add_argument("model", nargs="?", default="gmx500", choices=sorted(FRAMES))
+    parser.add_argument("--rate", type=float, default=1.0, help="frames per second")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="probability of a garbled frame")
+    parser.add_argument("--gap", type=float, default=0.0, help="probability of a lost frame")
+    parser.add_argument("--stall", type=float, default=0.0, help="probability of a burst stall per frame")
+    parser.add_argument("--stall-time", type=float, default=3.0, help="s, length of a burst stall")
+    parser.add_argument("--disconnect-after", type=float, default=None, help="s, close the port after")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    sim = Simulator(args.model, args.rate, args.corrupt, args.gap, args.stall,
+                    args.stall_time, args.disconnect_after, args.seed)
+    print("simulated %s on port: %s" % (args.model, sim.port))
+    sim.start()
+    try:
+        while sim.thread.is_alive():
+            time.sleep(10)
+            print(sim.stats())
+    except KeyboardInterrupt:
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+# Turbulence spectra over sliding windows: Welch power spectral density and
+# integral time scales of u, v and speed, for plume dispersion on the roof.
+# Samples are cut into segments (SEGMENT_SECONDS, 50% overlap); every segment is
+# detrended, tapered and transformed once, its periodogram and autocovariance
+# then go into a running sum over the segments of the window (new in, oldest out).
+# A window update costs one segment FFT, whatever the window length or data rate.
+# Segments are contiguous: gaps of up to FILL_MAX samples (dropped frames, nan rows)
+# are filled by linear interpolation, a longer gap drops the unfinished segment
+# but keeps the finished ones, a gap longer than RESET_SECONDS restarts the window.
+#
+# live:     recorder "spectra" stage (low priority), per-window results in <hour>.spectra.npz
+# offline:  $ python reprocess.py spectra /home/picarro/Wind_data --in-place
+#           $ python spectra.py /home/picarro/Wind_data/20241010/20241010_14.csv --check
+# Same estimate as scipy.signal.welch(x, rate, "hann", nperseg, detrend="constant").
+
+import argparse
+import collections
+import os
+import time
+
+import numpy as np
+
+# customized files
+import windstats
+
+CHANNELS = ("u", "v", "speed")
+WINDOW_SECONDS = 600  # s, window of one spectrum
+SEGMENT_SECONDS = 128  # s, FFT segment, rounded to a power of two samples
+OVERLAP = 0.5
+GAP_FACTOR = 1.5  # a step above GAP_FACTOR / rate is a gap
+FILL_MAX = 2  # samples, shorter gaps are interpolated
+RESET_SECONDS = SEGMENT_SECONDS  # s, longer gaps restart the window
+NICE = 10  # live stage thread priority, 0 normal, 19 lowest
+SUFFIX = ".spectra.npz"
+
+
+def segment_length(rate, seconds=SEGMENT_SECONDS):
+    """Samples per segment: power of two closest to rate * seconds, at least 16."""
+    n = max(rate * seconds, 16)
+    return int(2 ** round(np.log2(n)))
+
+
+def hann(n):
+    """Periodic Hann window, as scipy.signal.get_window("hann", n)."""
+    return 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n) / n)
+
+
+def integral_time(acov, rate):
+    """
+    Integral time scale (s) of each row of autocovariances (lag 0, 1, ...):
+    the autocorrelation integrated up to its first zero crossing.
+    """
+    out = np.full(len(acov), np.nan)
+    for k, r in enumerate(acov):
+        if not r[0] > 0:
+            continue
+        rho = r / r[0]
+        neg = np.nonzero(rho <= 0)[0]
+        m = neg[0] if len(neg) else len(rho)
+        out[k] = (rho[:m].sum() - 0.5 * rho[0]) / rate  # trapezoid from lag 0
+    return out
+
+
+class SlidingWelch(object):
+    """
+    add(epoch, u, v, speed) or extend(arrays): returns the list of windows finished by these samples,
+    one per segment step once the window is full. Window: dict with
+    start, end, segments, mean (3), variance (3), psd (3 x len(freq)), integral_time (3, s),
+    integral_length (m, integral time of speed x mean speed: Taylor's frozen turbulence).
+    """
+    def __init__(self, rate, window=WINDOW_SECONDS, segment=SEGMENT_SECONDS, overlap=OVERLAP,
+                 fill_max=FILL_MAX, reset_seconds=RESET_SECONDS):
+        self.rate = float(rate)
+        self.fill_max = fill_max
+        self.reset_seconds = reset_seconds
+        self.nperseg = segment_length(rate, segment)
+        self.step = self.nperseg - int(self.nperseg * overlap)
+        self.nseg = max(int((window * rate - self.nperseg) // self.step) + 1, 1)
+        self.taper = hann(self.nperseg)
+        self.scale = 1.0 / (self.rate * (self.taper ** 2).sum())
+        self.freq = np.fft.rfftfreq(self.nperseg, 1.0 / self.rate)
+        # pairs per lag in one segment, for the unbiased autocovariance
+        self.pairs = np.arange(self.nperseg, 0, -1, dtype=float)
+        self.buf = np.empty((len(CHANNELS), self.nperseg))
+        self.times = np.empty(self.nperseg)
+        self.reset()
+
+    def reset(self):
+        self.fill = 0
+        self.last = None
+        self.prev = None  # values of the last sample, for interpolation
+        self.segments = collections.deque()  # (start, end, mean, psd, acov sums)
+        self.sum_mean = 0.0
+        self.sum_psd = 0.0
+        self.sum_acov = 0.0
+
+    def segment(self):
+        """Periodogram (tapered FFT) and lag sums (zero padded FFT) of the full buffer."""
+        x = self.buf
+        mean = x.mean(axis=1)
+        d = x - mean[:, None]
+        p = np.abs(np.fft.rfft(d * self.taper, axis=1)) ** 2 * self.scale
+        p[:, 1:] *= 2  # one sided
+        if self.nperseg % 2 == 0:
+            p[:, -1] /= 2  # Nyquist is not doubled
+        # zero padded to 2n: linear, not circular, correlation
+        acov = np.fft.irfft(np.abs(np.fft.rfft(d, 2 * self.nperseg, axis=1)) ** 2, axis=1)[:, :self.nperseg]
+        return mean, p, acov
+
+    def push(self):
+        mean, psd, acov = self.segment()
+        self.segments.append((self.times[0], self.times[self.fill - 1], mean, psd, acov))
+        self.sum_mean = self.sum_mean + mean
+        self.sum_psd = self.sum_psd + psd
+        self.sum_acov = self.sum_acov + acov
+        if len(self.segments) > self.nseg:
+            old = self.segments.popleft()
+            self.sum_mean = self.sum_mean - old[2]
+            self.sum_psd = self.sum_psd - old[3]
+            self.sum_acov = self.sum_acov - old[4]
+        # keep the overlap for the next segment
+        keep = self.nperseg - self.step
+        self.buf[:, :keep] = self.buf[:, self.step:]
+        self.times[:keep] = self.times[self.step:]
+        self.fill = keep
+        if len(self.segments) == self.nseg:
+            return self.result()
+        return None
+
+    def result(self):
+        n = len(self.segments)
+        acov = self.sum_acov / (n * self.pairs)
+        mean = self.sum_mean / n
+        it = integral_time(acov, self.rate)
+        return {"start": self.segments[0][0], "end": self.segments[-1][1], "segments": n,
+                "mean": mean, "variance": acov[:, 0], "psd": self.sum_psd / n,
+                "integral_time": it, "integral_length": it[2] * mean[2]}
+
+    def feed(self, epoch, x, out):
+        """Contiguous samples into the segment buffer, finished windows appended to out."""
+        i = 0
+        n = len(epoch)
+        while i < n:
+            j = min(n, i + self.nperseg - self.fill)
+            k = j - i
+            self.buf[:, self.fill:self.fill + k] = x[:, i:j]
+            self.times[self.fill:self.fill + k] = epoch[i:j]
+            self.fill += k
+            i = j
+            if self.fill == self.nperseg:
+                r = self.push()
+                if r is not None:
+                    out.append(r)
+
+    def bridge(self, t, x, out):
+        """Gap between the last sample and (t, x): interpolate, drop the unfinished segment or restart."""
+        dt = t - self.last
+        missing = int(round(dt * self.rate)) - 1
+        if 0 < missing <= self.fill_max:
+            f = np.arange(1, missing + 1) / (missing + 1.0)
+            self.feed(self.last + f * dt, self.prev[:, None] + f * (x - self.prev)[:, None], out)
+        elif dt > self.reset_seconds:
+            self.reset()
+        else:
+            self.fill = 0
+
+    def extend(self, epoch, u, v, speed):
+        """Arrays of samples in time order. nan samples count as gaps."""
+        epoch = np.asarray(epoch, dtype=float)
+        x = np.vstack([u, v, speed]).astype(float).reshape(len(CHANNELS), -1)
+        good = np.isfinite(x).all(axis=0)
+        if not good.all():
+            epoch, x = epoch[good], x[:, good]
+        if not len(epoch):
+            return []
+        out = []
+        gap = np.diff(epoch, prepend=epoch[0] if self.last is None else self.last) > GAP_FACTOR / self.rate
+        i = 0
+        for b in np.nonzero(gap)[0].tolist() + [len(epoch)]:
+            if b > i:
+                self.feed(epoch[i:b], x[:, i:b], out)
+                self.last = epoch[b - 1]
+                self.prev = x[:, b - 1].copy()
+            if b < len(epoch):
+                self.bridge(epoch[b], x[:, b], out)
+            i = b
+        return out
+
+    def add(self, epoch, u, v, speed):
+        return self.extend([epoch], [u], [v], [speed])
+
+
+def welch(x, rate, nperseg, overlap=OVERLAP):
+    """Reference Welch PSD (rows of x), every segment computed from scratch."""
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    step = nperseg - int(nperseg * overlap)
+    w = hann(nperseg)
+    segs = [x[:, i:i + nperseg] for i in range(0, x.shape[1] - nperseg + 1, step)]
+    p = []
+    for s in segs:
+        d = s - s.mean(axis=1, keepdims=True)
+        q = np.abs(np.fft.rfft(d * w, axis=1)) ** 2 / (rate * (w * w).sum())
+        q[:, 1:-1 if nperseg % 2 == 0 else None] *= 2
+        p.append(q)
+    return np.fft.rfftfreq(nperseg, 1.0 / rate), np.mean(p, axis=0)
+
+
+def save(path, results, freq, rate, nperseg):
+    """Per window results of SlidingWelch, psd as float32."""
+    w = len(results)
+    nf = len(freq)
+
+    def stack(key, shape):
+        return np.array([r[key] for r in results], dtype=float).reshape(shape)
+
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, channels=np.array(CHANNELS), freq=freq, rate=rate, nperseg=nperseg,
+                 start=stack("start", (w,)), end=stack("end", (w,)),
+                 mean=stack("mean", (w, 3)), variance=stack("variance", (w, 3)),
+                 psd=stack("psd", (w, 3, nf)).astype(np.float32),
+                 integral_time=stack("integral_time", (w, 3)), integral_length=stack("integral_length", (w,)))
+    os.replace(path + ".tmp", path)
+
+
+def load(path):
+    with np.load(path) as x:
+        return {k: x[k] for k in x.files}
+
+
+class Store(object):
+    """
+    Live results by hour: windows ending in an hour go to <folder>/<day>/<hour>.spectra.npz,
+    written when the first window of the next hour arrives (or at close), then on_saved(path).
+    """
+    def __init__(self, folder, analyzer, on_saved=None):
+        self.folder = folder
+        self.analyzer = analyzer
+        self.on_saved = on_saved
+        self.hour = None
+        self.results = []
+        self.last = None  # latest window
+
+    def add(self, results):
+        for r in results:
+            hour = time.strftime("%Y%m%d_%H", time.localtime(r["end"]))
+            if hour != self.hour:
+                self.save()
+                self.hour = hour
+            self.results.append(r)
+            self.last = r
+
+    def save(self):
+        if not self.results:
+            return None
+        folder = os.path.join(self.folder, self.hour[:8])
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, self.hour + SUFFIX)
+        a = self.analyzer
+        save(path, self.results, a.freq, a.rate, a.nperseg)
+        self.results = []
+        if self.on_saved is not None:
+            self.on_saved(path)
+        return path
+
+    def summary(self):
+        """Latest window without the spectrum, json-able, for status()."""
+        r = self.last
+        if r is None:
+            return None
+        x = {"start": r["start"], "end": r["end"], "integral_length": float(r["integral_length"])}
+        for k, c in enumerate(CHANNELS):
+            x["integral_time_%s" % c] = float(r["integral_time"][k])
+            x["variance_%s" % c] = float(r["variance"][k])
+        return x
+
+
+def lower_priority(nice=NICE):
+    """Lower the priority of the calling thread (Linux: threads have their own nice value)."""
+    try:
+        import threading
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+    except (AttributeError, OSError):
+        pass
+
+
+def analyze_hour(path, window=WINDOW_SECONDS, segment=SEGMENT_SECONDS, rate=None):
+    """(analyzer, windows) of an hour csv; a window does not reach into the next file."""
+    epoch, u, v, extra, names, file_rate = windstats.read_hour(path)
+    rate = file_rate or rate
+    a = SlidingWelch(rate, window, segment)
+    return a, a.extend(epoch, u, v, np.sqrt(u * u + v * v)), (epoch, u, v)
+
+
+def contiguous(epoch, u, v, rate):
+    """No gap and no nan sample: the window is the same as the raw samples."""
+    ok = np.isfinite(u).all() and np.isfinite(v).all()
+    return bool(ok and len(epoch) and (np.diff(epoch) <= GAP_FACTOR / rate).all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Welch spectra and integral time scales of hour files")
+    parser.add_argument("paths", nargs="+", help="hour csv files")
+    parser.add_argument("--rate", type=float, default=4.0, help="Hz, WindSonic data rate (GMX500: 1 Hz)")
+    parser.add_argument("--window", type=float, default=WINDOW_SECONDS, help="s")
+    parser.add_argument("--segment", type=float, default=SEGMENT_SECONDS, help="s")
+    parser.add_argument("--check", action="store_true", help="compare windows without gaps with the reference welch()")
+    args = parser.parse_args()
+
+    print("%-19s %4s %8s %8s %8s %8s" % ("end", "segs", "T_u s", "T_v s", "T_spd s", "L m"))
+    worst = 0.0
+    checked = skipped = 0
+    for path in args.paths:
+        a, results, (epoch, u, v) = analyze_hour(path, args.window, args.segment, args.rate)
+        for r in results:
+            print("%-19s %4s %8.2f %8.2f %8.2f %8.1f" % (
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["end"])), r["segments"],
+                r["integral_time"][0], r["integral_time"][1], r["integral_time"][2], r["integral_length"]))
+            if args.check:
+                sel = (epoch >= r["start"]) & (epoch <= r["end"])
+                if not contiguous(epoch[sel], u[sel], v[sel], a.rate):
+                    skipped += 1  # filled or dropped samples: not comparable with the raw reference
+                    continue
+                f, ref = welch([u[sel], v[sel], np.sqrt(u[sel] ** 2 + v[sel] ** 2)], a.rate, a.nperseg)
+                worst = max(worst, float(np.max(np.abs(ref - r["psd"]) / max(ref.max(), 1e-12))))
+                checked += 1
+    if args.check:
+        print("largest difference to the reference psd (relative to the peak): %.3g, %s windows without gaps "
+              "compared, %s with gaps skipped" % (worst, checked, skipped))
+
+
+if __name__ == "__main__":
+    main()
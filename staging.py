@@ -0,0 +1,129 @@
+# Stage the active hour csv on a RAM backed folder (tmpfs) and flush it to
+# the SD card in large sequential writes, to reduce SD card wear and latency.
+# Used by all recorders: GMX500.py, gui_GMX500.py, gui_windsonic.py
+
+import os
+import time
+
+TMPFS_PATH = "/dev/shm/WindPi"  # RAM backed folder on raspberry pi OS
+FLUSH_INTERVAL = 300  # s, flush staged data to SD card every # seconds
+MAX_STAGED_BYTES = 4 * 1024 * 1024  # flush early when staged data is larger than this
+
+
+class StagedFile(object):
+    """
+    Append-only csv writer, the header is written only to a new (or empty) file.
+    With staging_dir=None every write goes straight to the file (old behavior).
+    Otherwise rows are appended to a file of the same name in staging_dir,
+    and moved to the real file every flush_interval seconds, when more than
+    max_bytes are staged, at rotation (close) and on stop (close).
+    """
+    def __init__(self, path, header=None, staging_dir=None,
+                 flush_interval=FLUSH_INTERVAL, max_bytes=MAX_STAGED_BYTES):
+        self.path = path
+        self.staging_dir = staging_dir
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+
+        self.staged_bytes = 0  # bytes in RAM, not on SD card yet
+        self.flushed_bytes = 0  # bytes written to SD card
+        self.flush_count = 0  # number of writes to SD card
+        self.write_count = 0  # number of rows
+        self.last_flush = time.time()
+
+        # append: the file may exist already (restart in the same hour, rows recovered by recover_staged())
+        if header is not None and (not os.path.isfile(path) or not os.path.getsize(path)):
+            with open(path, "a") as f:
+                f.write(header)
+            self.flush_count += 1
+
+        self.stage_path = None
+        self.f = None
+        if staging_dir:
+            if not os.path.isdir(staging_dir):
+                os.makedirs(staging_dir)
+            self.stage_path = os.path.join(staging_dir, os.path.basename(path))
+            self.f = open(self.stage_path, "w+", buffering=1)  # line buffered: rows survive a crash of the process
+
+    def write(self, row):
+        self.write_count += 1
+        if self.f is None:
+            with open(self.path, "a") as f:
+                f.write(row)
+            self.flushed_bytes += len(row)
+            self.flush_count += 1
+            return
+
+        self.f.write(row)
+        self.staged_bytes += len(row)
+        if (self.staged_bytes >= self.max_bytes or
+                time.time() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Move staged rows to the real file in one write."""
+        self.last_flush = time.time()
+        if self.f is None or not self.staged_bytes:
+            return 0
+
+        self.f.flush()
+        self.f.seek(0)
+        data = self.f.read()
+        with open(self.path, "a") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.f.seek(0)
+        self.f.truncate()
+        n = self.staged_bytes
+        self.flushed_bytes += n
+        self.flush_count += 1
+        self.staged_bytes = 0
+        return n
+
+    def close(self):
+        """Flush and remove the staged file, call at rotation and on stop."""
+        self.flush()
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+            os.remove(self.stage_path)
+
+    def stats(self):
+        return {
+            "staged_bytes": self.staged_bytes,
+            "flushed_bytes": self.flushed_bytes,
+            "flush_count": self.flush_count,
+            "write_count": self.write_count,
+            "last_flush": self.last_flush,
+        }
+
+
+def recover_staged(local_data_path, staging_dir=TMPFS_PATH):
+    """
+    Append rows left in staging_dir by a crashed run to their hour file.
+    Staged files are named like the hour file: 20241010_14.csv
+    Returns the list of recovered files.
+    """
+    recovered = []
+    if not staging_dir or not os.path.isdir(staging_dir):
+        return recovered
+
+    for name in sorted(os.listdir(staging_dir)):
+        stage_path = os.path.join(staging_dir, name)
+        if not (name.endswith(".csv") and len(name) == 15):
+            continue
+        folder_day = os.path.join(local_data_path, name[:8])
+        if not os.path.isdir(folder_day):
+            os.mkdir(folder_day)
+
+        with open(stage_path, "r") as f:
+            data = f.read()
+        if data:
+            with open(os.path.join(folder_day, name), "a") as f:
+                f.write(data)
+            recovered.append(name)
+        os.remove(stage_path)
+
+    return recovered
@@ -0,0 +1,162 @@
+# Hourly csv files on local drive, copied to R drive after rotation.
+# A new csv every hour, a new folder every day: LOCAL_DATA_PATH/20241010/20241010_14.csv
+
+import os
+import shutil
+import threading
+import time
+
+# customized files
+import logs
+import staging
+
+RETRY_INTERVAL = 600  # s, try again to copy files that failed to copy to R drive
+
+log = logs.get_logger(__name__)
+
+
+class Uploader(object):
+    """
+    Copy finished hour files to R drive in a background thread,
+    a slow or unmounted network share never blocks data recording.
+    Files that failed to copy stay in the backlog and are tried again later.
+    """
+    def __init__(self, retry_interval=RETRY_INTERVAL):
+        self.retry_interval = retry_interval
+        self.backlog = []  # [source, destination folder, time queued]
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.copied = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self.run, name="uploader", daemon=True)
+        self.thread.start()
+
+    def enqueue(self, file_path, r_folder):
+        with self.lock:
+            self.backlog.append([file_path, r_folder, time.time()])
+        self.wake.set()
+
+    def run(self):
+        while True:
+            self.wake.wait(self.retry_interval)
+            self.wake.clear()
+            self.copy_all()
+            if self.stop_event.is_set():
+                break
+
+    def copy_all(self):
+        with self.lock:
+            todo = list(self.backlog)
+
+        for item in todo:
+            file_path, r_folder, t = item
+            try:
+                if not os.path.isdir(r_folder):
+                    os.mkdir(r_folder)
+                shutil.copy2(file_path, r_folder)  # source, destination
+                with self.lock:
+                    self.backlog.remove(item)
+                self.copied += 1
+                log.info("copy to r-drive successful: %s", os.path.basename(file_path))
+            except:
+                self.failed += 1
+                log.warning("copy to r-drive failed: %s, will try again later.", os.path.basename(file_path))
+
+    def backlog_size(self):
+        with self.lock:
+            return len(self.backlog)
+
+    def backlog_age(self):
+        """Age (s) of the oldest file waiting to be copied, 0 if none."""
+        with self.lock:
+            if not self.backlog:
+                return 0
+            return time.time() - self.backlog[0][2]
+
+    def close(self, timeout=10):
+        """
+        Try once more to copy everything, then stop the thread.
+        Waits at most timeout seconds: returns False if files are still waiting.
+        """
+        self.stop_event.set()
+        self.wake.set()
+        self.thread.join(timeout)
+        return not self.backlog_size()
+
+
+class HourlyStorage(object):
+    """
+    Write rows to the csv of the hour the sample was taken,
+    rotate to a new file (and day folder) when a later hour starts.
+    on_rotate(filename) is called with the new file name: 20241010_14
+    clock() gives the time of the first file (replay.py: time of the archived data)
+    on_finish(local_file_path) is called when an hour file is done, returns a list of
+    more files to copy to R drive with it (QA sidecar)
+    """
+    def __init__(self, local_data_path, rdrive_folder, header, staging_dir=None, on_rotate=None,
+                 clock=time.time, on_finish=None):
+        self.local_data_path = local_data_path
+        self.rdrive_folder = rdrive_folder
+        self.header = header
+        self.staging_dir = staging_dir
+        self.on_rotate = on_rotate
+        self.on_finish = on_finish
+        self.uploader = Uploader()
+
+        self.filename = None
+        self.local_file_path = None
+        self.local_file = None
+        self.rotation_count = 0
+        self.bytes_written = 0
+
+        # rows left in RAM by a crashed run
+        for name in staging.recover_staged(local_data_path, staging_dir):
+            log.warning("recovered staged data: %s", name)
+
+        self.open(time.strftime("%Y%m%d_%H", time.localtime(clock())))
+
+    def open(self, filename):
+        self.filename = filename
+        self.behind = False  # rows with an earlier hour than the file, warned once
+        # create folder of the day on local drive
+        local_folder_day = os.path.join(self.local_data_path, filename[:8])
+        if not os.path.isdir(local_folder_day):
+            os.mkdir(local_folder_day)
+
+        self.local_file_path = os.path.join(local_folder_day, filename + ".csv")
+        self.local_file = staging.StagedFile(self.local_file_path, self.header, self.staging_dir)
+        if self.on_rotate is not None:
+            self.on_rotate(filename)
+
+    def finish(self):
+        """Flush the current file and queue it for copy to R drive."""
+        self.local_file.close()  # flush staged data to SD card
+        log.info("%s.csv: %s rows, %s writes to SD card",
+                 self.filename, self.local_file.write_count, self.local_file.flush_count)
+        r_folder_day = os.path.join(self.rdrive_folder, self.filename[:8])
+        self.uploader.enqueue(self.local_file_path, r_folder_day)
+        if self.on_finish is not None:
+            for path in self.on_finish(self.local_file_path):
+                self.uploader.enqueue(path, r_folder_day)
+
+    def write(self, epoch, row):
+        now = time.strftime("%Y%m%d_%H", time.localtime(epoch))  # 20241010_14
+        if now > self.filename:
+            self.rotate(now)
+        elif now < self.filename and not self.behind:
+            # clock stepped back (NTP at boot): stay in the current file, never reopen a finished one
+            self.behind = True
+            log.warning("clock went back to %s, rows stay in %s.csv", now, self.filename)
+        self.local_file.write(row)
+        self.bytes_written += len(row)
+
+    def rotate(self, now):
+        self.finish()
+        self.rotation_count += 1
+        self.open(now)
+
+    def close(self, timeout=10):
+        """On stop: flush, copy last file to R drive, wait at most timeout seconds for the copy."""
+        self.finish()
+        return self.uploader.close(timeout)
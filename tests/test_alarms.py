@@ -0,0 +1,65 @@
+import numpy as np
+
+import alarms
+
+NAMES = ["speed", "gps_height"]
+RULES = [
+    {"name": "spike", "when": "speed > 20"},
+    {"name": "high_wind", "when": "speed > 15", "for": 30, "clear": "speed < 13"},
+    {"name": "gps_moved", "when": "gps_height changed", "by": 5, "hold": 10},
+]
+
+
+def samples():
+    epoch = 1728568800.0 + np.arange(128)
+    speed = np.full(128, 5.0)
+    speed[3] = 25  # one sample spike
+    speed[10:45] = 16  # 35 s above 15: raised at 30 s, cleared below 13
+    speed[50:53] = 14  # between: stays cleared
+    speed[70:110] = 17  # raised again
+    height = np.full(128, 100.0)
+    height[20:] = 110  # moved, held 10 s
+    height[90:] = 90
+    return epoch, np.column_stack([speed, height])
+
+
+def test_batch_same_as_per_sample():
+    epoch, values = samples()
+    one = alarms.AlarmEngine(RULES, NAMES)
+    for t, x in zip(epoch, values):
+        one.update([t], [x])
+    batch = alarms.AlarmEngine(RULES, NAMES)
+    for i in range(0, len(epoch), 64):
+        batch.update(epoch[i:i + 64], values[i:i + 64])
+    assert one.raised.tolist() == batch.raised.tolist() == [1, 2, 2]
+    assert one.active.tolist() == batch.active.tolist()
+    assert np.array_equal(one.active_since, batch.active_since, equal_nan=True)
+
+
+def test_raise_and_clear_in_one_batch():
+    epoch, values = samples()
+    e = alarms.AlarmEngine(RULES, NAMES)
+    e.update(epoch[:64], values[:64])
+    assert e.raised.tolist() == [1, 1, 1]  # spike, high wind (raised and cleared), gps moved
+    assert not e.active.any()
+
+
+def test_rules_file(tmp_path):
+    import json
+    import recorder
+    assert recorder.rules_options(str(tmp_path)) == {}
+    with open(str(tmp_path / alarms.RULES_FILE), "w") as f:
+        json.dump(RULES[:1], f)
+    assert recorder.rules_options(str(tmp_path)) == {"alarm_rules": RULES[:1]}
+
+
+def test_change_across_nan_rows():
+    epoch = 1728568800.0 + np.arange(6)
+    height = [100.0, 100.0, np.nan, 110.0, np.nan, np.nan]
+    values = np.column_stack([np.full(6, 5.0), height])
+    for batch in (6, 1):
+        e = alarms.AlarmEngine(RULES, NAMES)
+        for i in range(0, 6, batch):
+            e.update(epoch[i:i + batch], values[i:i + batch])
+        assert e.raised.tolist() == [0, 0, 1]
+        assert e.value[2] == 110.0
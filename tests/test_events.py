@@ -0,0 +1,25 @@
+import os
+import time
+
+import events
+
+EPOCH = time.mktime((2024, 10, 10, 14, 35, 0, 0, 0, -1))
+
+
+def test_event_file_in_day_folder(tmp_path):
+    rules = [{"name": "gust", "rule": "above", "channel": "speed", "value": 15.0, "seconds": 0}]
+    c = events.Capture(str(tmp_path), "epoch_time,speed\n", rules, ["speed"], 1.0, pre=5, post=5)
+    for i in range(20):
+        speed = 20.0 if i == 10 else 5.0
+        c.add(EPOCH + i, "%s,%s\n" % (EPOCH + i, speed), [speed])
+    assert c.count == 1
+    day = tmp_path / "20241010" / events.FOLDER
+    assert sorted(os.listdir(str(day))) == ["20241010_143510_gust.csv", "20241010_143510_gust.json"]
+
+
+def test_rules_file(tmp_path):
+    import json
+    import recorder
+    with open(str(tmp_path / events.RULES_FILE), "w") as f:
+        json.dump([], f)
+    assert recorder.rules_options(str(tmp_path)) == {"event_rules": []}  # capture off
@@ -0,0 +1,69 @@
+import os
+import time
+
+import numpy as np
+
+import frames
+import join
+
+T0 = time.mktime((2024, 10, 10, 13, 0, 0, 0, 0, -1))
+
+
+def test_align_methods():
+    epoch = np.array([0.0, 1.0, 2.0, 10.0])
+    cols = {"speed": np.array([0.0, 10.0, 20.0, 100.0]), "direction": np.array([350.0, 10.0, 30.0, 90.0])}
+    target = [0.4, 0.6, 1.0, 5.0]
+    x, lag = join.align(target, epoch, cols, "nearest", 1.0)
+    assert np.allclose(x["speed"][:3], [0, 10, 10]) and np.isnan(x["speed"][3])
+    assert np.allclose(lag[:3], [-0.4, 0.4, 0.0])
+    x, lag = join.align(target, epoch, cols, "backward", 1.0)
+    assert np.allclose(x["speed"][:3], [0, 0, 10])
+    x, lag = join.align(target, epoch, cols, "forward", 1.0)
+    assert np.allclose(x["speed"][:3], [10, 10, 10])
+    x, lag = join.align([0.5], epoch, cols, "linear", 1.0)
+    assert np.allclose(x["speed"], [5.0]) and np.allclose(x["direction"], [0.0])  # between 350 and 10
+
+
+def write_wind(root, shuffle=False):
+    name = time.strftime("%Y%m%d_%H", time.localtime(T0))
+    os.makedirs(os.path.join(root, name[:8]))
+    rows = ["%s, -,1.0,0.0,%s,%s\n" % (T0 + k, k, k % 360) for k in range(3600)]
+    if shuffle:
+        rows[1000:1010] = rows[1000:1010][::-1]  # clock stepped back: rows out of order
+    with open(os.path.join(root, name[:8], name + ".csv"), "w") as f:
+        f.write(frames.HEADER_WINDSONIC)
+        f.writelines(rows)
+
+
+def test_join_analyzer_rows(tmp_path):
+    root = str(tmp_path / "wind")
+    write_wind(root, shuffle=True)
+    analyzer = str(tmp_path / "analyzer.csv")
+    with open(analyzer, "w") as f:
+        f.write("EPOCH_TIME,CH4\n")
+        for k in range(5, 3595, 7):
+            f.write("%s,%s\n" % (T0 + k + 0.2, 2.0 + k * 1e-4))
+    out = str(tmp_path / "joined.csv")
+    written, read, skipped = join.join([analyzer], out, ["speed", "direction"], root=root, cache_dir=None,
+                                       chunk_rows=100)
+    assert written == read == len(range(5, 3595, 7)) and skipped == 0
+    a = np.loadtxt(out, delimiter=",", skiprows=1)
+    k = np.round(a[:, 0] - 0.2 - T0)
+    assert np.array_equal(a[:, 2], k)  # speed of the nearest wind row
+    assert np.allclose(a[:, 4], -0.2)
+
+
+def test_join_grid(tmp_path):
+    root = str(tmp_path / "wind")
+    write_wind(root)
+    analyzer = str(tmp_path / "analyzer.csv")
+    with open(analyzer, "w") as f:
+        f.write("EPOCH_TIME,CH4\n")
+        for k in range(0, 600, 3):
+            f.write("%s,%s\n" % (T0 + k, k))
+    out = str(tmp_path / "joined.csv")
+    written, read, skipped = join.join([analyzer], out, ["speed"], root=root, cache_dir=None, method="linear",
+                                       tolerance=5, grid=60, chunk_rows=50)
+    a = np.loadtxt(out, delimiter=",", skiprows=1)
+    assert written == 10 and np.allclose(np.diff(a[:, 0]), 60)
+    assert np.allclose(a[:, 1], a[:, 0] - T0) and np.allclose(a[:, 2], a[:, 0] - T0)
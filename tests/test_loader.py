@@ -0,0 +1,61 @@
+import os
+import time
+
+import numpy as np
+
+import frames
+import loader
+import timing
+
+T0 = time.mktime((2024, 10, 10, 13, 0, 0, 0, 0, -1))
+
+
+def write_hours(root, hours=2, rate=1.0):
+    """WindSonic hour files from T0, speed = seconds since T0."""
+    for h in range(hours):
+        t0 = T0 + h * 3600
+        name = time.strftime("%Y%m%d_%H", time.localtime(t0))
+        os.makedirs(os.path.join(root, name[:8]), exist_ok=True)
+        with open(os.path.join(root, name[:8], name + ".csv"), "w") as f:
+            f.write(frames.HEADER_WINDSONIC)
+            for k in range(int(3600 * rate)):
+                t = t0 + k / rate
+                f.write("%s, %s,1.0,0.0,%s,180\n" % (t, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)), t - T0))
+
+
+def test_range_across_hour_files(tmp_path):
+    root, cache = str(tmp_path / "data"), str(tmp_path / "cache")
+    write_hours(root)
+    x = loader.load_range(T0 + 3000, T0 + 4000, ["speed"], root, cache)
+    assert sorted(x) == ["epoch_time", "speed"]
+    assert len(x["speed"]) == 1000
+    assert np.array_equal(x["speed"], np.arange(3000.0, 4000.0))
+    assert loader.to_epoch("20241010_13") == T0
+
+
+def test_cache_reused_until_file_changes(tmp_path):
+    root, cache = str(tmp_path / "data"), str(tmp_path / "cache")
+    write_hours(root, hours=1)
+    path = loader.hour_paths(root, T0, T0 + 3600)[0]
+    first, parsed = loader.read_hour(path, ["epoch_time", "speed"], cache)
+    assert parsed == ["epoch_time", "speed"]
+    again, parsed = loader.read_hour(path, ["epoch_time", "speed"], cache)
+    assert parsed == [] and np.array_equal(first["speed"], again["speed"])
+    with open(path, "a") as f:
+        f.write("%s, x,1.0,0.0,9999,180\n" % (T0 + 3599.5))
+        f.write("garbled row cut by a power lo")
+    x, parsed = loader.read_hour(path, ["speed"], cache)
+    assert parsed == ["speed"] and len(x["speed"]) == 3601 and x["speed"][-1] == 9999
+
+
+def test_corrected_column(tmp_path):
+    root = str(tmp_path / "data")
+    write_hours(root, hours=1)
+    path = loader.hour_paths(root, T0, T0 + 3600)[0]
+    x = loader.load_range(T0, T0 + 3600, [loader.CORRECTED], root, None)
+    assert np.array_equal(x[loader.CORRECTED], x["epoch_time"])  # no timing file: raw times
+    epoch = x["epoch_time"]
+    timing.save(timing.timing_path(path), epoch, epoch - 2.5, epoch - 2.5, np.zeros(len(epoch)),
+                np.zeros(len(epoch)))
+    x = loader.load_range(T0, T0 + 3600, [loader.CORRECTED], root, None)
+    assert np.allclose(x[loader.CORRECTED], x["epoch_time"] - 2.5)
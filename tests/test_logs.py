@@ -0,0 +1,21 @@
+import logging
+
+import logs
+
+
+def record(msg, *args, **extra):
+    r = logging.LogRecord("windpi.alarms", logging.WARNING, __file__, 1, msg, args, None)
+    r.__dict__.update(extra)
+    return r
+
+
+def test_only_opt_in_messages_are_limited():
+    f = logs.RateLimitFilter(interval=60)
+    assert f.filter(record("alarm raised: %s", "wind"))
+    assert f.filter(record("alarm raised: %s", "wind"))
+    assert f.filter(record("invalid data: %r", "x", **logs.LIMITED))
+    assert not f.filter(record("invalid data: %r", "y", **logs.LIMITED))
+    r = record("invalid data: %r", "z", **logs.LIMITED)
+    f.seen[("windpi.alarms", "invalid data: %r")][0] -= 61
+    assert f.filter(r)
+    assert "1 similar suppressed" in r.getMessage()
@@ -0,0 +1,24 @@
+import qa
+
+
+def test_row_flags():
+    det = qa.GapDetector(1.0)
+    epochs = [0, 1, 2, 5, 6, 6.01, 6.02, 6.03, 7, 7.05, 8]
+    for t in epochs:
+        det.add(t)
+    det.summary()
+    assert len(det.flags) == len(epochs)
+    # gap before 5, burst of 4 rows from 6, run of 2 rows at 7 is jitter
+    assert list(det.flags) == [qa.OK, qa.OK, qa.OK, qa.AFTER_GAP, qa.BURST, qa.BURST, qa.BURST, qa.BURST,
+                               qa.OK, qa.OK, qa.OK]
+
+
+def test_flags_file(tmp_path):
+    path = str(tmp_path / "20241010_14.csv")
+    with open(path, "w") as f:
+        f.write("epoch_time,x\n")
+        for t in [0, 1, 4, 4.01, 4.02, 5]:
+            f.write("%s,0\n" % t)
+    x = qa.check_file(path, rate=1.0, sidecar=True)
+    assert x["burst_count"] == 1
+    assert list(qa.read_flags(path)) == [qa.OK, qa.OK, qa.AFTER_GAP | qa.BURST, qa.BURST, qa.BURST, qa.OK]
@@ -0,0 +1,14 @@
+import random
+
+import derive
+import simulator
+
+
+def test_wind_uv_matches_direction():
+    random.seed(3)
+    w = simulator.Wind()
+    for i in range(500):
+        u, v, speed, direction = w.step()
+        if speed > 0.1:
+            d = derive.wind_uv_to_dir_scalar(u, v)
+            assert abs((d - direction + 180) % 360 - 180) < 1e-6
@@ -0,0 +1,50 @@
+import numpy as np
+
+import spectra
+
+
+def samples(n, rate=4.0, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / rate
+    u, v = rng.normal(size=(2, n))
+    return t, u, v, np.hypot(u, v)
+
+
+def run(w, t, u, v, s, chunk=64):
+    out = []
+    for i in range(0, len(t), chunk):
+        out += w.extend(t[i:i + chunk], u[i:i + chunk], v[i:i + chunk], s[i:i + chunk])
+    return out
+
+
+def test_same_as_reference_welch():
+    w = spectra.SlidingWelch(4.0)
+    t, u, v, s = samples(w.nperseg + (w.nseg - 1) * w.step)
+    out = run(w, t, u, v, s)
+    assert len(out) == 1
+    freq, p = spectra.welch([u, v, s], 4.0, w.nperseg)
+    assert np.allclose(out[0]["psd"], p)
+
+
+def test_short_gap_is_interpolated():
+    w = spectra.SlidingWelch(4.0)
+    t, u, v, s = samples(w.nperseg + (w.nseg - 1) * w.step + 2)
+    u = u.copy()
+    u[100] = np.nan  # one nan row
+    keep = np.ones(len(t), bool)
+    keep[300:302] = False  # two frames lost
+    out = run(w, t[keep], u[keep], v[keep], s[keep])
+    assert len(out) == 1
+
+
+def test_gap_keeps_finished_segments():
+    w = spectra.SlidingWelch(4.0)
+    t, u, v, s = samples(w.nperseg + (w.nseg + 1) * w.step)
+    cut = w.nperseg + w.step + 10  # 2 segments finished, the third one unfinished
+    t = np.concatenate([t[:cut], t[cut:] + 30])  # 30 s lost
+    w.extend(t[:cut + 5], u[:cut + 5], v[:cut + 5], s[:cut + 5])
+    assert len(w.segments) == 2 and w.fill == 5  # new segment started after the gap
+    w = spectra.SlidingWelch(4.0)
+    t[cut:] += spectra.RESET_SECONDS
+    w.extend(t[:cut + 5], u[:cut + 5], v[:cut + 5], s[:cut + 5])
+    assert len(w.segments) == 0 and w.fill == 5
@@ -0,0 +1,50 @@
+import os
+import time
+
+import storage
+
+HEADER = "epoch_time,value\n"
+EPOCH = time.mktime((2024, 10, 10, 14, 20, 0, 0, 0, -1))
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_restart_in_same_hour_keeps_recovered_rows(tmp_path):
+    local, rdrive, stage = tmp_path / "local", tmp_path / "rdrive", tmp_path / "stage"
+    local.mkdir()
+    rdrive.mkdir()
+    s = storage.HourlyStorage(str(local), str(rdrive), HEADER, str(stage), clock=lambda: EPOCH)
+    for i in range(5):
+        s.write(EPOCH + i, "%s,%s\n" % (EPOCH + i, i))
+    path = s.local_file_path
+    assert read(path) == HEADER  # rows still staged in RAM
+    # crash: no close(), the staged file stays behind
+
+    s = storage.HourlyStorage(str(local), str(rdrive), HEADER, str(stage), clock=lambda: EPOCH + 60)
+    assert s.local_file_path == path
+    s.write(EPOCH + 60, "%s,60\n" % (EPOCH + 60))
+    s.close(timeout=1)
+    lines = read(path).splitlines()
+    assert lines[0] == HEADER.strip()
+    assert lines.count(HEADER.strip()) == 1
+    assert [line.split(",")[1] for line in lines[1:]] == ["0", "1", "2", "3", "4", "60"]
+    assert not os.listdir(str(stage))
+
+
+def test_clock_step_back_does_not_reopen_finished_hour(tmp_path):
+    local, rdrive = tmp_path / "local", tmp_path / "rdrive"
+    local.mkdir()
+    rdrive.mkdir()
+    s = storage.HourlyStorage(str(local), str(rdrive), HEADER, clock=lambda: EPOCH)
+    first = s.local_file_path
+    s.write(EPOCH, "a,1\n")
+    s.write(EPOCH + 3600, "b,2\n")  # next hour
+    second = s.local_file_path
+    s.write(EPOCH + 10, "c,3\n")  # clock stepped back one hour
+    s.close(timeout=1)
+    assert second != first
+    assert read(first) == HEADER + "a,1\n"
+    assert read(second) == HEADER + "b,2\nc,3\n"
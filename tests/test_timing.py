@@ -0,0 +1,54 @@
+import calendar
+
+import numpy as np
+
+import timing
+
+T0 = calendar.timegm((2024, 10, 10, 13, 0, 0))
+
+
+def host_times(n, offset=2.5, drift=15e-6, step_at=None, step=3.0, seed=2):
+    """GPS seconds and host stamps: offset, drift, UART latency with spikes, optional clock step."""
+    rng = np.random.default_rng(seed)
+    gps = T0 + np.arange(n, dtype=float)
+    latency = 0.02 + rng.exponential(0.01, n)
+    latency[rng.choice(n, n // 100, replace=False)] += rng.uniform(0.5, 2.0, n // 100)  # backlog
+    host = gps + offset + drift * (gps - T0) + latency
+    if step_at is not None:
+        host[step_at:] += step
+    return gps, host
+
+
+def test_parse_gps_time():
+    assert timing.parse_gps_time("2024-10-10T13:00:01.5") == T0 + 1.5
+    assert np.isnan(timing.parse_gps_time("0000-00-00T00:00:00.0"))
+    assert np.isnan(timing.parse_gps_time(""))
+
+
+def test_offset_and_drift():
+    gps, host = host_times(7200)
+    f = timing.ClockFilter()
+    out = [f.add(h, g) for h, g in zip(host, gps)]
+    assert abs(f.status()["drift_ppm"] - 15) < 0.5
+    err = np.array([c for c, latency, flags in out[-3600:]]) - gps[-3600:]
+    # corrected keeps the latency above the smallest one: never early, mostly a few ms late
+    assert np.percentile(err, 1) > -0.005 and np.percentile(err, 50) < 0.02
+    late = np.array([flags & timing.LATE != 0 for c, latency, flags in out[-3600:]])
+    assert late.sum() >= 20
+
+
+def test_clock_step():
+    gps, host = host_times(7200, step_at=3600)
+    f = timing.ClockFilter()
+    out = [f.add(h, g) for h, g in zip(host, gps)]
+    assert f.status()["steps"] == 1
+    err = np.array([c for c, latency, flags in out[3700:]]) - gps[3700:]
+    assert np.percentile(err, 1) > -0.005 and np.percentile(err, 50) < 0.02
+
+
+def test_correct_from_timing_file(tmp_path):
+    csv = str(tmp_path / "20241010_13.csv")
+    epoch = T0 + np.arange(10.0)
+    timing.save(timing.timing_path(csv), epoch, epoch - 2.5, epoch - 2.5, np.zeros(10), np.zeros(10))
+    assert np.allclose(timing.correct(csv, [T0 + 0.5, T0 + 3]), [T0 - 2.0, T0 + 0.5])
+    assert np.allclose(timing.correct(str(tmp_path / "none.csv"), [T0]), [T0])  # no timing file: raw
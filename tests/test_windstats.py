@@ -0,0 +1,58 @@
+import math
+import time
+
+import numpy as np
+
+import derive
+import windstats
+
+NAMES = ("pressure", "humidity", "temperature")
+EPOCH = time.mktime((2024, 10, 10, 13, 40, 0, 0, 0, -1))
+
+
+def simulated(seconds=3600, rate=1.0, seed=1):
+    """Wind around north (350..10 deg), a 5 min gap, across the 14:00 hour rollover."""
+    rng = np.random.default_rng(seed)
+    epoch = EPOCH + np.arange(int(seconds * rate)) / rate
+    keep = (epoch < EPOCH + 900) | (epoch >= EPOCH + 1200)
+    epoch = epoch[keep]
+    n = len(epoch)
+    direction = (rng.normal(0, 15, n) + 360) % 360
+    speed = np.abs(5 + np.cumsum(rng.normal(0, 0.1, n)))
+    u, v = derive.dir_to_uv(direction, speed)
+    extra = np.column_stack([rng.normal(1013, 1, n), rng.uniform(40, 60, n), rng.normal(10, 2, n)])
+    extra[::97, 1] = np.nan  # humidity drop outs
+    return epoch, u, v, extra
+
+
+def close(x, ref):
+    for k, a in ref.items():
+        b = x[k]
+        if a == a or b == b:
+            assert math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9), (k, a, b)
+
+
+def test_tumbling_matches_batch():
+    epoch, u, v, extra = simulated()
+    w = windstats.Tumbling(600, 1.0, NAMES)
+    results = [x for x in (w.add(epoch[i], u[i], v[i], tuple(extra[i])) for i in range(len(epoch)))
+               if x is not None]
+    results.append(w.flush())
+    assert len(results) == 6  # 13:40 ... 14:30, the 13:55 window cut by the gap
+    assert any(x["start"] == time.mktime((2024, 10, 10, 14, 0, 0, 0, 0, -1)) for x in results)
+    for x in results:
+        sel = (epoch >= x["start"]) & (epoch < x["end"])
+        close(x, windstats.batch(u[sel], v[sel], extra[sel], NAMES, 1.0))
+
+
+def test_sliding_matches_batch():
+    epoch, u, v, extra = simulated(rate=4.0)
+    s = windstats.Sliding(600, 4.0, NAMES)
+    checks = 0
+    for i in range(len(epoch)):
+        s.add(epoch[i], u[i], v[i], tuple(extra[i]))
+        if i % 1000 == 999:
+            sel = (epoch > epoch[i] - 600) & (epoch <= epoch[i])
+            close(s.result(), windstats.batch(u[sel], v[sel], extra[sel], NAMES, 4.0))
+            checks += 1
+    assert checks >= 10
@@ -0,0 +1,312 @@
+# Host clock against GPS time. Rows are stamped with the Pi clock when readline()
+# returns: UART and loop latency, plus the offset and drift of a clock that may not
+# be synced on the roof. The GMX500 sends GPS_Time (UTC) in every frame, so
+#   host - gps = clock offset (slow: offset + drift * t) + latency (>= 0, jittery)
+# The lower envelope of host - gps is the clock offset plus the smallest latency:
+# the minimum of every WINDOW seconds, a Theil-Sen line (median of pairwise slopes)
+# through the last FIT_WINDOWS minima gives offset and drift. Windows far off the
+# line are outliers, STEP_WINDOWS of them in a row are a clock step (NTP at boot),
+# so are STEP_SAMPLES samples in a row off by about the same amount (a backlog read
+# at once is off by decreasing amounts): the fit starts again from them.
+#   corrected = host - offset(host)   on the GPS time scale
+#   latency   = host - gps - offset   flagged above LATENCY_MAX
+# The recorder keeps epoch_time of the hour files as it was (raw host time) and writes
+# one timing file per hour at rotation, copied to R drive with it:
+#   20241010_14.timing.npz: epoch (raw), corrected, gps, latency, flags, one per row
+# loader.load_range(..., ["epoch_corrected"]) and join.py --gps-time use it.
+# Backfill or check old hour files (the filter starts again at every file):
+# $ python reprocess.py timing /home/picarro/Wind_data --in-place
+# $ python timing.py /home/picarro/Wind_data/20241010/*.csv
+
+import argparse
+import calendar
+import collections
+import os
+
+import numpy as np
+
+# customized files
+import frames
+import logs
+
+WINDOW = 60.0  # s, one minimum of host - gps per window
+FIT_WINDOWS = 30  # minima in the offset and drift fit (30 min)
+MIN_WINDOWS = 3  # minima before the fit is used (locked)
+STEP = 0.5  # s, a window minimum this far off the fit is an outlier or a clock step
+STEP_WINDOWS = 2  # outlier windows in a row that are a clock step
+STEP_SAMPLES = 5  # samples in a row off the fit by more than STEP, within STEP of each other: a clock step
+MAX_DRIFT = 500e-6  # s/s, fitted drift is clipped to this
+LATENCY_MAX = 0.5  # s, samples with more latency than this are flagged
+SUFFIX = ".timing.npz"
+CORRECTED = "epoch_corrected"  # loader pseudo column
+
+# flags of every sample, bits
+LATE = 1  # latency above LATENCY_MAX
+NO_GPS = 2  # no valid GPS time in the frame (no fix, garbled, repeated)
+UNLOCKED = 4  # not enough windows for a fit: corrected from the minimum so far, or raw
+
+log = logs.get_logger(__name__)
+
+_days = {}  # "2024-10-10" -> epoch of 00:00 UTC
+
+
+def parse_gps_time(x):
+    """Epoch of a GPS_Time field "2024-10-10T13:00:00.0" (UTC), nan if it is not one."""
+    try:
+        day = _days.get(x[:10])
+        if day is None:
+            if len(_days) > 1000:
+                _days.clear()
+            day = _days[x[:10]] = calendar.timegm((int(x[:4]), int(x[5:7]), int(x[8:10]), 0, 0, 0))
+        if x[10] not in "T " or x[13] != ":" or x[16] != ":":
+            return float("nan")
+        return day + int(x[11:13]) * 3600 + int(x[14:16]) * 60 + float(x[17:])
+    except (ValueError, IndexError, TypeError, OverflowError):
+        return float("nan")
+
+
+def theil_sen(t, y):
+    """(slope, intercept at t[-1]) of a robust line through the points."""
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(t) < 2:
+        return 0.0, float(y[-1])
+    i, j = np.triu_indices(len(t), 1)
+    dt = t[j] - t[i]
+    ok = dt > 0
+    slope = float(np.median((y[j] - y[i])[ok] / dt[ok])) if ok.any() else 0.0
+    slope = min(max(slope, -MAX_DRIFT), MAX_DRIFT)
+    return slope, float(np.median(y - slope * (t - t[-1])))
+
+
+class ClockFilter(object):
+    """
+    add(epoch, gps) for every frame in time order: host epoch and GPS epoch (nan if none).
+    Returns (corrected epoch, latency, flags). O(1) per sample, a fit of at most
+    FIT_WINDOWS points once per WINDOW.
+    """
+    def __init__(self, window=WINDOW, windows=FIT_WINDOWS, latency_max=LATENCY_MAX, step=STEP):
+        self.window = window
+        self.latency_max = latency_max
+        self.step = step
+        self.minima = collections.deque(maxlen=windows)  # (host epoch, host - gps) of the window minima
+        self.pending = []  # windows off the fit: outliers, or a step once there are STEP_WINDOWS
+        self.jump = []  # (host epoch, host - gps) of the last samples off the fit
+        self.window_start = None
+        self.window_min = None  # (host epoch, host - gps) of the current window
+        self.fit = None  # (host epoch, offset there, drift), None: unlocked
+        self.last_gps = None
+        self.last_epoch = None
+        self.steps = 0
+
+    def offset(self, epoch):
+        """Estimated clock offset at host epoch, nan without any GPS time yet."""
+        if self.fit is not None:
+            t, offset, drift = self.fit
+            return offset + drift * (epoch - t)
+        x = [m for t, m in self.minima]
+        if self.window_min is not None:
+            x.append(self.window_min[1])
+        return min(x) if x else float("nan")
+
+    def close_window(self):
+        t, m = self.window_min
+        self.window_min = None
+        if self.fit is not None and abs(m - self.offset(t)) > self.step:
+            self.pending.append((t, m))
+            if len(self.pending) < STEP_WINDOWS:
+                return
+            self.stepped(m - self.offset(t))
+            self.minima.extend(self.pending)
+        else:
+            self.minima.append((t, m))
+        self.pending = []
+        if len(self.minima) >= MIN_WINDOWS:
+            t, m = zip(*self.minima)
+            drift, offset = theil_sen(t, m)
+            self.fit = (t[-1], offset, drift)
+        else:
+            self.fit = None
+
+    def stepped(self, by):
+        log.warning("host clock stepped by %+.3f s against GPS time", by)
+        self.steps += 1
+        self.minima.clear()
+        self.pending = []
+        self.jump = []
+        self.fit = None
+
+    def check_step(self, epoch, d):
+        """Samples in a row off the fit by about the same amount: start again from them."""
+        off = d - self.offset(epoch)
+        if abs(off) <= self.step:
+            self.jump = []
+            return
+        self.jump.append((epoch, d))
+        if len(self.jump) < STEP_SAMPLES:
+            return
+        x = [m for t, m in self.jump]
+        if max(x) - min(x) > self.step:
+            del self.jump[0]
+            return
+        jump = self.jump
+        self.stepped(off)
+        self.window_start = jump[0][0]
+        self.window_min = min(jump, key=lambda y: y[1])
+
+    def add(self, epoch, gps):
+        flags = 0
+        if gps == gps and gps != self.last_gps:
+            self.last_gps = gps
+            d = epoch - gps
+            if self.window_start is None or epoch - self.window_start >= self.window or epoch < self.window_start:
+                if self.window_min is not None:
+                    self.close_window()
+                self.window_start = epoch
+            if self.window_min is None or d < self.window_min[1]:
+                self.window_min = (epoch, d)
+            if self.fit is not None:
+                self.check_step(epoch, d)
+        else:
+            d = float("nan")
+            flags |= NO_GPS
+        self.last_epoch = epoch
+        offset = self.offset(epoch)
+        if self.fit is None:
+            flags |= UNLOCKED
+        if offset != offset:
+            return epoch, d, flags
+        latency = d - offset
+        if latency > self.latency_max:
+            flags |= LATE
+        return epoch - offset, latency, flags
+
+    def status(self):
+        """json-able state for status() and the GUI."""
+        fit = self.fit
+        offset = self.offset(self.last_epoch) if self.last_epoch is not None else float("nan")
+        return {"locked": fit is not None, "offset": None if offset != offset else float(offset),
+                "drift_ppm": fit[2] * 1e6 if fit is not None else None, "windows": len(self.minima),
+                "steps": self.steps}
+
+
+class HourTiming(object):
+    """Raw and corrected timestamps of the rows of the current hour file, saved at rotation."""
+    def __init__(self, clock_filter=None):
+        self.filter = clock_filter or ClockFilter()
+        self.reset()
+
+    def reset(self):
+        self.epoch = []
+        self.corrected = []
+        self.gps = []
+        self.latency = []
+        self.flags = []
+
+    def add(self, epoch, gps_text):
+        gps = parse_gps_time(gps_text)
+        corrected, latency, flags = self.filter.add(epoch, gps)
+        self.epoch.append(epoch)
+        self.corrected.append(corrected)
+        self.gps.append(gps)
+        self.latency.append(latency)
+        self.flags.append(flags)
+        return corrected, latency, flags
+
+    def save(self, path):
+        save(path, self.epoch, self.corrected, self.gps, self.latency, self.flags, self.filter.status())
+
+
+def save(path, epoch, corrected, gps, latency, flags, status=None):
+    status = status or {}
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, epoch=np.asarray(epoch, dtype=float), corrected=np.asarray(corrected, dtype=float),
+                 gps=np.asarray(gps, dtype=float), latency=np.asarray(latency, dtype=float),
+                 flags=np.asarray(flags, dtype=np.uint8),
+                 drift_ppm=np.nan if status.get("drift_ppm") is None else status["drift_ppm"],
+                 steps=status.get("steps", 0))
+    os.replace(path + ".tmp", path)
+
+
+def load(path):
+    """dict: epoch, corrected, gps, latency, flags, drift_ppm, steps"""
+    with np.load(path) as x:
+        return {k: (x[k] if x[k].ndim else x[k].item()) for k in x.files}
+
+
+def timing_path(csv_path):
+    return csv_path[:-len(".csv")] + SUFFIX
+
+
+def correct(csv_path, epoch):
+    """
+    Corrected times of the raw epoch_time values of an hour file, from its timing file:
+    interpolated offset between its rows. Raw times if there is no timing file.
+    """
+    epoch = np.asarray(epoch, dtype=float)
+    try:
+        x = load(timing_path(csv_path))
+    except (OSError, ValueError, KeyError):
+        return epoch.copy()
+    t, c = x["epoch"], x["corrected"]
+    if not len(t):
+        return epoch.copy()
+    order = np.argsort(t, kind="stable")
+    return epoch - np.interp(epoch, t[order], (t - c)[order])
+
+
+def analyze_hour(csv_path, clock_filter=None):
+    """HourTiming of the rows of a GMX500 hour file (epoch_time and GPS_Time columns)."""
+    header, names, rows = frames.read_csv(csv_path)
+    if frames.model_of(header) != "gmx500":
+        raise ValueError("%s: no GPS_Time column" % os.path.basename(csv_path))
+    i, j = names.index("epoch_time"), names.index("GPS_Time")
+    hour = HourTiming(clock_filter)
+    for y in rows:
+        try:
+            epoch = float(y[i])
+        except ValueError:
+            continue
+        hour.add(epoch, y[j])
+    return hour
+
+
+def summary(hour):
+    """Offset, drift and latency summary of an HourTiming, json-able."""
+    flags = np.asarray(hour.flags, dtype=np.uint8)
+    latency = np.asarray(hour.latency, dtype=float)
+    latency = latency[~np.isnan(latency)]
+    x = hour.filter.status()
+    x.update({"rows": len(flags), "late": int((flags & LATE != 0).sum()), "no_gps": int((flags & NO_GPS != 0).sum()),
+              "unlocked": int((flags & UNLOCKED != 0).sum())})
+    if len(latency):
+        x.update({"latency_p50": float(np.percentile(latency, 50)), "latency_p99": float(np.percentile(latency, 99)),
+                  "latency_max": float(latency.max())})
+    return x
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clock offset, drift and latency of GMX500 hour files")
+    parser.add_argument("paths", nargs="+", help="hour files, in time order (the filter runs across them)")
+    parser.add_argument("--save", action="store_true", help="write the timing file next to every hour file")
+    args = parser.parse_args()
+
+    clock_filter = ClockFilter()
+    for path in args.paths:
+        hour = analyze_hour(path, clock_filter)
+        x = summary(hour)
+        print("%s  rows %5s  offset %s  drift %s ppm  latency p50 %s p99 %s max %s s  late %s  no gps %s  "
+              "unlocked %s  steps %s" % (
+                  os.path.basename(path), x["rows"], fmt(x["offset"], "%+.3f"), fmt(x["drift_ppm"], "%+.1f"),
+                  fmt(x.get("latency_p50")), fmt(x.get("latency_p99")), fmt(x.get("latency_max")),
+                  x["late"], x["no_gps"], x["unlocked"], x["steps"]))
+        if args.save:
+            hour.save(timing_path(path))
+
+
+def fmt(x, spec="%.3f"):
+    return "-" if x is None else spec % x
+
+
+if __name__ == "__main__":
+    main()
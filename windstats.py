@@ -0,0 +1,346 @@
+# Meteorological wind statistics, streaming (O(1) per sample) over sliding or
+# tumbling windows, plus the numpy batch reference they must agree with.
+# u, v follow the anemometer convention of derive.wind_uv_to_dir():
+#   direction = (270 - atan2(u, v)) % 360,   u = -speed * cos(dir),  v = -speed * sin(dir)
+# Direction averages are vector averages: the mean of the u and v components,
+# never the mean of the angles (the mean of 350 and 10 deg is 0, not 180).
+#
+# live:     s = Sliding(600, rate=1);  s.add(epoch, u, v, (p, t, rh));  s.result()
+# rollups:  w = Tumbling(600, rate=1); x = w.add(epoch, u, v)  -> result of the finished window or None
+# offline:  $ python windstats.py /home/picarro/Wind_data/20241010/20241010_14.csv --period 600 --check
+
+import argparse
+import collections
+import math
+import time
+
+import numpy as np
+
+# customized files
+import derive
+
+GUST_SECONDS = 3  # s, WMO gust: maximum of the 3 s running mean of speed
+RESYNC = 100000  # sliding window: sums are recomputed after this many removals (rounding drift)
+YAMARTINO = 2.0 / math.sqrt(3.0) - 1.0
+
+KEYS = ["n", "mean_u", "mean_v", "speed", "speed_std", "vector_speed", "direction",
+        "steadiness", "sigma_theta", "turbulence_intensity", "gust", "gust_factor"]
+NAN = float("nan")
+
+
+def gust_samples(rate, seconds=GUST_SECONDS):
+    return max(int(round(seconds * rate)), 1)
+
+
+def sigma_theta(mean_sin, mean_cos):
+    """Yamartino (1984) standard deviation of direction (deg) from the mean unit vector."""
+    eps = math.sqrt(max(1.0 - (mean_sin ** 2 + mean_cos ** 2), 0.0))
+    return math.degrees(math.asin(min(eps, 1.0)) * (1.0 + YAMARTINO * eps ** 3))
+
+
+class Welford(object):
+    """Running mean and (population) variance, add and remove in O(1)."""
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def remove(self, x):
+        if self.n <= 1:
+            self.__init__()
+            return
+        d = x - self.mean
+        self.n -= 1
+        self.mean -= d / self.n
+        self.m2 = max(self.m2 - d * (x - self.mean), 0.0)
+
+    def var(self):
+        return self.m2 / self.n if self.n else NAN
+
+    def std(self):
+        return math.sqrt(self.var()) if self.n else NAN
+
+
+class WindStats(object):
+    """
+    Accumulator of one window. add() samples, remove() the oldest ones (sliding),
+    result() at any time. Samples with nan u/v only count in the channels.
+    names: extra scalar channels (pressure, temperature, humidity), Welford mean and std.
+    """
+    def __init__(self, names=(), gust_n=GUST_SECONDS):
+        self.names = tuple(names)
+        self.gust_n = gust_n
+        self.n = 0
+        self.su = 0.0
+        self.sv = 0.0
+        self.speed = Welford()
+        self.nd = 0  # samples with a direction (speed > 0)
+        self.ssin = 0.0  # unit vector sums, for sigma theta
+        self.scos = 0.0
+        self.channels = [Welford() for x in self.names]
+        # gust: running mean over gust_n consecutive wind samples, max kept in a monotonic deque
+        self.index = 0  # wind samples added
+        self.first = 0  # index of the oldest wind sample in the window
+        self.recent = collections.deque(maxlen=gust_n)
+        self.gusts = collections.deque()  # (index of the last sample of the run, run mean), decreasing
+
+    def _wind(self, u, v, sign):
+        s = derive.wind_speed_scalar(u, v)
+        self.n += sign
+        self.su += sign * u
+        self.sv += sign * v
+        if sign > 0:
+            self.speed.add(s)
+        else:
+            self.speed.remove(s)
+        if s > 0:
+            self.nd += sign
+            # unit vector of the direction, in the same frame as u, v
+            self.ssin += sign * u / s
+            self.scos += sign * v / s
+        return s
+
+    def add(self, u, v, extra=()):
+        if u == u and v == v:
+            s = self._wind(u, v, 1)
+            self.recent.append(s)
+            i = self.index
+            self.index += 1
+            if len(self.recent) == self.gust_n and i - self.gust_n + 1 >= self.first:
+                g = sum(self.recent) / self.gust_n
+                while self.gusts and self.gusts[-1][1] <= g:
+                    self.gusts.pop()
+                self.gusts.append((i, g))
+        for w, x in zip(self.channels, extra):
+            if x == x:
+                w.add(x)
+
+    def remove(self, u, v, extra=()):
+        if u == u and v == v:
+            self._wind(u, v, -1)
+            self.first += 1
+            while self.gusts and self.gusts[0][0] - self.gust_n + 1 < self.first:
+                self.gusts.popleft()
+        for w, x in zip(self.channels, extra):
+            if x == x:
+                w.remove(x)
+
+    def result(self):
+        x = dict.fromkeys(KEYS, NAN)
+        x["n"] = self.n
+        if self.n:
+            mu, mv = self.su / self.n, self.sv / self.n
+            speed = self.speed.mean
+            x["mean_u"], x["mean_v"] = mu, mv
+            x["speed"] = speed
+            x["speed_std"] = self.speed.std()
+            x["vector_speed"] = math.hypot(mu, mv)
+            if x["vector_speed"] > 0:
+                x["direction"] = derive.wind_uv_to_dir_scalar(mu, mv)
+            if speed > 0:
+                x["steadiness"] = x["vector_speed"] / speed
+                x["turbulence_intensity"] = x["speed_std"] / speed
+            if self.nd:
+                x["sigma_theta"] = sigma_theta(self.ssin / self.nd, self.scos / self.nd)
+            if self.gusts:
+                x["gust"] = self.gusts[0][1]
+                if speed > 0:
+                    x["gust_factor"] = x["gust"] / speed
+        for name, w in zip(self.names, self.channels):
+            x[name + "_mean"] = w.mean if w.n else NAN
+            x[name + "_std"] = w.std()
+        return x
+
+
+class Sliding(object):
+    """Statistics of the samples in (t - seconds, t], t: epoch of the newest sample."""
+    def __init__(self, seconds, rate=1.0, names=()):
+        self.seconds = seconds
+        self.names = tuple(names)
+        self.gust_n = gust_samples(rate)
+        self.samples = collections.deque()  # (epoch, u, v, extra)
+        self.stats = WindStats(self.names, self.gust_n)
+        self.removed = 0
+
+    def add(self, epoch, u, v, extra=()):
+        self.samples.append((epoch, u, v, extra))
+        self.stats.add(u, v, extra)
+        while self.samples[0][0] <= epoch - self.seconds:
+            e, u0, v0, x0 = self.samples.popleft()
+            self.stats.remove(u0, v0, x0)
+            self.removed += 1
+        if self.removed >= RESYNC:
+            self.resync()
+
+    def resync(self):
+        # amortized O(1): once every RESYNC removals
+        self.stats = WindStats(self.names, self.gust_n)
+        for e, u, v, x in self.samples:
+            self.stats.add(u, v, x)
+        self.removed = 0
+
+    def result(self):
+        x = self.stats.result()
+        x["start"] = self.samples[0][0] if self.samples else NAN
+        x["end"] = self.samples[-1][0] if self.samples else NAN
+        return x
+
+
+class Tumbling(object):
+    """
+    Fixed windows aligned to the clock (period 600: 14:00, 14:10, ...).
+    add() returns the result of the window that just ended, else None.
+    """
+    def __init__(self, period, rate=1.0, names=()):
+        self.period = period
+        self.names = tuple(names)
+        self.gust_n = gust_samples(rate)
+        self.window = None
+        self.stats = None
+
+    def add(self, epoch, u, v, extra=()):
+        w = int(epoch // self.period)
+        done = None
+        if w != self.window:
+            done = self.flush()
+            self.window = w
+            self.stats = WindStats(self.names, self.gust_n)
+        self.stats.add(u, v, extra)
+        return done
+
+    def flush(self):
+        """Result of the current window (call at the end of the data), None if empty."""
+        if self.stats is None:
+            return None
+        x = self.stats.result()
+        x["start"] = self.window * self.period
+        x["end"] = (self.window + 1) * self.period
+        self.stats = None
+        self.window = None
+        return x
+
+
+def batch(u, v, extra=None, names=(), rate=1.0):
+    """
+    numpy reference: the statistics of all samples at once, same keys as WindStats.result().
+    extra: 2D array, one column per name.
+    """
+    u = np.asarray(u, dtype=float)
+    v = np.asarray(v, dtype=float)
+    ok = np.isfinite(u) & np.isfinite(v)
+    u, v = u[ok], v[ok]
+    n = len(u)
+    x = dict.fromkeys(KEYS, NAN)
+    x["n"] = n
+    if n:
+        s = derive.wind_speed(u, v)
+        mu, mv = u.mean(), v.mean()
+        speed = s.mean()
+        x["mean_u"], x["mean_v"] = float(mu), float(mv)
+        x["speed"] = float(speed)
+        x["speed_std"] = float(s.std())
+        x["vector_speed"] = float(np.hypot(mu, mv))
+        if x["vector_speed"] > 0:
+            x["direction"] = float(derive.wind_uv_to_dir(mu, mv))
+        if speed > 0:
+            x["steadiness"] = x["vector_speed"] / speed
+            x["turbulence_intensity"] = x["speed_std"] / speed
+        d = s > 0
+        if d.any():
+            x["sigma_theta"] = sigma_theta(float(np.mean(u[d] / s[d])), float(np.mean(v[d] / s[d])))
+        k = gust_samples(rate)
+        if n >= k:
+            run = np.convolve(s, np.ones(k) / k, mode="valid")
+            x["gust"] = float(run.max())
+            if speed > 0:
+                x["gust_factor"] = x["gust"] / speed
+    for i, name in enumerate(names):
+        c = np.asarray(extra, dtype=float)[:, i]
+        c = c[np.isfinite(c)]
+        x[name + "_mean"] = float(c.mean()) if len(c) else NAN
+        x[name + "_std"] = float(c.std()) if len(c) else NAN
+    return x
+
+
+def batch_dir(direction, speed, extra=None, names=(), rate=1.0):
+    """batch() for direction (deg) and speed input."""
+    u, v = derive.dir_to_uv(np.asarray(direction, dtype=float), np.asarray(speed, dtype=float))
+    return batch(u, v, extra, names, rate)
+
+
+# offline: hour csv columns
+GMX500_NAMES = ("pressure", "humidity", "temperature")
+
+
+def read_hour(path):
+    """(epoch, u, v, extra, names, rate) of an hour csv, GMX500 or WindSonic."""
+    with open(path, errors="replace") as f:
+        header = f.readline()
+        gmx500 = header.startswith("epoch_time,local_clock_time,velocity_u")
+        rows = []
+        for line in f:
+            y = line.split(",")
+            try:
+                if gmx500:
+                    # Corrected_Direction, Corrected_Speed, Pressure, Humidity, Temperature
+                    rows.append((float(y[0]),) + derive.dir_to_uv_scalar(float(y[6]), float(y[7])) +
+                                (float(y[8]), float(y[9]), float(y[10])))
+                else:
+                    rows.append((float(y[0]), float(y[2]), float(y[3])))
+            except (ValueError, IndexError):
+                continue
+    a = np.array(rows, dtype=float).reshape(-1, 6 if gmx500 else 3)
+    if gmx500:
+        return a[:, 0], a[:, 1], a[:, 2], a[:, 3:], GMX500_NAMES, 1.0
+    return a[:, 0], a[:, 1], a[:, 2], np.empty((len(a), 0)), (), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wind statistics of hour files in fixed windows")
+    parser.add_argument("paths", nargs="+", help="hour csv files")
+    parser.add_argument("--period", type=float, default=600, help="s, window length")
+    parser.add_argument("--rate", type=float, default=4.0, help="Hz, WindSonic data rate (GMX500: 1 Hz)")
+    parser.add_argument("--check", action="store_true", help="compare with the batch reference")
+    args = parser.parse_args()
+
+    cols = ["speed", "vector_speed", "direction", "steadiness", "sigma_theta", "turbulence_intensity",
+            "gust", "gust_factor"]
+    print("%-19s %6s " % ("start", "n") + " ".join("%9s" % c[:9] for c in cols))
+    worst = 0.0
+    for path in args.paths:
+        epoch, u, v, extra, names, rate = read_hour(path)
+        rate = rate or args.rate
+        w = Tumbling(args.period, rate, names)
+        results = []
+        for i in range(len(epoch)):
+            x = w.add(epoch[i], u[i], v[i], tuple(extra[i]))
+            if x is not None:
+                results.append(x)
+        x = w.flush()
+        if x is not None:
+            results.append(x)
+
+        for x in results:
+            print("%-19s %6s " % (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(x["start"])), x["n"]) +
+                  " ".join("%9.3f" % x[c] for c in cols))
+            if args.check:
+                sel = (epoch >= x["start"]) & (epoch < x["end"])
+                ref = batch(u[sel], v[sel], extra[sel], names, rate)
+                for k, a in ref.items():
+                    b = x[k]
+                    if a == a or b == b:
+                        worst = max(worst, abs(a - b) / max(abs(a), 1.0))
+    if args.check:
+        print("largest relative difference to the batch reference: %.3g" % worst)
+
+
+if __name__ == "__main__":
+    main()